@@ -8,6 +8,11 @@ import flask
 from flask import request
 # pylint: disable=W0611, E0401
 from polybot.bot import Bot, QuoteBot, ImageProcessingBot
+from polybot.caption_parser import CaptionParser
+from polybot.config import UpdateQueueConfig
+from polybot.metrics import REGISTRY, Metrics
+from polybot.tracing import configure_logging
+from polybot.update_queue import UpdateQueue
 # pylint: enable=W0611, E0401
 
 # Init Flask app
@@ -29,25 +34,68 @@ def index():
     return 'Ok'
 
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    """
+    The state of the message queue, the image processing jobs, the result cache
+    and the cache of parsed captions
+    :return: The stats as JSON
+    """
+
+    return flask.jsonify({
+        'updates': updates.stats(),
+        'jobs': bot.jobs.stats(),
+        'results': bot.results.stats(),
+        'captions': CaptionParser.cache_info()._asdict(),
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    The metrics of the app, for Prometheus to scrape
+    :return: The metrics in the Prometheus text format
+    """
+
+    Metrics.QUEUE_DEPTH.set(updates.queue.qsize(), queue='updates')
+    return flask.Response(REGISTRY.render(), content_type=Metrics.CONTENT_TYPE)
+
+
 @app.route(f'/{TELEGRAM_TOKEN}/', methods=['POST'])
 def webhook():
     """
-    The webhook. Calling the bot to handle each message
+    The webhook. Queueing each message for the bot to handle,
+    and acknowledging it without waiting for the handling
     :return: 'Ok' as a string when done
     """
 
     # Convert request to JSON
-    req = request.get_json()
-    # Call the bot to handle the message
-    bot.handle_message(req['message'])
+    req = request.get_json(silent=True)
+
+    # Queue the message. Updates that are not new messages
+    # (e.g. edited messages) are acknowledged and ignored
+    if isinstance(req, dict) and isinstance(req.get('message'), dict):
+        updates.put(req['message'])
+    else:
+        Metrics.UPDATES.inc(result='ignored')
 
     return 'Ok'
 
 
 # If run as main file, run the app
 if __name__ == "__main__":
+    # Write the log from a background thread, so it never blocks handling the messages
+    configure_logging()
+
     # Run the bot
     bot = ImageProcessingBot(TELEGRAM_TOKEN, TELEGRAM_APP_URL)
+    # Queue the messages to the bot
+    updates = UpdateQueue(
+        bot.handle_message,
+        bot.reply_busy,
+        UpdateQueueConfig.MAX_SIZE,
+        UpdateQueueConfig.WORKERS
+    )
 
     # Run the app
     app.run(host='0.0.0.0', port=8443)
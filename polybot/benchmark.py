@@ -0,0 +1,279 @@
+"""
+Benchmark of the effects, on synthetic images of different sizes.
+Records the time, peak memory and pixels per second of each effect
+into a JSON results file, and compares them with a baseline results file.
+
+Run from the root of the repo (no Telegram access is needed):
+    python -m polybot.benchmark --output results.json
+    python -m polybot.benchmark --baseline results.json --tolerance 0.2
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+# pylint: disable=E0401
+from polybot.caption_parser import EffectCommand
+from polybot.effect_pipeline import EffectPipeline
+from polybot.effect_rules import EffectRules
+from polybot.img_codec import EncodeOptions
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+
+# Image sizes to benchmark, as (width, height)
+DEFAULT_SIZES = [(256, 256), (1024, 768), (2048, 1536)]
+
+# Argument values to sweep for each effect, as the parsed arguments of a caption.
+# Effects that are not here run once, with their default arguments
+ARG_SWEEPS = {
+    'blur': [[2], [8], [32]],
+    'gaussian_blur': [[2], [8], [32]],
+    'rotate': [[90], [180]],
+    'flip': [['horizontal'], ['vertical']],
+    'salt_n_pepper': [[0.05, (255, 255, 255), (0, 0, 0), 1],
+                      [0.5, (255, 255, 255), (0, 0, 0), 1]],
+    'color_noise': [[0.05, 1], [0.5, 1]],
+    'segment': [[100]],
+    'concat': [['horizontal'], ['vertical']],
+    'rgb_posterize': [[100]],
+    'collage': [['horizontal'], ['grid']],
+}
+
+# The amount of images for multi-image effects that can take any amount
+MANY_IMAGES = 4
+
+# Stages of handling a photo that are benchmarked with the effects
+STAGES = ('decode', 'encode')
+
+
+def synthetic_image(width: int, height: int):
+    """
+    Create an image with smooth gradients and some noise,
+    to resemble a photo for the effects and the encoder
+
+    :param width: Required. The width of the image.
+    :param height: Required. The height of the image.
+    :return: numpy array of shape (height, width, 3) and dtype uint8
+    """
+
+    rows = np.linspace(0, 255, height)[:, np.newaxis]
+    cols = np.linspace(0, 255, width)[np.newaxis, :]
+    noise = np.random.default_rng(0).integers(0, 32, (height, width, 3))
+
+    data = np.empty((height, width, 3), dtype=np.int64)
+    data[:, :, 0] = rows
+    data[:, :, 1] = cols
+    data[:, :, 2] = (rows + cols) / 2
+    return np.clip(data + noise, 0, 255).astype(np.uint8)
+
+
+def effect_cases(effect: str, width: int, height: int):
+    """
+    List the argument lists to benchmark an effect with, on an image size
+
+    :param effect: Required. The name of the effect.
+    :param width: Required. The width of the image.
+    :param height: Required. The height of the image.
+    :return: List of argument lists
+    """
+
+    # Growing the canvas pads the image, and shrinking it crops the image
+    if effect == 'canvas_resize':
+        return [[width + 200, height + 200], [width // 2, height // 2]]
+
+    return ARG_SWEEPS.get(effect, [[]])
+
+
+def effect_runner(effect: str, args: list, data):
+    """
+    Create a function that runs an effect on a fresh copy of the image.
+    Lazy effects (views and pending canvases) are timed until
+    the pixel matrix is materialized, as the encoder needs it.
+
+    :param effect: Required. The name of the effect, or one of STAGES.
+    :param args: Required. The arguments of the effect, as in a caption.
+    :param data: Required. The pixel matrix of the image.
+    :return: Function with no arguments
+    """
+
+    if effect == 'decode':
+        encoded = Img(None, data=data).encode(EncodeOptions())
+        return lambda: Img(encoded)
+
+    if effect == 'encode':
+        options = EncodeOptions.for_size(data.shape[1], data.shape[0])
+        return lambda: Img(None, data=data).encode(options)
+
+    parser = EffectRules[effect]
+    command = EffectCommand(effect, args, parser.multi, parser.max_images)
+    plan = [EffectPipeline.to_step(command)]
+    image_count = (parser.max_images or MANY_IMAGES) if parser.multi else 1
+
+    def run():
+        imgs = [Img(None, data=data) for _ in range(image_count)]
+        EffectPipeline.run(plan, imgs)
+        return imgs[0].data
+
+    return run
+
+
+def measure(func, repeat: int):
+    """
+    Measure the best time of a function, and its peak memory
+
+    :param func: Required. Function with no arguments.
+    :param repeat: Required. The amount of timed runs.
+    :return: Tuple of the best time in seconds, and the peak memory in bytes
+    """
+
+    # Trace the memory in a separate run, so the tracing does not slow the timed runs.
+    # It also warms up the caches for the timed runs
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best, peak
+
+
+def run_benchmark(sizes: list, effects: list = None, repeat: int = 3):
+    """
+    Benchmark the effects on all the sizes
+
+    :param sizes: Required. List of (width, height) image sizes.
+    :param effects: Optional. The names of the effects and stages to benchmark.
+           Default is None, for all the effects in EffectRules and all STAGES.
+    :param repeat: Optional. The amount of timed runs of each case. Default is 3.
+    :return: List of result dicts
+    """
+
+    effects = effects or [*EffectRules, *STAGES]
+
+    results = []
+    for width, height in sizes:
+        data = synthetic_image(width, height)
+        for effect in effects:
+            cases = [[]] if effect in STAGES else effect_cases(effect, width, height)
+            for args in cases:
+                seconds, peak = measure(effect_runner(effect, args, data), repeat)
+                result = {
+                    'effect': effect,
+                    'args': ' '.join(map(str, args)),
+                    'width': width,
+                    'height': height,
+                    'seconds': seconds,
+                    'peak_memory': peak,
+                    'pixels_per_second': width * height / seconds if seconds else None,
+                }
+                results.append(result)
+                print(f'{effect:>14} {result["args"]:<24} {width:>5}x{height:<5} '
+                      f'{seconds * 1000:9.2f} ms {peak / 2 ** 20:8.1f} MiB')
+
+    return results
+
+
+def case_key(result: dict):
+    """
+    :param result: Required. A result dict.
+    :return: The identity of the benchmarked case of the result
+    """
+
+    return result['effect'], result['args'], result['width'], result['height']
+
+
+def compare(results: list, baseline: list, tolerance: float):
+    """
+    Find the cases that got slower than their baseline by more than the tolerance
+
+    :param results: Required. List of result dicts.
+    :param baseline: Required. List of baseline result dicts.
+    :param tolerance: Required. The allowed slowdown, e.g. 0.2 for 20% slower.
+    :return: List of (result, baseline result) of the regressed cases
+    """
+
+    baseline_by_case = {case_key(result): result for result in baseline}
+
+    regressions = []
+    for result in results:
+        base = baseline_by_case.get(case_key(result))
+        if base and result['seconds'] > base['seconds'] * (1 + tolerance):
+            regressions.append((result, base))
+
+    return regressions
+
+
+def parse_size(text: str):
+    """
+    :param text: Required. Image size as 'WIDTHxHEIGHT'.
+    :return: Tuple of (width, height)
+    """
+
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv: list = None):
+    """
+    Run the benchmark from the command line
+
+    :param argv: Optional. The command line arguments. Default is None, for sys.argv.
+    :return: The exit status: 1 if any case regressed, or 0 if not
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark the effects of the bot')
+    parser.add_argument('--sizes', type=lambda text: list(map(parse_size, text.split(','))),
+                        default=DEFAULT_SIZES, help='Image sizes, e.g. 256x256,1024x768')
+    parser.add_argument('--effects', type=lambda text: text.split(','), default=None,
+                        help='Effects to benchmark, e.g. blur,contour,encode. Default is all')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs of each case')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='The JSON file to write the results to')
+    parser.add_argument('--baseline', default=None,
+                        help='A results file to compare the results with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='The allowed slowdown from the baseline, e.g. 0.25 for 25%%')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.effects or []) - set(EffectRules) - set(STAGES)
+    if unknown:
+        parser.error(f'Unknown effects: {", ".join(sorted(unknown))}')
+
+    results = run_benchmark(args.sizes, args.effects, args.repeat)
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump({
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'results': results,
+        }, output_file, indent=2)
+    print(f'Results written to {args.output}')
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)['results']
+
+    regressions = compare(results, baseline, args.tolerance)
+    for result, base in regressions:
+        print(f'Regression: {result["effect"]} {result["args"]} '
+              f'{result["width"]}x{result["height"]}: {base["seconds"] * 1000:.2f} ms -> '
+              f'{result["seconds"] * 1000:.2f} ms')
+    print(f'{len(regressions)} regressions (tolerance {args.tolerance:.0%})')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
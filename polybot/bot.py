@@ -3,6 +3,7 @@ Telegram Bot
 """
 
 # pylint: disable=E0401
+import io
 import re
 import os
 import time
@@ -13,8 +14,17 @@ import telebot
 from loguru import logger
 from telebot.types import InputFile
 from polybot.caption_parser import CaptionParser, EffectCommand
-from polybot.error import NoCaptionError, CommandError
-from polybot.img_proc import Img
+from polybot.config import (DebugConfig, JobConfig, MediaGroupConfig, MessageCacheConfig,
+                            PreviewConfig, ResultCacheConfig)
+from polybot.error import JobFailedError, JobTimeoutError
+from polybot.expiring_cache import ExpiringCache
+from polybot.job_runner import JobRunner
+from polybot.media_group import MediaGroupAggregator
+from polybot import tracing
+from polybot.metrics import REGISTRY, Metrics
+from polybot.photo_size import PhotoSizeSelector
+from polybot.preview import RunTimeEstimator
+from polybot.result_cache import ResultCache
 from polybot.response_types import DocumentTypes, ErrorTypes, Photo, Text, Help
 # pylint: enable=E0401
 
@@ -105,6 +115,22 @@ class Bot:
 
         return file_info.file_path
 
+    def fetch_user_photo(self, msg, photo_size = None):
+        """
+        Downloads the photo that sent to the Bot into memory
+
+        :param msg: Required. The message with the photo.
+        :param photo_size: Optional. The size of the photo to download, as one of msg['photo'].
+               Default is None (the largest size).
+        :return: The content of the photo file as bytes
+        """
+        if not self.is_current_msg_photo(msg):
+            raise RuntimeError('Message content of type \'photo\' expected')
+
+        photo_size = photo_size or msg['photo'][-1]
+        file_info = self.telegram_bot_client.get_file(photo_size['file_id'])
+        return self.telegram_bot_client.download_file(file_info.file_path)
+
     # pylint: disable=R0913
     def send_photo(
             self, chat_id, img_path,
@@ -114,18 +140,23 @@ class Bot:
         Sends an image back to the Telegram user
 
         :param chat_id: Required. The chat to send the image to. Usually msg['chat]['id'].
-        :param img_path: Required. The path to the image file.
+        :param img_path: Required. The path to the image file, or the encoded image as bytes.
         :param caption: Optional: The caption to send with the image. Default is None (no caption).
         :param quoted_msg_id: Optional: To send as reply, insert the message ID to reply to.
                Usually msg['message_id']. Default is None (not as reply, but a regular message).
         :param parse_mode: Optional: Can be None for regular text, 'MarkdownV2' or 'HTML'.
                For more info go to: https://core.telegram.org/bots/api. Default is None
         """
-        if not os.path.exists(img_path):
+        if isinstance(img_path, bytes):
+            photo = InputFile(io.BytesIO(img_path))
+        elif not os.path.exists(img_path):
             raise RuntimeError("Image path doesn't exist")
+        else:
+            photo = InputFile(img_path)
+
         self.telegram_bot_client.send_photo(
             chat_id,
-            InputFile(img_path),
+            photo,
             caption,
             parse_mode,
             reply_to_message_id = quoted_msg_id
@@ -174,7 +205,28 @@ class ImageProcessingBot(Bot):
 
     def __init__(self, token, telegram_chat_url):
         super().__init__(token, telegram_chat_url)
-        self.cache = {}
+        # The last captioned multi-image message of each user, by the user ID
+        self.cache = ExpiringCache(ImageProcessingBot.TIMEOUT, MessageCacheConfig.MAX_SIZE)
+        # Collects the photos of media groups for multi-image effects
+        self.media_groups = MediaGroupAggregator(
+            self.__fetch_photo,
+            self.__handle_media_group,
+            MediaGroupConfig.IDLE_TIMEOUT,
+            MediaGroupConfig.MAX_SIZE,
+            MediaGroupConfig.DOWNLOAD_WORKERS
+        )
+        # Processes the images in worker processes
+        self.jobs = JobRunner(JobConfig.WORKERS, JobConfig.QUEUE_DEPTH, JobConfig.TIMEOUT)
+        # Caches the results by the photos and the effects that produced them
+        self.results = ResultCache(
+            ResultCacheConfig.MEMORY_BYTES,
+            ResultCacheConfig.DISK_DIR,
+            ResultCacheConfig.DISK_BYTES
+        )
+        # Estimates the time of processing, to decide on sending previews
+        self.estimator = RunTimeEstimator()
+        # Report the sizes of the caches and queues with the metrics
+        REGISTRY.add_collector(self.__collect_metrics)
 
     def handle_message(self, msg):
         """
@@ -182,16 +234,38 @@ class ImageProcessingBot(Bot):
         :param msg: Required. The incoming message.
         """
 
-        # Log incoming message
-        logger.info(f'Incoming message: {msg}')
+        # Log incoming message. The message is formatted only if debug messages are logged
+        logger.opt(lazy=True).debug('Incoming message: {}', lambda: msg)
 
-        # Checks if this message is already handled
-        if (msg['from']['id'] in self.cache
-                and msg['message_id'] <= self.cache[msg['from']['id']]['message_id']):
-            return
+        # Trace the stages of handling the message
+        with tracing.trace(chat_id=msg['chat']['id'], message_id=msg['message_id']):
+            self.__handle_message(msg)
+
+    def reply_busy(self, msg):
+        """
+        Reply to a message that cannot be handled now, because the bot has too much work
+        :param msg: Required. The incoming message.
+        """
+
+        logger.info(f'Rejected message {msg.get("message_id")} of chat {msg["chat"]["id"]}')
+        Metrics.ERRORS.inc(error_type=ErrorTypes.BUSY)
+        self.__reply_text(msg, ErrorTypes.BUSY, category='photo')
+
+    def __handle_message(self, msg):
+        """
+        Handle an incoming message by its type
+        :param msg: Required. The incoming message.
+        """
 
         # Clean old messages from the cache
-        self.__clean_cache(msg['date'], ImageProcessingBot.TIMEOUT)
+        self.cache.expire(msg['date'])
+
+        # Checks if this message is already handled. The messages of media groups
+        # may arrive in any order, and are checked by the media group aggregator
+        cached_msg = self.cache.get(msg['from']['id'], msg['date'])
+        if (cached_msg and 'media_group_id' not in msg
+                and msg['message_id'] <= cached_msg['message_id']):
+            return
 
         # Separate logic between text messages and photo messages
         if self.is_current_msg_photo(msg):
@@ -206,6 +280,53 @@ class ImageProcessingBot(Bot):
                 # If msg not a help message, check and handle if it's other text message
                 self.__handle_text_message(msg)
 
+    def __collect_metrics(self):
+        """
+        Set the gauges of the sizes of the caches and queues, before the metrics are rendered
+        """
+
+        results = self.results.stats()
+        Metrics.CACHE_ENTRIES.set(len(self.cache), cache='messages')
+        Metrics.CACHE_ENTRIES.set(CaptionParser.cache_info().currsize, cache='captions')
+        Metrics.CACHE_ENTRIES.set(len(self.media_groups.groups), cache='media_groups')
+        Metrics.CACHE_ENTRIES.set(results['memory_entries'], cache='results_memory')
+        Metrics.CACHE_ENTRIES.set(results['disk_entries'], cache='results_disk')
+        Metrics.CACHE_BYTES.set(results['memory_size'], cache='results_memory')
+        Metrics.CACHE_BYTES.set(results['disk_size'], cache='results_disk')
+        Metrics.QUEUE_DEPTH.set(self.jobs.pending, queue='jobs')
+
+    @staticmethod
+    def __select_photo_size(msg, pipeline = None):
+        """
+        Select the size of the photo of a message to download, and keep it with the message
+
+        :param msg: Required. The message with the photo.
+        :param pipeline: Optional. The EffectPipeline to process the photo with.
+               Default is None (select by the policy only).
+        :return: The selected size, as one of msg['photo']
+        """
+
+        if 'photo_size' not in msg:
+            msg['photo_size'] = PhotoSizeSelector.select(msg['photo'], pipeline)
+        return msg['photo_size']
+
+    def __fetch_photo(self, msg):
+        """
+        Download the selected size of the photo of a message into memory, and time the download
+
+        :param msg: Required. The message with the photo.
+        :return: The content of the photo file as bytes
+        """
+
+        photo_size = self.__select_photo_size(msg)
+        with tracing.span('download') as timed:
+            photo = self.fetch_user_photo(msg, photo_size)
+        Metrics.STAGE_SECONDS.observe(timed.duration, stage='download')
+        # Photos of media groups are downloaded in other threads, so their
+        # download time is kept with the message, for the trace of the group
+        msg['download_time'] = timed.duration
+        return photo
+
     def __parse_response(
             self, response_type,
             args = (), category = 'photo',
@@ -222,6 +343,8 @@ class ImageProcessingBot(Bot):
         """
 
         if args:
+            # Copy the args, since the errors of cached caption plans are shared
+            args = list(args)
             # Stringify args and handle special characters in Telegram's MarkdownV2
             if parse_mode == Bot.ParseMode.MARKDOWN.value:
                 for i, arg in enumerate(args):
@@ -276,8 +399,11 @@ class ImageProcessingBot(Bot):
         :param text: Optional. Text as a reply instead of using the reply system.
         """
 
+        tracing.annotate(error=error_type or 'invalid-caption')
+
         # If not using 'text' argument, parse the response with reply system
         if not text:
+            Metrics.ERRORS.inc(error_type=error_type)
             text = self.__parse_response(error_type, error_args)
         else:
             # If using 'text', parse it to match 'MarkdownV2'
@@ -293,22 +419,26 @@ class ImageProcessingBot(Bot):
             parse_mode=Bot.ParseMode.MARKDOWN.value)
     # pylint: enable=R0913
 
-    def __reply_photo(self, msg, photo_path):
+    def __reply_photo(self, msg, photo, response_type = Photo.SEND):
         """
-        Reply an image
+        Reply an encoded image
 
         :param msg: Required. The original message from the user.
-        :param photo_path: Required. The path to the image file.
+        :param photo: Required. The encoded image as bytes, or the path of its file.
+        :param response_type: Optional. The response type of the caption of the image.
+               Default is Photo.SEND.
         """
 
         # Send the replied image
-        self.send_photo(
-            msg['chat']['id'],
-            photo_path,
-            self.__parse_response(Photo.SEND),
-            msg['message_id'],
-            parse_mode = self.ParseMode.MARKDOWN.value
-        )
+        with tracing.span('upload') as timed:
+            self.send_photo(
+                msg['chat']['id'],
+                photo,
+                self.__parse_response(response_type),
+                msg['message_id'],
+                parse_mode = self.ParseMode.MARKDOWN.value
+            )
+        Metrics.STAGE_SECONDS.observe(timed.duration, stage='upload')
 
     def __reply_help(self, msg):
         """
@@ -348,21 +478,6 @@ class ImageProcessingBot(Bot):
 
         return True
 
-    def __clean_cache(self, curr_time, timeout):
-        """
-        Delete all older than 'timeout' messages in the cache
-
-        :param curr_time: Current time: Unix time as integer
-        :param timeout: Timeout to delete old messages: positive integer in seconds
-        """
-
-        # Iterate over all cashed messages
-        for user_id, msg in self.cache.items():
-            # If a message is older than 'timeout'
-            if curr_time - msg["date"] > timeout:
-                # Delete the message from cache
-                del self.cache[user_id]
-
     def __handle_text_message(self, msg):
         """
         Check if the given message is a 'text' message,
@@ -389,124 +504,167 @@ class ImageProcessingBot(Bot):
 
         # Does the message have a caption (where the commands are)
         if 'caption' in msg:
-            # parse the commands
-            commands = CaptionParser.parse(msg['caption'].lower())
+            # parse and validate the commands, or fetch the plan of the caption if cached
+            with tracing.span('parse'):
+                plan = CaptionParser.compile(msg['caption'])
 
             # If no commands are found in the caption,
             # it is considered to have no caption
-            if len(commands) == 0 or isinstance(commands[0], NoCaptionError):
+            if plan.empty:
                 # Reply with no caption error
                 self.__reply_error(msg, ErrorTypes.NO_CAPTION)
                 return
 
-            # Handle errors in the commands.
-            if self.__handle_command_errors(msg, commands):
+            # Handle the errors of the plan, that were found while parsing
+            with tracing.span('validate'):
+                error_found = self.__handle_plan_errors(msg, plan)
+            if error_found:
                 # If any error found, stop the photo handling process
                 return
 
-            # Fetch all multi-image commands
-            multies = []
-            for command in commands:
-                if command.multi:
-                    multies.append(command.command_name)
-
-            # Check and handle the multi-image command amount
-            if self.__handle_multies_errors(msg, multies):
-                # If found and handle multi-image error,
-                # stop the photo handling process
+            # If this message is a part of a multi-image command,
+            # cache the message, and add it to its media group,
+            # to process it with the rest of the images in the group
+            if len(plan.multies) == 1 and 'media_group_id' in msg:
+                msg['plan'] = plan
+                self.cache.set(msg['from']['id'], msg, msg['date'])
+                max_images = plan.multi_command.max_images
+                self.media_groups.add(msg, max_images or MediaGroupConfig.MAX_SIZE)
                 return
 
-            # Check and handle the arg errors
-            if self.__handle_args_errors(msg, commands):
-                # Stop the photo handling process if arg errors found
-                return
+            # The commands are already optimized into a plan
+            pipeline = plan.pipeline
 
-            # If this message is a part of a multi-image command,
-            # cache the message, and wait for the next image,
-            # to process them both
-            if len(multies) == 1 and 'media_group_id' in msg:
-                msg['commands'] = commands
-                self.cache[msg['from']['id']] = msg
+            # Select the smallest size of the photo that is adequate for the plan
+            self.__select_photo_size(msg, pipeline)
+
+            # If this photo was processed the same way before, reply the cached result
+            result_key = self.__result_key(pipeline, [msg])
+            if self.__reply_cached(msg, result_key):
                 return
 
             # Notify the user that the request is accepted and is starting image processing
             self.__reply_text(msg, Photo.PROCESSING, category='photo')
 
-            # Process the image according to the commands in the caption
-            result_path, [source_img] = self.__process_image([msg], commands)
-            # Reply the resulting image
-            self.__reply_photo(msg, result_path)
+            # Process the image according to the commands in the caption,
+            # and reply the resulting image
+            self.__process_image(msg, pipeline, [self.__fetch_photo(msg)], result_key)
 
-            # Delete all related images from storage
-            source_img.delete()
-            source_img.path = result_path
-            source_img.delete()
+        # If the message has no caption, but is a part of a media group,
+        # add it to its group, to be processed with the captioned message of the group
+        elif 'media_group_id' in msg:
+            self.media_groups.add(msg)
 
-        # If message do not have caption
+        # If there is no caption to the message,
+        # reply with a no caption error
         else:
-            # extract user ID for convenience
-            user_id = msg['from']['id']
-            # Verify that the current image is grouped with the previous photo message
-            if (user_id in self.cache
-                    and 'caption' in self.cache[user_id]
-                    and 'media_group_id' in msg
-                    and 'media_group_id' in self.cache[user_id]
-                    and msg['media_group_id'] == self.cache[user_id]['media_group_id']):
-
-                # extract cached message for convenience
-                cached_msg = self.cache[user_id]
-
-                # If the cached message is marked as used, ignore the current message
-                if 'used' in cached_msg:
-                    return
-
-                # If the cached message does not have caption, reply with a no caption error
-                if 'commands' not in self.cache[user_id] or not self.cache[user_id]['commands']:
-                    self.__reply_error(msg, ErrorTypes.NO_CAPTION)
-                    return
-
-                # Notify the user that the request is accepted and is starting image processing
-                self.__reply_text(msg, Photo.PROCESSING, category='photo')
-
-                # Process the image according to the commands in the caption
-                result_path, source_imgs = self.__process_image(
-                    [cached_msg, msg], cached_msg['commands']
-                )
-                # Reply the resulting image
-                self.__reply_photo(msg, result_path)
-                # Delete all related images from storage
-                for img in source_imgs:
-                    img.delete()
-                source_imgs[0].path = result_path
-                source_imgs[0].delete()
-                self.cache[user_id]['used'] = True
-
-            # If there is no cached related message,
-            # and there is no caption to the message,
-            # reply with a no caption error
-            else:
-                self.__reply_error(msg, ErrorTypes.NO_CAPTION)
+            self.__reply_error(msg, ErrorTypes.NO_CAPTION)
     # pylint: enable=E1121, R0911, R0912
 
-    def __handle_command_errors(self, msg, commands):
+    def __handle_plan_errors(self, msg, plan):
+        """
+        Check and handle the errors of a caption, in the order they are replied
+
+        :param msg: Required. The original message from the user.
+        :param plan: Required. The CaptionPlan of the caption.
+        :return: True for error found and handled, or False for no error found
+        """
+
+        # Handle errors in the commands, then the multi-image command amount
+        # (which depends on the message), then the arg errors
+        return (self.__handle_command_errors(msg, plan.command_errors)
+                or self.__handle_multies_errors(msg, plan.multies)
+                or self.__handle_args_errors(msg, plan.arg_errors))
+
+    def __handle_media_group(self, msgs, photos):
+        """
+        Process the images of a media group by the caption of one of its messages,
+        and reply the results. Called by the media group aggregator.
+
+        :param msgs: Required. The list of messages in the group, by the order of arrival.
+        :param photos: Required. The list of the downloaded photos of the messages, as bytes.
+        """
+
+        # The group is handled in a thread of the aggregator, so it is traced on its own
+        with tracing.trace(chat_id=msgs[0]['chat']['id'],
+                           media_group_id=msgs[0].get('media_group_id'),
+                           photos=len(msgs)):
+            for msg in msgs:
+                tracing.add_span('download', msg.get('download_time', 0.0))
+            self.__handle_media_group_photos(msgs, photos)
+
+    def __handle_media_group_photos(self, msgs, photos):
+        """
+        Process the images of a media group, in the trace of the group
+
+        :param msgs: Required. The list of messages in the group, by the order of arrival.
+        :param photos: Required. The list of the downloaded photos of the messages, as bytes.
+        """
+
+        # The captioned message comes first, and the rest by the order they were sent
+        captioned = [i for i, msg in enumerate(msgs) if 'plan' in msg]
+        order = captioned[:1] + sorted(
+            (i for i in range(len(msgs)) if i not in captioned[:1]),
+            key = lambda i: msgs[i]['message_id']
+        )
+
+        # If no message in the group has a caption, reply with a no caption error
+        if not captioned:
+            self.__reply_error(msgs[order[0]], ErrorTypes.NO_CAPTION)
+            return
+
+        cached_msg = msgs[captioned[0]]
+        multi_command = cached_msg['plan'].multi_command
+        # Use only the amount of images the multi-image effect can take
+        used = order[:multi_command.max_images]
+
+        # If the caption is the only image of the group, reply with a no 2nd image error
+        if len(used) < 2:
+            self.__reply_error(cached_msg, ErrorTypes.NO_2ND_IMAGE, [multi_command.command_name])
+            return
+
+        # The commands are already optimized into a plan
+        pipeline = cached_msg['plan'].pipeline
+
+        # The photos were downloaded before the plan was known.
+        # Download again the photos that the plan needs in their full resolution
+        photos = list(photos)
+        if pipeline.needs_full_resolution():
+            for i in used:
+                if msgs[i]['photo_size'] != msgs[i]['photo'][-1]:
+                    msgs[i]['photo_size'] = msgs[i]['photo'][-1]
+                    photos[i] = self.__fetch_photo(msgs[i])
+
+        # If these photos were processed the same way before, reply the cached result
+        result_key = self.__result_key(pipeline, [msgs[i] for i in used])
+        if self.__reply_cached(cached_msg, result_key):
+            return
+
+        # Notify the user that the request is accepted and is starting image processing
+        self.__reply_text(cached_msg, Photo.PROCESSING, category='photo')
+
+        # Process the images according to the commands in the caption,
+        # and reply the resulting image
+        self.__process_image(cached_msg, pipeline, [photos[i] for i in used], result_key)
+
+    def __handle_command_errors(self, msg, command_errors):
         """
         Check and handle command error
 
         :param msg: Required. The original message from the user.
-        :param commands: Required. The list of EffectCommands or CommandErrors,
-               parsed from the message
+        :param command_errors: Required. The CommandErrors of the effects
+               that were not found in the caption
         :return: True for error found and handled, or False for no error found
         """
 
         # Parse errors to error responses
         error_responses = []
-        for command in commands:
-            # If a command is a CommandError (has errors)
-            if isinstance(command, CommandError):
-                # parse the error to a response
-                error_responses.append(
-                    self.__parse_response(command.error_type, command.error_args)
-                )
+        for command in command_errors:
+            Metrics.ERRORS.inc(error_type=command.error_type)
+            # parse the error to a response
+            error_responses.append(
+                self.__parse_response(command.error_type, command.error_args)
+            )
 
         # If got command errors, reply errors to the user
         if len(error_responses) > 0:
@@ -543,36 +701,27 @@ class ImageProcessingBot(Bot):
             if len(multies) > 1:
                 self.__reply_error(msg, ErrorTypes.TOO_MUCH_MULTI_IMAGE, ['\n'.join(multies)])
 
-                # store the msg as used, so the other grouped images will be ignored
-                msg['used'] = True
-                self.cache[msg['from']['id']] = msg
+                # store the msg, and ignore the other grouped images
+                self.cache.set(msg['from']['id'], msg, msg['date'])
+                self.media_groups.discard(msg['media_group_id'])
 
                 return True
 
         # else, no errors found
         return False
 
-    def __handle_args_errors(self, msg, commands):
+    def __handle_args_errors(self, msg, arg_errors):
         """
         Check and handle arg errors
         :param msg: Required. The original message from the user.
-        :param commands: Required. The list of EffectCommands or CommandErrors,
-               parsed from the message
+        :param arg_errors: Required. Tuples of (effect string, CommandErrors)
+               of the commands with wrong arguments in the caption
         :return:  True for error found and handled, or False for no error found.
         """
 
-        # Fetch all arg errors
-        commands_with_errors = []
-        for command in commands:
-            # In each command fetch all arg errors
-            error_args_list = list(filter(
-                lambda arg: isinstance(arg, CommandError),
-                command.arg_list
-            ))
-            # append all arg errors into new list of commands
-            if len(error_args_list) > 0:
-                commands_with_errors.append(EffectCommand(error_args_list[0].error_args[0],
-                                                          error_args_list))
+        # Hold the arg errors of each command as a command
+        commands_with_errors = [EffectCommand(effect_string, errors)
+                                for effect_string, errors in arg_errors]
 
         # If got arg errors
         if len(commands_with_errors) > 0:
@@ -591,6 +740,7 @@ class ImageProcessingBot(Bot):
                     """
 
                     # Parse the response of the argument
+                    Metrics.ERRORS.inc(error_type=arg.error_type)
                     arg_value = arg.error_args[-1]
                     arg_response = self.__parse_response(arg.error_type, arg.error_args)
                     text = f'{arg_value}: {arg_response}'
@@ -620,29 +770,179 @@ class ImageProcessingBot(Bot):
         # else, no errors found
         return False
 
-    def __process_image(self, msgs, commands):
+    def __result_key(self, pipeline, photo_msgs):
+        """
+        Create the key of a result in the result cache
+
+        :param pipeline: Required. The EffectPipeline of the commands in the caption.
+        :param photo_msgs: Required. The list of messages of the input photos, by order.
+        :return: The key, or None if the result should not be cached
+        """
+
+        plan = pipeline.cache_key()
+        photo_ids = [msg.get('photo_size', msg['photo'][-1]).get('file_unique_id')
+                     for msg in photo_msgs]
+        if plan is None or None in photo_ids:
+            return None
+
+        return self.results.key(photo_ids, plan)
+
+    def __reply_cached(self, msg, result_key):
         """
-        Process the image according to the commands
+        Reply a result from the result cache, if found
 
-        :param msgs: Required. The list of messages. Every message with a single photo.
-        :param commands: Required. The list of EffectCommands, parsed from the caption.
-        :return: The path of the resulting image
+        :param msg: Required. The original message from the user.
+        :param result_key: Required. The key of the result, or None if it is not cached.
+        :return: True if the cached result was replied, or False if not found
+        """
+
+        if result_key is None:
+            return False
+
+        with tracing.span('cache_lookup'):
+            cached = self.results.get(result_key)
+        Metrics.RESULT_CACHE_LOOKUPS.inc(result='miss' if cached is None else 'hit')
+        tracing.annotate(cache='miss' if cached is None else 'hit')
+        if cached is None:
+            return False
+
+        logger.info(f'Replying cached result {result_key}')
+        self.__reply_photo(msg, cached[0])
+        return True
+
+    def __submit_preview(self, pipeline, photos, photo_size):
+        """
+        Submit a job of a downscaled preview, if previews are enabled,
+        and the full result is estimated to be slow
+
+        :param pipeline: Required. The EffectPipeline, scaled to the photo size.
+        :param photos: Required. The list of the downloaded photos, as bytes.
+        :param photo_size: Required. The size of the photo the result is drawn on.
+        :return: The Future of the preview job, or None if no preview is needed
+        """
+
+        # The result of plans that need the full resolution cannot be previewed
+        if not PreviewConfig.ENABLED or pipeline.needs_full_resolution():
+            return None
+
+        width, height = photo_size.get('width', 0), photo_size.get('height', 0)
+        if max(width, height) <= PreviewConfig.SIDE:
+            return None
+
+        # With no estimate yet, the result is considered slow
+        estimate = self.estimator.estimate(pipeline, width * height)
+        if estimate is not None and estimate < PreviewConfig.MIN_SECONDS:
+            return None
+
+        logger.info(f'Sending a preview, the result is estimated to take '
+                    f'{"unknown" if estimate is None else f"{estimate:.3f}s"}')
+        preview = pipeline.scaled(PreviewConfig.SIDE / max(width, height))
+        return self.jobs.submit(preview, photos, PreviewConfig.SIDE)
+
+    def __reply_preview(self, msg, preview, future):
+        """
+        Wait for a preview job, and reply its result, unless the full result is already done.
+        Failures of the preview are logged only, as the full result is still on its way.
+
+        :param msg: Required. The original message from the user.
+        :param preview: Required. The Future of the preview job.
+        :param future: Required. The Future of the full job.
+        """
+
+        with tracing.span('preview') as timed:
+            try:
+                result = self.jobs.wait(preview)
+            # pylint: disable=W0718
+            except Exception as error:
+                logger.warning(f'Preview failed: {error!r}')
+                return
+            # pylint: enable=W0718
+
+            if not future.done():
+                self.__reply_photo(msg, result.data, Photo.PREVIEW)
+        Metrics.STAGE_SECONDS.observe(timed.duration, stage='preview')
+
+    def __process_image(self, msg, pipeline, photos, result_key = None):
+        """
+        Process the images by the pipeline in a worker process, and reply the result
+
+        :param msg: Required. The original message from the user.
+        :param pipeline: Required. The EffectPipeline of the commands in the caption.
+        :param photos: Required. The list of the downloaded photos, as bytes.
+               The first one is the image the result is drawn on.
+        :param result_key: Optional. The key to cache the result by.
+               Default is None (not cached).
+        """
+
+        # Scale the plan to the selected size of the photo the result is drawn on
+        photo_size = msg.get('photo_size', msg['photo'][-1])
+        pipeline = pipeline.scaled(PhotoSizeSelector.scale(photo_size, msg['photo']))
+
+        logger.info(f'Effect plan: {pipeline} '
+                    f'(photo size {photo_size.get("width")}x{photo_size.get("height")})')
+        tracing.annotate(plan=str(pipeline),
+                         photo_size=f'{photo_size.get("width")}x{photo_size.get("height")}')
+
+        # Process the images by the plan, and reply a preview first if the result is slow
+        try:
+            with tracing.span('job'):
+                preview = self.__submit_preview(pipeline, photos, photo_size)
+                future = self.jobs.submit(pipeline, photos)
+                if preview:
+                    self.__reply_preview(msg, preview, future)
+                result = self.jobs.wait(future)
+        except (JobTimeoutError, JobFailedError) as error:
+            self.__reply_error(msg, error.error_type)
+            return
+        self.estimator.record(result)
+
+        # The stages of the job ran in a worker process, so they are added by their times
+        for i, decode_time in enumerate(result.decode_times):
+            logger.info(f'Decoded photo {i + 1} ({len(photos[i])} bytes) in {decode_time:.3f}s')
+            Metrics.STAGE_SECONDS.observe(decode_time, stage='decode')
+            tracing.add_span('decode', decode_time)
+        Metrics.STAGE_SECONDS.observe(result.process_time, stage='process')
+        Metrics.STAGE_SECONDS.observe(result.encode_time, stage='encode')
+        for effect, effect_time in result.effect_times.items():
+            Metrics.EFFECT_SECONDS.observe(effect_time, effect=effect)
+            tracing.add_span(f'effect:{effect}', effect_time)
+        tracing.add_span('encode', result.encode_time)
+        logger.info(
+            f'Processed in {result.process_time:.3f}s' + (
+                f' (in strips of {result.strip_height} rows)' if result.strip_height else ''
+            )
+        )
+        logger.info(
+            f'Encoded as {result.options.image_format} (quality {result.options.quality}) '
+            f'in {result.encode_time:.3f}s: {result.encoded_size} bytes'
+        )
+
+        if DebugConfig.FILES_DIR:
+            self.__save_debug_files(msg, photos, result)
+
+        if result_key is not None:
+            self.results.put(result_key, result.data, result.options.suffix)
+
+        # Reply the resulting image
+        self.__reply_photo(msg, result.data)
+
+    @staticmethod
+    def __save_debug_files(msg, photos, result):
+        """
+        Write the photos and the result of a message into the debug files directory
+
+        :param msg: Required. The original message from the user.
+        :param photos: Required. The list of the downloaded photos, as bytes.
+        :param result: Required. The JobResult of the photos.
         """
 
-        # Download all input images. Store and import them as Img instances
-        imgs = list(map(lambda msg: Img(self.download_user_photo(msg)), msgs))
+        os.makedirs(DebugConfig.FILES_DIR, exist_ok = True)
+        name = os.path.join(DebugConfig.FILES_DIR, f'{msg["chat"]["id"]}_{msg["message_id"]}')
 
-        # Image processing
-        # Iterate over all commands
-        for command_data in commands:
-            # extract the method for processing command
-            command = getattr(imgs[0], command_data.command_name)
-            # If the command is a multi-image effect
-            if command_data.multi:
-                # insert the second image, and call the method for processing
-                command(imgs[1], *command_data.arg_list)
-            else:
-                # With single image effects, call for processing without additional image
-                command(*command_data.arg_list)
+        files = [(f'{name}_{i}.jpg', photo) for i, photo in enumerate(photos)]
+        files.append((f'{name}_filtered{result.options.suffix}', result.data))
+        for path, data in files:
+            with open(path, 'wb') as debug_file:
+                debug_file.write(data)
 
-        return imgs[0].save_img(), imgs
+        logger.info(f'Saved debug files {name}_*')
@@ -3,10 +3,15 @@ Parsing caption of a message into commands,
 that can be later be called and executed
 """
 
+import re
+import functools
+from typing import NamedTuple
 # pylint: disable=E0401
-from polybot.error import NoCaptionError, CommandError
+from polybot.config import CaptionConfig
+from polybot.error import CommandError
 from polybot.response_types import ErrorTypes
 from polybot.effect_rules import EffectRules
+from polybot.effect_pipeline import EffectPipeline
 # pylint: enable=E0401
 
 
@@ -15,61 +20,168 @@ class EffectCommand:
     """
     Holds the info of a parsed effect command
     """
-    def __init__(self, command_name: str, arg_list: iter, multi: bool = False):
+    def __init__(self, command_name: str, arg_list: iter, multi: bool = False,
+                 max_images: int = 2):
         self.command_name = command_name
         self.arg_list = arg_list
         self.multi = multi
+        # The maximum amount of images of a multi-image effect, or None for any amount
+        self.max_images = max_images
+# pylint: enable=R0903
+
+
+class CaptionPlan(NamedTuple):
+    """
+    The validated result of parsing a caption.
+    Plans are shared by all the messages with the same caption, so all fields are immutable.
+    """
+
+    # The normalized caption
+    caption: str
+    # The EffectCommands of the caption, by order
+    commands: tuple = ()
+    # The names of the multi-image effects in the caption
+    multies: tuple = ()
+    # CommandErrors of the effects that were not found
+    command_errors: tuple = ()
+    # Tuples of (effect string, CommandErrors) of the commands with wrong arguments
+    arg_errors: tuple = ()
+    # The optimized EffectPipeline of the commands, or None if the caption has errors
+    pipeline: EffectPipeline = None
+
+    @property
+    def empty(self):
+        """
+        :return: True if the caption has no commands
+        """
+
+        return not (self.commands or self.command_errors or self.arg_errors)
+
+    @property
+    def multi_command(self):
+        """
+        :return: The first multi-image EffectCommand, or None if there is none
+        """
+
+        return next((command for command in self.commands if command.multi), None)
 
 
 class CaptionParser:
     """
-    A static class that parse the caption of a message into EffectCommands
+    A static class that parse the caption of a message into a CaptionPlan.
+    The caption is tokenized and validated in a single pass, and the plans
+    of the most recent captions are cached by the normalized caption.
     """
 
+    # An effect name or argument, or a comma that separates commands
+    TOKEN = re.compile(r',|[^\s,]+')
+    # A comma and the spaces around it
+    SEPARATOR = re.compile(r'\s*,\s*')
+
     @staticmethod
-    def parse(caption: str):
+    def normalize(caption: str):
+        """
+        Normalize a caption, so captions that differ only by case or spaces are the same
+
+        :param caption: Required. The given caption as a string.
+        :return: The normalized caption
         """
-        Parse the caption into EffectCommand or CommandError instances
+
+        return CaptionParser.SEPARATOR.sub(', ', ' '.join(caption.lower().split()))
+
+    @staticmethod
+    def compile(caption: str):
+        """
+        Parse and validate a caption, or fetch its plan from the cache
+
         :param caption: Required. The given caption as a string.
-        :return: List of commands as EffectCommands or CommandErrors
+        :return: The CaptionPlan of the caption
         """
-        # Strip spaces from the beginning and the end
-        caption = caption.strip()
-        # If the caption is empty, return no caption error
-        if not caption:
-            return [NoCaptionError]
-        # Split to commands
-        effect_list = caption.split(',')
-
-        # Create the list for the results
+
+        return CaptionParser.compile_normalized(CaptionParser.normalize(caption))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=CaptionConfig.CACHE_SIZE)
+    def compile_normalized(caption: str):
+        """
+        Parse and validate a normalized caption. Results are cached by the caption.
+
+        :param caption: Required. The normalized caption.
+        :return: The CaptionPlan of the caption
+        """
+
         commands = []
-        # Iterate over all commands
-        for effect_string in effect_list:
-            # Strip spaces from the beginning and the end
-            effect_string = effect_string.strip()
-            # Split the arguments of the commands
-            effect_args = effect_string.split(' ')
-            # Extract the effect name as inserted as input
-            effect_name_input = effect_args.pop(0).strip()
+        multies = []
+        command_errors = []
+        arg_errors = []
+
+        def add_command(tokens):
+            """
+            Internal function, to validate the tokens of a command and add it to the results
+
+            :param tokens: Required. The effect name as inserted as input, and its arguments.
+            """
+
+            effect_name_input, *effect_args = tokens
+            effect_string = ' '.join(tokens)
             # Parse the effect name to match the method names
             # in Img class and the reply system
             effect_name = effect_name_input.replace('-', '_')
 
             # If effect name is not found, add Effect Not Found error
             if effect_name not in EffectRules:
-                commands.append(CommandError(ErrorTypes.EFFECT_NOT_FOUND, [effect_name_input]))
-            # If effect name exists
-            else:
-                # Fetch it's arg parser
-                effect_arg_parser = EffectRules[effect_name]
-                # Parse the args with its parser, and add it to the results
-                commands.append(
-                    EffectCommand(
-                        effect_name,
-                        effect_arg_parser.parse(
-                            effect_args, effect_string),
-                        effect_arg_parser.multi
-                ))
-
-        return commands
-# pylint: enable=R0903
+                command_errors.append(
+                    CommandError(ErrorTypes.EFFECT_NOT_FOUND, [effect_name_input])
+                )
+                return
+
+            # Parse the args with its parser
+            effect_arg_parser = EffectRules[effect_name]
+            arg_list = effect_arg_parser.parse(effect_args, effect_string)
+
+            errors = tuple(arg for arg in arg_list if isinstance(arg, CommandError))
+            if errors:
+                arg_errors.append((effect_string, errors))
+            if effect_arg_parser.multi:
+                multies.append(effect_name)
+
+            commands.append(EffectCommand(
+                effect_name,
+                tuple(arg_list),
+                effect_arg_parser.multi,
+                effect_arg_parser.max_images
+            ))
+
+        # Collect the tokens of each command until its comma. Empty commands are skipped
+        tokens = []
+        for match in CaptionParser.TOKEN.finditer(caption):
+            token = match.group()
+            if token != ',':
+                tokens.append(token)
+            elif tokens:
+                add_command(tokens)
+                tokens = []
+        if tokens:
+            add_command(tokens)
+
+        # Optimize the commands into a pipeline, only if they are all valid
+        pipeline = None
+        if commands and not (command_errors or arg_errors):
+            pipeline = EffectPipeline(commands)
+
+        return CaptionPlan(
+            caption,
+            tuple(commands),
+            tuple(multies),
+            tuple(command_errors),
+            tuple(arg_errors),
+            pipeline
+        )
+
+    @staticmethod
+    def cache_info():
+        """
+        :return: The hits, misses, maximum size and current size of the cache of plans
+        """
+
+        return CaptionParser.compile_normalized.cache_info()
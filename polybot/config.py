@@ -0,0 +1,206 @@
+"""
+Configuration of the app.
+Every setting can be overridden by an environment variable
+with the same name, prefixed with 'POLYBOT_'
+"""
+
+import os
+
+
+def _env(name, default, convert_func = str):
+    """
+    Fetch a setting from the environment variables
+
+    :param name: Required. The name of the setting, without the 'POLYBOT_' prefix.
+    :param default: Required. The value to use when the variable is not set.
+    :param convert_func: Optional. Function to convert the string value. Default is str.
+    :return: The converted value of the setting
+    """
+
+    value = os.environ.get(f'POLYBOT_{name}')
+    if value is None:
+        return default
+
+    # Treat common true/false strings as booleans
+    if convert_func is bool:
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+    return convert_func(value)
+
+
+# pylint: disable=R0903
+class EncodeConfig:
+    """
+    Settings of encoding the resulting images
+    """
+
+    # Image format of the results: 'JPEG' or 'WEBP'
+    FORMAT = _env('ENCODE_FORMAT', 'JPEG').upper()
+    # Quality of JPEG results: integer between 1 - 95
+    JPEG_QUALITY = _env('JPEG_QUALITY', 85, int)
+    # Quality of JPEG results larger than LARGE_PIXELS
+    LARGE_JPEG_QUALITY = _env('LARGE_JPEG_QUALITY', 75, int)
+    # Save JPEG results as progressive JPEG
+    JPEG_PROGRESSIVE = _env('JPEG_PROGRESSIVE', False, bool)
+    # Let the encoder make an extra pass to optimize the file size
+    OPTIMIZE = _env('ENCODE_OPTIMIZE', True, bool)
+    # Quality of WebP results: integer between 0 - 100
+    WEBP_QUALITY = _env('WEBP_QUALITY', 80, int)
+    # WebP effort: integer between 0 (fast) - 6 (small)
+    WEBP_METHOD = _env('WEBP_METHOD', 4, int)
+    # Results with more pixels than this are encoded with the 'large' settings
+    LARGE_PIXELS = _env('LARGE_OUTPUT_PIXELS', 1_500_000, int)
+
+
+class StripConfig:
+    """
+    Settings of executing effects in horizontal strips,
+    to bound the memory of intermediate results on large images
+    """
+
+    # Images with at least this amount of pixels are executed in strips
+    MIN_PIXELS = _env('STRIP_MIN_PIXELS', 4_000_000, int)
+    # Height of each strip in rows
+    HEIGHT = _env('STRIP_HEIGHT', 256, int)
+
+
+class PixelBufferConfig:
+    """
+    Settings of keeping large pixel matrices in memory-mapped scratch files,
+    so the memory of a job does not grow with the size of its images
+    """
+
+    # Pixel matrices of at least this amount of bytes are kept in scratch files,
+    # and their images are executed in strips. 0 to keep all of them in memory
+    MIN_BYTES = _env('PIXEL_BUFFER_MIN_BYTES', 0, int)
+    # The directory of the scratch files: a disk, or a tmpfs mount to keep them in memory
+    # but out of the processes. Default is None, for the temporary directory of the system
+    DIR = _env('PIXEL_BUFFER_DIR', None)
+
+
+class PhotoSizeConfig:
+    """
+    Settings of selecting which of the sizes Telegram keeps of each photo to download
+    """
+
+    # 'max' to always download the largest size, 'balanced' for the smallest size
+    # of at least BALANCED_SIDE, or 'fastest' for the smallest size of at least FASTEST_SIDE
+    POLICY = _env('PHOTO_SIZE_POLICY', 'balanced').lower()
+    # The minimum long side in pixels of the downloaded photos by the 'balanced' policy
+    BALANCED_SIDE = _env('PHOTO_BALANCED_SIDE', 1280, int)
+    # The minimum long side in pixels of the downloaded photos by the 'fastest' policy
+    FASTEST_SIDE = _env('PHOTO_FASTEST_SIDE', 640, int)
+
+
+class MediaGroupConfig:
+    """
+    Settings of collecting the photos of media groups (albums) for multi-image effects
+    """
+
+    # Seconds with no new photo in a group, to process the group
+    IDLE_TIMEOUT = _env('MEDIA_GROUP_IDLE_TIMEOUT', 1.0, float)
+    # The maximum amount of photos in a group (Telegram allows up to 10)
+    MAX_SIZE = _env('MEDIA_GROUP_MAX_SIZE', 10, int)
+    # The amount of photos to download at the same time
+    DOWNLOAD_WORKERS = _env('MEDIA_GROUP_DOWNLOAD_WORKERS', 4, int)
+
+
+class JobConfig:
+    """
+    Settings of running the image processing jobs in worker processes
+    """
+
+    # The amount of worker processes. 0 to process the images in the thread of the message
+    WORKERS = _env('JOB_WORKERS', os.cpu_count() or 1, int)
+    # The maximum amount of jobs that are queued or running at a time
+    QUEUE_DEPTH = _env('JOB_QUEUE_DEPTH', 16, int)
+    # Seconds to wait for the result of a job, before replying with an error
+    TIMEOUT = _env('JOB_TIMEOUT', 60.0, float)
+
+
+class PreviewConfig:
+    """
+    Settings of sending a downscaled preview of the result before the full result
+    """
+
+    # Send previews of the results that are estimated to be slow
+    ENABLED = _env('PREVIEW_ENABLED', False, bool)
+    # The long side of the previews in pixels
+    SIDE = _env('PREVIEW_SIDE', 320, int)
+    # Results that are estimated to take less than this amount of seconds get no preview
+    MIN_SECONDS = _env('PREVIEW_MIN_SECONDS', 2.0, float)
+
+
+class UpdateQueueConfig:
+    """
+    Settings of queueing the incoming messages, to acknowledge the webhook immediately
+    """
+
+    # The maximum amount of queued messages. Further messages are replied as busy
+    MAX_SIZE = _env('UPDATE_QUEUE_SIZE', 100, int)
+    # The amount of threads that handle the queued messages
+    WORKERS = _env('UPDATE_WORKERS', 8, int)
+
+
+class ResultCacheConfig:
+    """
+    Settings of caching the results, by the photos and the effects that produced them
+    """
+
+    # The maximum total size of the results cached in memory, in bytes. 0 to disable
+    MEMORY_BYTES = _env('RESULT_CACHE_MEMORY_BYTES', 64 * 1024 * 1024, int)
+    # The directory of the results cached on disk
+    DISK_DIR = _env('RESULT_CACHE_DIR', 'results_cache')
+    # The maximum total size of the results cached on disk, in bytes. 0 to disable
+    DISK_BYTES = _env('RESULT_CACHE_DISK_BYTES', 512 * 1024 * 1024, int)
+
+
+class CaptionConfig:
+    """
+    Settings of parsing the captions into effect plans
+    """
+
+    # The maximum amount of parsed captions to keep. The least recently used are dropped first
+    CACHE_SIZE = _env('CAPTION_CACHE_SIZE', 1024, int)
+
+
+class MessageCacheConfig:
+    """
+    Settings of remembering the last multi-image message of each user
+    """
+
+    # The maximum amount of remembered messages. The oldest are forgotten first
+    MAX_SIZE = _env('MESSAGE_CACHE_SIZE', 100_000, int)
+
+
+class LogConfig:
+    """
+    Settings of the log
+    """
+
+    # The minimum level of the logged messages, e.g. 'DEBUG' to log the incoming messages
+    LEVEL = _env('LOG_LEVEL', 'INFO').upper()
+
+
+class TracingConfig:
+    """
+    Settings of tracing the stages of handling each request
+    """
+
+    # Fraction of the requests whose trace is logged: between 0 (none) - 1 (all)
+    SAMPLE_RATE = _env('TRACE_SAMPLE_RATE', 0.01, float)
+    # Traces of requests that took at least this amount of seconds are always logged
+    SLOW_SECONDS = _env('TRACE_SLOW_SECONDS', 5.0, float)
+    # File to write the traces into, as JSON lines. Empty to write them with the rest of the log
+    FILE = _env('TRACE_FILE', '')
+
+
+class DebugConfig:
+    """
+    Settings for debugging
+    """
+
+    # Directory to write the downloaded photos and the results into, to inspect them.
+    # Empty to keep them in memory only
+    FILES_DIR = _env('DEBUG_FILES_DIR', '')
+# pylint: enable=R0903
@@ -0,0 +1,367 @@
+"""
+Convolution of pixel matrices with kernels.
+The method is selected by the kernel: separable kernels are applied as two 1D passes,
+passes of a constant kernel by running sums, small kernels directly (as a weighted sum
+of shifted views), and large kernels by FFT, so the cost per pixel stays low for any kernel.
+"""
+
+import numpy as np
+
+
+class Convolution:
+    """
+    A static class that convolves pixel matrices with kernels.
+    Kernels are applied as they are (not flipped), as in image editors,
+    so each output pixel is the weighted sum of the input pixels under the kernel,
+    with the top left of the kernel on the output pixel.
+    """
+
+    # Border modes: how the pixels beyond the edges are filled, by the numpy pad mode.
+    # 'valid' fills nothing, so the result is smaller than the input by the kernel size - 1
+    BORDERS = {
+        'valid': None,
+        'edge': 'edge',
+        'reflect': 'reflect',
+        'constant': 'constant',
+    }
+
+    # 1D passes (that are not constant) with more taps than this are convolved by FFT
+    FFT_MIN_TAPS_1D = 24
+    # 2D kernels (that are not separable) with more taps than this are convolved by FFT
+    FFT_MIN_TAPS_2D = 36
+
+    @staticmethod
+    def separate(kernel):
+        """
+        Split a kernel into a column and a row, whose outer product is the kernel
+
+        :param kernel: Required. 2D numpy array.
+        :return: Tuple of (column, row) 1D numpy arrays, or None if the kernel is not separable
+        """
+
+        # Any separable kernel is a multiple of its row with the largest value
+        i, j = np.unravel_index(np.argmax(np.abs(kernel)), kernel.shape)
+        if kernel[i, j] == 0:
+            return None
+
+        column, row = kernel[:, j], kernel[i, :] / kernel[i, j]
+        tolerance = 1e-9 * abs(kernel[i, j])
+        if not np.allclose(np.outer(column, row), kernel, rtol=0, atol=tolerance):
+            return None
+
+        return column, row
+
+    @staticmethod
+    def method(kernel):
+        """
+        Select the method to convolve with a kernel
+
+        :param kernel: Required. 2D numpy array.
+        :return: 'separable', 'direct' or 'fft'
+        """
+
+        kernel = np.asarray(kernel, dtype=np.float64)
+        if Convolution.separate(kernel) is not None:
+            return 'separable'
+        if kernel.size > Convolution.FFT_MIN_TAPS_2D:
+            return 'fft'
+        return 'direct'
+
+    @staticmethod
+    def convolve(data, kernel, border: str = 'valid', method: str = None):
+        """
+        Convolve a pixel matrix with a kernel, each channel on its own
+
+        :param data: Required. numpy array of shape (height, width) or (height, width, channels).
+        :param kernel: Required. 2D array-like of the weights.
+        :param border: Optional. One of BORDERS. Default is 'valid'.
+               Axes of data that are shorter than the kernel are padded by their edge
+               even with 'valid' borders.
+        :param method: Optional. 'separable', 'direct' or 'fft'.
+               Default is None, to select the fastest by the kernel.
+        :return: numpy array of the shape of data for padded borders,
+                 or smaller by the size of the kernel - 1 for 'valid' (along the axes
+                 the kernel fits in).
+                 Its dtype is an integer when both data and kernel are integers, else a float.
+        """
+
+        kernel = np.asarray(kernel, dtype=np.float64)
+        if kernel.ndim != 2 or 0 in kernel.shape:
+            raise ValueError(f'Kernel must be a non-empty 2D array, got shape {kernel.shape}')
+        if border not in Convolution.BORDERS:
+            raise ValueError(f'Unknown border {border!r}, '
+                             f'expected one of {list(Convolution.BORDERS)}')
+
+        method = method or Convolution.method(kernel)
+        factors = Convolution.separate(kernel) if method == 'separable' else None
+        if method == 'separable' and factors is None:
+            raise ValueError('Kernel is not separable')
+
+        integral = np.issubdtype(data.dtype, np.integer) and Convolution.__integral(kernel)
+        dtype = np.float64
+        # Integer kernels on integer pixels are convolved in integers, unless FFT is used.
+        # int32 wraps around on overflow, but the arithmetic is exact modulo 2 ** 32,
+        # so every result that fits in int32 is exact, even if the sums in between do not
+        if integral and (method == 'direct' or method == 'separable' and all(
+                Convolution.__integral(factor) and Convolution.__direct_1d(factor)
+                for factor in factors)):
+            largest = np.abs(kernel).sum() * max(abs(int(np.iinfo(data.dtype).min)),
+                                                 int(np.iinfo(data.dtype).max))
+            dtype = np.int32 if largest < 2 ** 31 else np.int64
+
+        pixels = data if data.ndim == 3 else data[:, :, np.newaxis]
+
+        # Pad the borders, so the valid result has the shape of the input.
+        # With 'valid' borders, an axis the kernel does not fit in is padded by its edge,
+        # so the result keeps its size along that axis instead of having no pixels
+        mode = Convolution.BORDERS[border]
+        padding = [(0, 0)] * 3
+        for axis, size in enumerate(kernel.shape):
+            if mode or pixels.shape[axis] < size:
+                padding[axis] = ((size - 1) // 2, size // 2)
+        if padding != [(0, 0)] * 3:
+            pixels = np.pad(pixels, padding, mode=mode or 'edge')
+
+        # Fractions are summed in float32, which is fast and precise enough for pixels.
+        # Convert once, rather than on each tap
+        if dtype == np.float64 and method != 'fft':
+            dtype = np.float32
+            pixels = pixels.astype(np.float32)
+
+        if method == 'separable':
+            result = pixels
+            for axis, factor in enumerate(factors):
+                # Skip the passes that keep the pixels as they are, e.g. of a single row kernel
+                if len(factor) > 1 or factor[0] != 1:
+                    result = Convolution.__convolve_1d(result, factor.astype(dtype), axis, dtype)
+            if result is pixels:
+                result = pixels.astype(dtype)
+        elif method == 'fft':
+            result = Convolution.__convolve_fft(pixels, kernel)
+        else:
+            result = Convolution.__convolve_direct(pixels, kernel.astype(dtype), dtype)
+
+        # Round off the errors of fractions and FFT, where the result is an integer
+        if integral and np.issubdtype(dtype, np.floating):
+            result = np.rint(result).astype(np.int64)
+
+        return result if data.ndim == 3 else result[:, :, 0]
+
+    @staticmethod
+    def __integral(weights):
+        """
+        :return: True if all the weights are integers
+        """
+
+        return np.array_equal(weights, np.round(weights))
+
+    @staticmethod
+    def __direct_1d(weights):
+        """
+        :return: True if a 1D pass is convolved without FFT:
+                 by running sums if it is constant, or directly if it is short
+        """
+
+        return bool(np.all(weights == weights[0])) or len(weights) <= Convolution.FFT_MIN_TAPS_1D
+
+    @staticmethod
+    def __convolve_1d(pixels, weights, axis: int, dtype):
+        """
+        Convolve along a single axis, with 'valid' borders
+        """
+
+        taps = len(weights)
+        length = pixels.shape[axis] - taps + 1
+
+        def window(array, start, stop):
+            return array[start:stop] if axis == 0 else array[:, start:stop]
+
+        # A constant kernel is a running sum: the difference of 2 cumulative sums
+        if np.all(weights == weights[0]):
+            if taps == 1:
+                return np.multiply(window(pixels, 0, length), weights[0], dtype=dtype)
+            # Cumulative sums of floats grow beyond the precision of float32
+            sums = Convolution.__cumulative_sum(
+                pixels, axis, np.float64 if np.issubdtype(dtype, np.floating) else dtype
+            )
+            result = np.empty_like(window(sums, 0, length))
+            window(result, 0, 1)[...] = window(sums, taps - 1, taps)
+            np.subtract(window(sums, taps, None), window(sums, 0, length - 1),
+                        out=window(result, 1, None))
+            if weights[0] != 1:
+                result *= weights[0]
+            return result
+
+        if taps > Convolution.FFT_MIN_TAPS_1D:
+            size = Convolution.__fft_size(pixels.shape[axis])
+            # In float64, as the FFT of float32 is not precise enough to round the same
+            # in every strip of an image
+            spectrum = np.fft.rfft(pixels.astype(np.float64), size, axis=axis)
+            spectrum *= np.fft.rfft(weights[::-1], size).reshape(
+                (-1, 1, 1) if axis == 0 else (1, -1, 1)
+            )
+            result = np.fft.irfft(spectrum, size, axis=axis)
+
+            if axis == 0:
+                return result[taps - 1:taps - 1 + length]
+            return result[:, taps - 1:taps - 1 + length]
+
+        return Convolution.__weighted_sum(
+            ((weight, window(pixels, tap, tap + length)) for tap, weight in enumerate(weights)),
+            dtype
+        )
+
+    @staticmethod
+    def __cumulative_sum(pixels, axis: int, dtype):
+        """
+        Cumulative sums along an axis.
+        Down the columns, numpy accumulates a single column at a time, skipping through
+        the memory, which is several times slower than adding the rows one by one.
+        """
+
+        if axis == 1:
+            return np.cumsum(pixels, axis=1, dtype=dtype)
+
+        sums = np.empty(pixels.shape, dtype=dtype)
+        sums[0] = pixels[0]
+        for row in range(1, len(pixels)):
+            np.add(sums[row - 1], pixels[row], out=sums[row])
+        return sums
+
+    @staticmethod
+    def __convolve_direct(pixels, kernel, dtype):
+        """
+        Convolve as a weighted sum of shifted views, with 'valid' borders
+        """
+
+        height = pixels.shape[0] - kernel.shape[0] + 1
+        width = pixels.shape[1] - kernel.shape[1] + 1
+
+        return Convolution.__weighted_sum(
+            ((weight, pixels[i:i + height, j:j + width])
+             for (i, j), weight in np.ndenumerate(kernel)),
+            dtype
+        )
+
+    @staticmethod
+    def __weighted_sum(terms, dtype):
+        """
+        Sum views of the pixels times their weights, skipping the zero weights
+
+        :param terms: Required. Iterable of (weight, view) tuples, of views of the same shape.
+        :param dtype: Required. The dtype of the sum.
+        :return: numpy array of the sum
+        """
+
+        result = None
+        for weight, view in terms:
+            if not weight:
+                continue
+            if result is None:
+                result = np.multiply(view, weight, dtype=dtype)
+            elif weight == 1:
+                result += view
+            elif weight == -1:
+                result -= view
+            else:
+                result += np.multiply(view, weight, dtype=dtype)
+
+        # All the weights are zero
+        if result is None:
+            result = np.zeros(view.shape, dtype=dtype)
+        return result
+
+    @staticmethod
+    def __convolve_fft(pixels, kernel):
+        """
+        Convolve by multiplying the spectrums, with 'valid' borders.
+        The circular convolution wraps around only into the rows and columns
+        that are cut from the valid result, so no extra padding is needed.
+        """
+
+        kernel_height, kernel_width = kernel.shape
+        height = pixels.shape[0] - kernel_height + 1
+        width = pixels.shape[1] - kernel_width + 1
+        shape = (Convolution.__fft_size(pixels.shape[0]), Convolution.__fft_size(pixels.shape[1]))
+
+        spectrum = np.fft.rfft2(pixels, shape, axes=(0, 1))
+        # Flip the kernel, as the FFT convolves and the kernel is applied as is
+        spectrum *= np.fft.rfft2(kernel[::-1, ::-1], shape)[:, :, np.newaxis]
+        result = np.fft.irfft2(spectrum, shape, axes=(0, 1))
+
+        return result[kernel_height - 1:kernel_height - 1 + height,
+                      kernel_width - 1:kernel_width - 1 + width]
+
+    @staticmethod
+    def __fft_size(length: int):
+        """
+        :return: The smallest length of at least 'length', with no prime factors above 5,
+                 which the FFT handles fastest
+        """
+
+        size = length
+        while True:
+            remainder = size
+            for factor in (2, 3, 5):
+                while remainder % factor == 0:
+                    remainder //= factor
+            if remainder == 1:
+                return size
+            size += 1
+
+
+class Kernels:
+    """
+    A static class that builds the kernels of the convolution effects
+    """
+
+    # Emboss: the difference along the diagonal, added to the pixel itself
+    EMBOSS = np.array([
+        [-2, -1, 0],
+        [-1, 1, 1],
+        [0, 1, 2],
+    ])
+
+    # Sobel: the horizontal gradient, smoothed vertically.
+    # Its transpose is the vertical gradient
+    SOBEL = np.array([
+        [-1, 0, 1],
+        [-2, 0, 2],
+        [-1, 0, 1],
+    ])
+
+    @staticmethod
+    def box(size: int):
+        """
+        :param size: Required. The width and height of the box.
+        :return: A kernel of ones, whose sum is the sum of the pixels in the box
+        """
+
+        return np.ones((size, size), dtype=np.int64)
+
+    @staticmethod
+    def sharpen(amount: int = 1):
+        """
+        :param amount: Optional. How much of the difference from the neighbours
+               is added to each pixel. Default is 1.
+        :return: A kernel that subtracts the Laplacian of the image from it
+        """
+
+        return np.array([
+            [0, -amount, 0],
+            [-amount, 1 + 4 * amount, -amount],
+            [0, -amount, 0],
+        ])
+
+    @staticmethod
+    def gaussian(radius: int):
+        """
+        :param radius: Required. The radius of the kernel in pixels,
+               which is 3 standard deviations of the Gaussian.
+        :return: A (2 * radius + 1) square kernel, whose sum is 1
+        """
+
+        offsets = np.arange(-radius, radius + 1)
+        weights = np.exp(-offsets ** 2 / (2 * (radius / 3) ** 2))
+        weights /= weights.sum()
+        return np.outer(weights, weights)
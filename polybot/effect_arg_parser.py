@@ -16,6 +16,8 @@ class EffectArgParser:
     Parser for arguments of a command. Each Effect Arg Parser holds:
     1. The range of arguments expected from the user (arg_amount_start and arg_amount_end)
     2. The full list of all its argument rules
+    3. Is it a multi-image effect, and the maximum amount of images it can use
+       (2 for a single other image, or None for a list of any amount of other images)
     Each argument can have 1 of 4 types of arguments:
     1. Ranged argument, of type ArgRangeRule
     2. Option argument (one value from given options). of type ArgOptionRule
@@ -27,10 +29,12 @@ class EffectArgParser:
                  arg_amount_start: int,
                  arg_amount_end: int,
                  arg_rule_list: iter,
-                 multi: bool = False):
+                 multi: bool = False,
+                 max_images: int = 2):
         self.arg_amount_range = ArgRangeRule(arg_amount_start, arg_amount_end)
         self.arg_rule_list = arg_rule_list
         self.multi = multi
+        self.max_images = max_images
 
     def parse(self, arg_list: iter, effect_string: str):
         """
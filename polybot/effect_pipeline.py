@@ -0,0 +1,471 @@
+"""
+Lazy pipeline of effect commands.
+The commands parsed from a caption are recorded, rewritten into
+a cheaper plan with the same result, and only then executed.
+"""
+
+import copy
+import time
+import inspect
+import numpy as np
+# pylint: disable=E0401
+from polybot.config import StripConfig
+from polybot.img_proc import Img
+from polybot.pixel_buffer import PixelBuffer
+from polybot.point_lut import PointLutCompiler
+# pylint: enable=E0401
+
+
+# pylint: disable=R0903
+class PlanStep:
+    """
+    A single step of an optimized plan: an Img method
+    with all its arguments by name, including the default values
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, name: str, args: dict, multi: bool = False, label: str = None,
+                 max_images: int = 2):
+        self.name = name
+        self.args = args
+        self.multi = multi
+        # The maximum amount of images of a multi-image effect, or None for any amount
+        self.max_images = max_images
+        # Text to describe the step instead of its name and arguments
+        self.label = label
+    # pylint: enable=R0913
+
+    def __str__(self):
+        if self.label:
+            return self.label
+        return ' '.join([self.name.replace('_', '-'), *map(str, self.args.values())])
+# pylint: enable=R0903
+
+
+class EffectPipeline:
+    """
+    Records the EffectCommands of a caption, optimizes them into a plan,
+    and executes the plan on the images.
+
+    The optimizer:
+    1. Moves rotations after point effects, and merges consecutive rotations (modulo 360).
+    2. Drops steps that do not change the image (e.g. 'rotate' of 360 degrees or 'blur 1').
+    3. Fuses adjacent point effects that can be expressed as a single one.
+    4. Compiles the remaining runs of point effects into single lookup tables.
+    5. Crops the image before the effects preceding 'canvas-resize', when it crops.
+    """
+
+    # Effects that set each pixel by its own value only (no position, no randomness),
+    # so they can switch places with rotations and crops
+    POINT_EFFECTS = ('grayscale', 'segment', 'rgb_posterize')
+
+    # The extra (width, height) each effect needs in its input,
+    # to produce a given size of output from the top left corner
+    CROP_MARGINS = {
+        'grayscale': lambda args: (0, 0),
+        'segment': lambda args: (0, 0),
+        'rgb_posterize': lambda args: (0, 0),
+        'apply_lut': lambda args: (0, 0),
+        'contour': lambda args: (1, 0),
+        'blur': lambda args: (args['blur_level'] - 1, args['blur_level'] - 1),
+        'sharpen': lambda args: (2, 2),
+        'emboss': lambda args: (2, 2),
+        'edges': lambda args: (2, 2),
+        'gaussian_blur': lambda args: (2 * args['radius'], 2 * args['radius']),
+    }
+
+    # The extra rows below each strip, each effect needs in its input
+    # when executed in horizontal strips
+    STRIP_HALOS = {
+        'grayscale': lambda args: 0,
+        'segment': lambda args: 0,
+        'rgb_posterize': lambda args: 0,
+        'apply_lut': lambda args: 0,
+        'salt_n_pepper': lambda args: 0,
+        'color_noise': lambda args: 0,
+        'contour': lambda args: 0,
+        'blur': lambda args: args['blur_level'] - 1,
+        'sharpen': lambda args: 2,
+        'emboss': lambda args: 2,
+        'edges': lambda args: 2,
+        'gaussian_blur': lambda args: 2 * args['radius'],
+    }
+
+    # Effects that draw random values, by their 'seed' argument
+    RANDOM_EFFECTS = ('salt_n_pepper', 'color_noise')
+
+    # Effects that set the size of the result in pixels of the photo,
+    # so they need the full resolution of the photo
+    FULL_RESOLUTION_EFFECTS = ('canvas_resize', 'crop')
+
+    # Arguments in pixels of each effect, that are scaled with the photo
+    # when a smaller rendition of it is processed, so the result looks the same
+    PIXEL_ARGS = {
+        'blur': ('blur_level',),
+        'gaussian_blur': ('radius',),
+    }
+
+    # Clockwise angles, as the number of clockwise quarter turns
+    ROTATE_TURNS = {90: 1, 180: 2, 270: 3, -90: 3}
+
+    def __init__(self, commands: iter):
+        """
+        :param commands: Required. The list of EffectCommands, parsed from the caption.
+        """
+
+        self.commands = list(commands)
+        self.plan = EffectPipeline.optimize(
+            [EffectPipeline.to_step(command) for command in self.commands]
+        )
+
+    def __str__(self):
+        return ', '.join(map(str, self.plan))
+
+    def cache_key(self):
+        """
+        Describe the result of the optimized plan, so equivalent captions share it
+
+        :return: The description as a string, or None if the result is random
+                 (has a noise effect with no seed)
+        """
+
+        for step in self.plan:
+            if step.name in EffectPipeline.RANDOM_EFFECTS and step.args.get('seed') is None:
+                return None
+
+        return str(self)
+
+    def needs_full_resolution(self):
+        """
+        :return: True if the result depends on the full resolution of the photo
+        """
+
+        return any(step.name in EffectPipeline.FULL_RESOLUTION_EFFECTS for step in self.plan)
+
+    def scaled(self, factor: float):
+        """
+        Scale the arguments in pixels of the plan, to execute it on a smaller
+        rendition of the photo with the same look as on the full resolution
+
+        :param factor: Required. The size of the rendition relative to the full resolution.
+        :return: A scaled copy of the pipeline, or the pipeline itself if nothing is scaled
+        """
+
+        if factor >= 1 or not any(step.name in EffectPipeline.PIXEL_ARGS for step in self.plan):
+            return self
+
+        def scale_step(step):
+            names = EffectPipeline.PIXEL_ARGS.get(step.name)
+            if not names:
+                return step
+
+            args = {**step.args, **{name: max(round(step.args[name] * factor), 1)
+                                    for name in names}}
+            return PlanStep(step.name, args, step.multi, step.label, step.max_images)
+
+        # Plans are shared by all the messages with the same caption, so copy it
+        pipeline = copy.copy(self)
+        pipeline.plan = list(map(scale_step, self.plan))
+        return pipeline
+
+    @staticmethod
+    def to_step(command):
+        """
+        Convert an EffectCommand to a PlanStep, with the default values
+        of the Img method for the arguments that were not given
+
+        :param command: Required. The EffectCommand.
+        :return: The PlanStep.
+        """
+
+        signature = inspect.signature(getattr(Img, command.command_name))
+        # Skip 'self', and the other image of multi-image effects
+        parameters = list(signature.parameters)[2 if command.multi else 1:]
+
+        bound = signature.bind_partial(**dict(zip(parameters, command.arg_list)))
+        bound.apply_defaults()
+        args = {name: bound.arguments[name] for name in parameters}
+
+        return PlanStep(command.command_name, args, command.multi,
+                        max_images = command.max_images)
+
+    @staticmethod
+    def optimize(plan: list):
+        """
+        Rewrite a plan into a cheaper plan with the same result
+
+        :param plan: Required. List of PlanSteps.
+        :return: The optimized list of PlanSteps.
+        """
+
+        # Repeat the rewrites while they shorten the plan,
+        # since each rewrite may let another one apply
+        length = None
+        while length != len(plan):
+            length = len(plan)
+            plan = EffectPipeline.__merge_rotations(plan)
+            plan = EffectPipeline.__drop_no_ops(plan)
+            plan = EffectPipeline.__fuse_point_effects(plan)
+
+        plan = EffectPipeline.__compile_luts(plan)
+        return EffectPipeline.__push_crops(plan)
+
+    @staticmethod
+    def __merge_rotations(plan):
+        """
+        Move rotations after point effects, and merge consecutive rotations
+        """
+
+        plan = list(plan)
+
+        # Bubble each rotation over the point effects that follow it
+        for i in range(len(plan) - 1, -1, -1):
+            j = i
+            while (j + 1 < len(plan) and plan[j].name == 'rotate'
+                   and plan[j + 1].name in EffectPipeline.POINT_EFFECTS):
+                plan[j], plan[j + 1] = plan[j + 1], plan[j]
+                j += 1
+
+        # Merge consecutive rotations, and drop full turns
+        result = []
+        for step in plan:
+            if step.name == 'rotate' and result and result[-1].name == 'rotate':
+                turns = (EffectPipeline.ROTATE_TURNS[result.pop().args['angle']]
+                         + EffectPipeline.ROTATE_TURNS[step.args['angle']]) % 4
+                if turns:
+                    result.append(PlanStep('rotate', {'angle': turns * 90}))
+            else:
+                result.append(step)
+
+        return result
+
+    @staticmethod
+    def __drop_no_ops(plan):
+        """
+        Drop the steps that do not change the image
+        """
+
+        def is_no_op(step):
+            # A 1x1 blur is the image itself
+            if step.name == 'blur':
+                return step.args['blur_level'] == 1
+            # Noise with no strength never changes a pixel
+            if step.name in ('salt_n_pepper', 'color_noise'):
+                return step.args['strength'] == 0
+            return False
+
+        return [step for step in plan if not is_no_op(step)]
+
+    @staticmethod
+    def __fuse_point_effects(plan):
+        """
+        Fuse adjacent point effects, where the second can be folded into the first
+        """
+
+        result = []
+        for step in plan:
+            previous = result[-1] if result else None
+
+            # A segment of an image that is already segmented only re-colors its 2 colors
+            if step.name == 'segment' and previous and previous.name == 'segment':
+                args = step.args
+                # The color each of the 2 colors turns into by the second segment
+                recolor = {
+                    color: args['white'] if sum(color[:3]) > args['threshold'] * 3
+                    else args['black']
+                    for color in (previous.args['black'], previous.args['white'])
+                }
+
+                result[-1] = PlanStep('segment', {
+                    'threshold': previous.args['threshold'],
+                    'black': recolor[previous.args['black']],
+                    'white': recolor[previous.args['white']]
+                })
+
+            # Posterizing channels that are already 0 or 255 keeps them,
+            # unless the threshold is 255
+            elif (step.name == 'rgb_posterize' and previous
+                  and previous.name == 'rgb_posterize' and step.args['threshold'] < 255):
+                continue
+
+            else:
+                result.append(step)
+
+        return result
+
+    @staticmethod
+    def __compile_luts(plan):
+        """
+        Replace each run of 2 or more point effects with a single lookup table step
+        """
+
+        result = []
+        i = 0
+        while i < len(plan):
+            compiled = PointLutCompiler.compile(plan[i:])
+            if compiled and compiled[2] > 1:
+                kind, table, count = compiled
+                label = f"lut({', '.join(map(str, plan[i:i + count]))})"
+                result.append(PlanStep('apply_lut', {'kind': kind, 'table': table}, label=label))
+                i += count
+            else:
+                result.append(plan[i])
+                i += 1
+
+        return result
+
+    @staticmethod
+    def __push_crops(plan):
+        """
+        Add a crop before the effects that precede 'canvas-resize',
+        so they process only the pixels that will be left after it
+        """
+
+        result = list(plan)
+        for i in range(len(result) - 1, -1, -1):
+            if result[i].name != 'canvas_resize':
+                continue
+
+            # Walk back over the effects that can be cropped before,
+            # and sum the margins they need
+            width, height = result[i].args['width'], result[i].args['height']
+            j = i
+            while j > 0 and result[j - 1].name in EffectPipeline.CROP_MARGINS:
+                margin_width, margin_height = EffectPipeline.CROP_MARGINS[result[j - 1].name](
+                    result[j - 1].args
+                )
+                width += margin_width
+                height += margin_height
+                j -= 1
+
+            # Crop only if any effect was passed
+            if j < i:
+                result.insert(j, PlanStep('crop', {'width': width, 'height': height}))
+
+        return result
+
+    @staticmethod
+    def strip_height_for(img: Img):
+        """
+        Select the execution mode for an image by its size
+
+        :param img: Required. The Img instance to process.
+        :return: The height of the strips to execute in, or None to execute on the whole image.
+        """
+
+        # Images in scratch files are executed in strips, to keep them out of the heap
+        pixels = img.width * img.height
+        if pixels >= StripConfig.MIN_PIXELS or PixelBuffer.mapped(pixels * 3):
+            return StripConfig.HEIGHT
+        return None
+
+    def execute(self, imgs: list, strip_height: int = None, timings: dict = None):
+        """
+        Execute the optimized plan on the images
+
+        :param imgs: Required. List of Img instances. The result is in the first one,
+               and the others are used by the multi-image effect.
+        :param strip_height: Optional. Execute runs of effects that allow it
+               in horizontal strips of this height. Default is None, for the whole image.
+        :param timings: Optional. A dict to add the execution time of each effect to,
+               in seconds by the name of the effect. Default is None (not timed).
+        """
+
+        EffectPipeline.run(self.plan, imgs, strip_height, timings)
+
+    # pylint: disable=R0914
+    @staticmethod
+    def run(plan: list, imgs: list, strip_height: int = None, timings: dict = None):
+        """
+        Execute a plan on the images, step by step
+
+        :param plan: Required. List of PlanSteps.
+        :param imgs: Required. List of Img instances. The result is in the first one,
+               and the others are used by the multi-image effect.
+        :param strip_height: Optional. Execute runs of effects that allow it
+               in horizontal strips of this height. Default is None, for the whole image.
+        :param timings: Optional. A dict to add the execution time of each effect to,
+               in seconds by the name of the effect. Default is None (not timed).
+        """
+
+        i = 0
+        while i < len(plan):
+            # Collect the run of effects that can be executed in strips.
+            # Effects with halo rows end the run after a random effect, since
+            # the halo rows would draw random values again in the next strip
+            j = i
+            random = False
+            while (strip_height and j < len(plan)
+                   and plan[j].name in EffectPipeline.STRIP_HALOS
+                   and not (random and EffectPipeline.STRIP_HALOS[plan[j].name](plan[j].args))):
+                random = random or plan[j].name in EffectPipeline.RANDOM_EFFECTS
+                j += 1
+
+            if j > i:
+                EffectPipeline.__run_in_strips(plan[i:j], imgs[0], strip_height, timings)
+                i = j
+                continue
+
+            start = time.perf_counter()
+            # extract the method for processing the step
+            method = getattr(imgs[0], plan[i].name)
+            # If the step is a multi-image effect, insert the second image,
+            # or all the other images if it can use more than two
+            if plan[i].multi and plan[i].max_images == 2:
+                method(imgs[1], **plan[i].args)
+            elif plan[i].multi:
+                method(imgs[1:], **plan[i].args)
+            else:
+                method(**plan[i].args)
+
+            if timings is not None:
+                timings[plan[i].name] = (timings.get(plan[i].name, 0.0)
+                                         + time.perf_counter() - start)
+            i += 1
+    # pylint: enable=R0914
+
+    @staticmethod
+    def __run_in_strips(plan: list, img: Img, strip_height: int, timings: dict = None):
+        """
+        Execute a plan of effects that allow it, strip by strip.
+        Only a single strip and its intermediate results are processed at a time,
+        and each result strip is written into a single output buffer.
+
+        :param plan: Required. List of PlanSteps, all in STRIP_HALOS.
+        :param img: Required. The Img instance to process.
+        :param strip_height: Required. The height of the output strips.
+        :param timings: Optional. A dict to add the execution time of each effect to.
+        """
+
+        source = img.data
+        # Each output row needs the input rows from it, and 'halo' rows below it
+        halo = sum(EffectPipeline.STRIP_HALOS[step.name](step.args) for step in plan)
+        height = len(source) - halo
+
+        # Not enough rows for strips, execute on the whole image
+        if height <= 0:
+            EffectPipeline.run(plan, [img], timings = timings)
+            return
+
+        # Random effects draw from a single generator through all the strips,
+        # so the result is the same as on the whole image
+        plan = [
+            PlanStep(step.name, {**step.args, 'seed': np.random.default_rng(step.args['seed'])})
+            if step.name in EffectPipeline.RANDOM_EFFECTS else step
+            for step in plan
+        ]
+
+        result = None
+        for top in range(0, height, strip_height):
+            bottom = min(top + strip_height, height)
+
+            # Execute on the rows of the strip, with the halo rows below
+            strip = Img(None, data=source[top:bottom + halo])
+            EffectPipeline.run(plan, [strip], timings = timings)
+
+            # Allocate the output once the width of the result is known
+            if result is None:
+                result = PixelBuffer.empty((height, *strip.data.shape[1:]))
+            result[top:bottom] = strip.data
+
+        img.data = result
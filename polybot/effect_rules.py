@@ -15,16 +15,29 @@ EffectRules = {
         ArgRangeRule(1, 32)
     ]),
     'contour': EffectArgParser(0, 0,[]),
+    'sharpen': EffectArgParser(0, 1, [
+        ArgRangeRule(1, 10)
+    ]),
+    'emboss': EffectArgParser(0, 0, []),
+    'edges': EffectArgParser(0, 0, []),
+    'gaussian_blur': EffectArgParser(0, 1, [
+        ArgRangeRule(1, 32)
+    ]),
     'rotate': EffectArgParser(0, 1, [
         ArgOptionRule([90, -90, 180, 270], int)
     ]),
-    'salt_n_pepper': EffectArgParser(0, 3, [
+    'flip': EffectArgParser(0, 1, [
+        ArgOptionRule(['horizontal', 'vertical'])
+    ]),
+    'salt_n_pepper': EffectArgParser(0, 4, [
         ArgRangeRule(0, 0.5, float),
         ArgColorRule(),
-        ArgColorRule()
+        ArgColorRule(),
+        ArgPositiveInt()
     ]),
-    'color_noise': EffectArgParser(0, 1, [
-        ArgRangeRule(0, 0.5, float)
+    'color_noise': EffectArgParser(0, 2, [
+        ArgRangeRule(0, 0.5, float),
+        ArgPositiveInt()
     ]),
     'segment': EffectArgParser(0, 3, [
         ArgRangeRule(0, 255),
@@ -44,5 +57,9 @@ EffectRules = {
     'rgb_posterize': EffectArgParser(0, 1, [
         ArgRangeRule(0, 255)
     ]),
-    'multiply': EffectArgParser(0, 0,[], True)
+    'multiply': EffectArgParser(0, 0,[], True),
+    'collage': EffectArgParser(0, 2, [
+        ArgOptionRule(['horizontal', 'vertical', 'grid']),
+        ArgColorRule()
+    ], True, None)
 }
@@ -26,3 +26,30 @@ class CommandError:
         self.error_type = error_type
         self.error_args = error_args
 # pylint: enable=R0903
+
+
+class JobTimeoutError(Exception):
+    """
+    Raised when an image processing job did not finish in time.
+    Holds the error_type of 'job-timeout', and the Future of the job that is still running
+    """
+
+    error_type = ErrorTypes.JOB_TIMEOUT
+
+    def __init__(self, timeout: float, future = None):
+        super().__init__(f'Job did not finish within {timeout} seconds')
+        self.timeout = timeout
+        self.future = future
+
+
+class JobFailedError(Exception):
+    """
+    Raised when an image processing job raised an error, or its worker process died.
+    Holds the error_type of 'job-failed', and the error of the job
+    """
+
+    error_type = ErrorTypes.JOB_FAILED
+
+    def __init__(self, error: BaseException):
+        super().__init__(f'Job failed: {error!r}')
+        self.error = error
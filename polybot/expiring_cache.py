@@ -0,0 +1,114 @@
+"""
+A bounded key-value store, with entries that expire after a timeout
+"""
+
+import heapq
+import threading
+
+
+class ExpiringCache:
+    """
+    Holds values by key, each stamped with the time it was set at.
+    Entries expire 'timeout' seconds after their time, and the oldest entries
+    are evicted when there are more than 'max_size' of them.
+
+    Expiry times are kept in a heap, so expiring is O(log n) per entry,
+    instead of scanning all entries. Replaced entries leave stale heap items,
+    which are skipped when popped, and cleaned when they pile up.
+    """
+
+    def __init__(self, timeout: float, max_size: int):
+        """
+        :param timeout: Required. Seconds after the time of an entry to expire it.
+        :param max_size: Required. The maximum amount of entries.
+        """
+
+        self.timeout = timeout
+        self.max_size = max(max_size, 1)
+        self.lock = threading.Lock()
+
+        # (value, time) by key
+        self.entries = {}
+        # Heap of (time, key) items, of the entries and of replaced entries
+        self.heap = []
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, now: float = None):
+        """
+        Fetch the value of a key
+
+        :param key: Required. The key.
+        :param now: Optional. The current time. If given, an expired entry
+               is dropped instead of returned. Default is None (no check).
+        :return: The value, or None if not found or expired
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            value, stamp = entry
+            if now is not None and now - stamp > self.timeout:
+                del self.entries[key]
+                return None
+
+            return value
+
+    def set(self, key, value, stamp: float):
+        """
+        Set the value of a key, and evict the oldest entries if there are too many
+
+        :param key: Required. The key.
+        :param value: Required. The value.
+        :param stamp: Required. The time of the value, that it expires relative to.
+        """
+
+        with self.lock:
+            self.entries[key] = (value, stamp)
+            heapq.heappush(self.heap, (stamp, key))
+
+            while len(self.entries) > self.max_size:
+                if self.__pop_oldest():
+                    self.evictions += 1
+
+            # Rebuild the heap when most of it is stale
+            if len(self.heap) > 2 * len(self.entries) + 64:
+                self.heap = [(item_stamp, item_key)
+                             for item_key, (_, item_stamp) in self.entries.items()]
+                heapq.heapify(self.heap)
+
+    def expire(self, now: float):
+        """
+        Remove all the entries that expired
+
+        :param now: Required. The current time.
+        :return: The amount of removed entries
+        """
+
+        expired = 0
+        with self.lock:
+            while self.heap and now - self.heap[0][0] > self.timeout:
+                if self.__pop_oldest():
+                    expired += 1
+
+        return expired
+
+    def __pop_oldest(self):
+        """
+        Pop the oldest heap item, and remove its entry if it is not stale.
+        Call while holding self.lock.
+
+        :return: True if an entry was removed, or False for a stale item
+        """
+
+        stamp, key = heapq.heappop(self.heap)
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] == stamp:
+            del self.entries[key]
+            return True
+
+        return False
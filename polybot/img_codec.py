@@ -0,0 +1,211 @@
+"""
+Encoding and decoding of images,
+between files and the pixel matrices used by Img
+"""
+
+import os
+import time
+import numpy as np
+import PIL.Image
+# pylint: disable=E0401
+from polybot.config import EncodeConfig, StripConfig
+from polybot.pixel_buffer import PixelBuffer
+# pylint: enable=E0401
+
+
+# pylint: disable=R0903
+class ImageFormat:
+    """
+    All supported image formats to encode to
+    """
+
+    JPEG = 'JPEG'
+    WEBP = 'WEBP'
+    PNG = 'PNG'
+
+    # File suffix of each format
+    SUFFIXES = {
+        JPEG: '.jpg',
+        WEBP: '.webp',
+        PNG: '.png'
+    }
+
+
+class EncodeOptions:
+    """
+    Holds the settings to encode an image with
+    """
+
+    def __init__(self,
+                 image_format: str = ImageFormat.JPEG,
+                 quality: int = 85,
+                 progressive: bool = False,
+                 optimize: bool = True,
+                 method: int = 4):
+        self.image_format = image_format
+        self.quality = quality
+        self.progressive = progressive
+        self.optimize = optimize
+        self.method = method
+
+    @property
+    def suffix(self):
+        """
+        The file suffix of the selected format
+        """
+
+        return ImageFormat.SUFFIXES[self.image_format]
+
+    def save_kwargs(self):
+        """
+        The keyword arguments for PIL.Image.save(), according to the selected format
+
+        :return: dict of the arguments
+        """
+
+        if self.image_format == ImageFormat.JPEG:
+            return {
+                'format': self.image_format,
+                'quality': self.quality,
+                'progressive': self.progressive,
+                'optimize': self.optimize
+            }
+        if self.image_format == ImageFormat.WEBP:
+            return {
+                'format': self.image_format,
+                'quality': self.quality,
+                'method': self.method
+            }
+
+        return {'format': self.image_format, 'optimize': self.optimize}
+
+    @staticmethod
+    def for_size(width: int, height: int):
+        """
+        Select the encode options from the config, according to the size of the image.
+        Large images are encoded with lower quality, to reduce the uploaded bytes.
+
+        :param width: Required. Width of the image in pixels.
+        :param height: Required. Height of the image in pixels.
+        :return: EncodeOptions instance
+        """
+
+        if EncodeConfig.FORMAT == ImageFormat.WEBP:
+            return EncodeOptions(
+                ImageFormat.WEBP,
+                EncodeConfig.WEBP_QUALITY,
+                method = EncodeConfig.WEBP_METHOD
+            )
+
+        large = width * height > EncodeConfig.LARGE_PIXELS
+        return EncodeOptions(
+            ImageFormat.JPEG,
+            EncodeConfig.LARGE_JPEG_QUALITY if large else EncodeConfig.JPEG_QUALITY,
+            # Progressive JPEG are usually smaller, and show up earlier on slow connections
+            progressive = large or EncodeConfig.JPEG_PROGRESSIVE,
+            optimize = EncodeConfig.OPTIMIZE
+        )
+
+
+class ImgDecoder:
+    """
+    A static class that decode image files into pixel matrices
+    """
+
+    # Modes of images with more than 8 bits per channel
+    HIGH_DEPTH_MODES = ('I', 'I;16', 'I;16B', 'I;16L', 'F')
+
+    @staticmethod
+    def decode(source, target_size = None):
+        """
+        Decode an image file into a pixel matrix of RGB values.
+        Alpha channels are dropped and grayscale images are expanded to 3 channels.
+
+        :param source: Required. A path or a readable binary file object.
+        :param target_size: Optional. Tuple of (width, height) the image is needed in.
+               JPEG images are then decoded by the closest scale (1/2, 1/4 or 1/8)
+               that is still at least as large, which is much faster than a full decode.
+               Default is None, to decode in full size.
+        :return: Tuple of the numpy array of shape (height, width, 3) and dtype uint8,
+                 and the decode time in seconds
+        """
+
+        start = time.perf_counter()
+
+        with PIL.Image.open(source) as image:
+            # Let the JPEG decoder scale the image down while decoding
+            if target_size and image.format == ImageFormat.JPEG:
+                image.draft('RGB', target_size)
+
+            if image.mode in ImgDecoder.HIGH_DEPTH_MODES:
+                # Reduce single channel images of 16 bits to 8 bits,
+                # and expand them to 3 channels
+                gray = (np.asarray(image, dtype=np.uint32) >> 8).astype(np.uint8)
+                data = PixelBuffer.store(np.repeat(gray[:, :, np.newaxis], 3, axis=2))
+            else:
+                if image.mode != 'RGB':
+                    # Drop the alpha channel, expand grayscale and palette images
+                    image = image.convert('RGB')
+                data = ImgDecoder.__to_array(image)
+
+        return data, time.perf_counter() - start
+
+    @staticmethod
+    def __to_array(image):
+        """
+        Copy the pixels of an RGB image into a pixel matrix.
+        Matrices in scratch files are copied into a band of rows at a time,
+        so the pixels are never copied whole on the heap.
+
+        :param image: Required. PIL Image of mode 'RGB'.
+        :return: numpy array of shape (height, width, 3) and dtype uint8
+        """
+
+        width, height = image.size
+        if not PixelBuffer.mapped(width * height * 3):
+            return np.array(image, dtype=np.uint8)
+
+        data = PixelBuffer.empty((height, width, 3))
+        for top in range(0, height, StripConfig.HEIGHT):
+            bottom = min(top + StripConfig.HEIGHT, height)
+            data[top:bottom] = np.asarray(image.crop((0, top, width, bottom)))
+        return data
+
+
+class ImgEncoder:
+    """
+    A static class that encode pixel matrices into image files
+    """
+
+    @staticmethod
+    def encode(data, destination, options: EncodeOptions = None):
+        """
+        Encode a pixel matrix into an image file
+
+        :param data: Required. numpy array of shape (height, width, 3) and dtype uint8.
+        :param destination: Required. A path or a writable binary file object.
+        :param options: Optional. EncodeOptions instance. If None, the format is
+               selected by the suffix of the destination, with the default settings.
+        :return: Tuple of the encode time in seconds and the size of the result in bytes
+        """
+
+        start = time.perf_counter()
+
+        # Convert the whole pixel matrix to an image in a single call
+        image = PIL.Image.fromarray(data)
+
+        if options:
+            image.save(destination, **options.save_kwargs())
+        else:
+            image.save(destination)
+
+        encode_time = time.perf_counter() - start
+
+        # Fetch the size of the result
+        if hasattr(destination, 'tell'):
+            size = destination.tell()
+        else:
+            size = os.path.getsize(destination)
+
+        return encode_time, size
+# pylint: enable=R0903
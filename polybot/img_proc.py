@@ -1,53 +1,205 @@
 """Module for Image Processing"""
+import io
 import os
-import random
+import math
 from pathlib import Path
-from matplotlib.image import imread
-import PIL.Image
+import numpy as np
+# pylint: disable=E0401
+from polybot.config import StripConfig
+from polybot.img_codec import ImgDecoder, ImgEncoder, EncodeOptions
+from polybot.convolution import Convolution, Kernels
+from polybot.pixel_buffer import PixelBuffer
+# pylint: enable=E0401
+
+
+def _to_pixel(color):
+    """
+    Convert a color to a pixel value
+
+    :param color: list or tuple of 3 (or 4, where the alpha is ignored)
+    integers with the value of 0 - 255.
+    :return: numpy array of 3 uint8 values
+    """
+
+    return np.array(color[:3], dtype=np.uint8)
+
+
+def _luminance(data):
+    """
+    The grayscale value of each pixel, according to its RGB values
+
+    :param data: numpy array of shape (height, width, 3).
+    :return: numpy array of shape (height, width) and dtype uint8
+    """
+
+    red, green, blue = data[:, :, 0], data[:, :, 1], data[:, :, 2]
+    return (0.2989 * red + 0.5870 * green + 0.1140 * blue).astype(np.uint8)
+
+
+# pylint: disable=R0903
+class LutKind:
+    """
+    All kinds of lookup tables for Img.apply_lut, by the value each pixel is looked up with
+    """
+
+    # Each channel by its own value: table of shape (256, 3)
+    CHANNEL = 'channel'
+    # The whole pixel by the sum of its channels: table of shape (766, 3)
+    SUM = 'sum'
+    # The whole pixel by its grayscale value: table of shape (256, 3)
+    GRAY = 'gray'
+# pylint: enable=R0903
 
 
 class Img:
     """
     For Image Processing
     Load image on init, and run methods to add effects.
-    Save the image to a file with save_img()
+    Save the image to a file with save_img(), or encode it in memory with encode()
+
+    The pixels are stored in self.data as a numpy array
+    of shape (height, width, 3) and dtype uint8.
+    Geometric effects (rotate, flip, crop) only create strided views over it,
+    and the padding of canvas_resize stays pending, until self.data is
+    needed by an effect that changes the pixels, or by save_img().
+    Large pixel matrices are kept in memory-mapped scratch files (see PixelBuffer).
     """
 
-    def __init__(self, path):
+    def __init__(self, path, target_size = None, data = None):
         """
         Load RGB image on initiation
+
+        :param path: Required. The path of the image file, or the encoded image as bytes.
+        Can be None if data is given.
+        :param target_size: Optional. Tuple of (width, height). If given, JPEG images
+        may be decoded in a reduced size, that is still at least as large as target_size.
+        Default is None, to load in full size.
+        :param data: Optional. A pixel matrix to use instead of loading the file.
         """
 
-        self.path = Path(path)
-        self.data = imread(path).tolist()
+        # Images decoded from bytes have no path
+        source = path
+        if isinstance(path, (bytes, bytearray)):
+            source, path = io.BytesIO(path), None
+        self.path = Path(path) if path is not None else None
+        # Pending canvas as (height, width, top, left, bg_color),
+        # with the pixels placed at (top, left), or None
+        self._canvas = None
+        # Time in seconds it took to decode the image file
+        if data is not None:
+            self._pixels, self.decode_time = data, 0
+        else:
+            self._pixels, self.decode_time = ImgDecoder.decode(source, target_size)
+
+        # Time in seconds and size in bytes of the last save_img() or encode()
+        self.encode_time = None
+        self.encoded_size = None
+
+    @property
+    def data(self):
+        """
+        The pixel matrix: numpy array of shape (height, width, 3) and dtype uint8.
+        A pending canvas is materialized on access.
+        """
+
+        if self._canvas is not None:
+            height, width, top, left, bg_color = self._canvas
+            pixels_height, pixels_width = self._pixels.shape[:2]
+
+            # Create the canvas filled with 'bg_color', and place the pixels on it
+            canvas = PixelBuffer.empty((height, width, 3))
+            canvas[:, :] = _to_pixel(bg_color)
+            canvas[top:top + pixels_height, left:left + pixels_width] = self._pixels
 
-    def save_img(self):
+            self._pixels = canvas
+            self._canvas = None
+
+        return self._pixels
+
+    @data.setter
+    def data(self, pixels):
+        self._pixels = PixelBuffer.store(pixels)
+        self._canvas = None
+
+    @property
+    def height(self):
         """
-        Saves the image as a file by the path in self.path,
-        with '_filtered' added to the name of the file.
+        The height of the image in pixels, without materializing a pending canvas
         """
 
-        # PIL.Image is used because matplotlib.image.imsave does not seem to work on RGB images
+        return self._canvas[0] if self._canvas else len(self._pixels)
 
-        # File destination path
-        new_path = self.path.with_name(self.path.stem + '_filtered' + self.path.suffix)
+    @property
+    def width(self):
+        """
+        The width of the image in pixels, without materializing a pending canvas
+        """
 
-        # Create a new blank image with the same dimensions as your matrix
-        width, height = len(self.data[0]), len(self.data)
-        image = PIL.Image.new("RGB", (width, height))
+        return self._canvas[1] if self._canvas else self._pixels.shape[1]
 
-        # Set the pixel values from your matrix
-        for y in range(height):
-            for x in range(width):
-                r, g, b = self.data[y][x]
-                image.putpixel((x, y), (r, g, b))
+    def __set_canvas(self, height, width, top, left, bg_color):
+        """
+        Set the pending canvas, or clear it if the pixels cover it exactly
+        """
+
+        if (top, left, height, width) == (0, 0, *self._pixels.shape[:2]):
+            self._canvas = None
+        else:
+            self._canvas = (height, width, top, left, bg_color)
+
+    def clone(self):
+        """
+        Create a copy of the image, that shares the pixels with this image
+        until either of them changes (copy-on-write).
+        Effects never write into the pixels in place, they always set a new matrix,
+        so sharing is safe. The clone gets a read-only view of the pixels to keep it that way,
+        and the pixels of this image stay writable.
+
+        :return: The new Img instance
+        """
+
+        view = self._pixels.view()
+        view.flags.writeable = False
+
+        other = Img(self.path, data=view)
+        # pylint: disable=W0212
+        other._canvas = self._canvas
+        # pylint: enable=W0212
+        return other
+
+    def save_img(self, options: EncodeOptions = None):
+        """
+        Saves the image as a file by the path in self.path,
+        with '_filtered' added to the name of the file.
+
+        :param options: Optional. EncodeOptions to select the format and quality.
+        Default is None, to save in the format of the original file.
+        :return: The path of the saved file
+        """
+
+        # File destination path. The suffix is replaced if a format is selected
+        suffix = options.suffix if options else self.path.suffix
+        new_path = self.path.with_name(self.path.stem + '_filtered' + suffix)
 
         # Save the image to a file
-        image.save(new_path)
+        self.encode_time, self.encoded_size = ImgEncoder.encode(self.data, new_path, options)
 
         #return the path of the saved file
         return new_path
 
+    def encode(self, options: EncodeOptions):
+        """
+        Encodes the image in memory
+
+        :param options: Required. EncodeOptions to select the format and quality.
+        :return: The encoded image as bytes
+        """
+
+        buffer = io.BytesIO()
+        self.encode_time, self.encoded_size = ImgEncoder.encode(self.data, buffer, options)
+
+        return buffer.getvalue()
+
     def delete(self):
         """
         Delete the image file
@@ -60,6 +212,37 @@ class Img:
         except OSError as error:
             return error
 
+
+    def convolve(self, kernel, border = 'valid', divisor = 1, offset = 0):
+        """
+        Convolve each channel of the image with a kernel.
+        The method (direct, separable or FFT) is selected by the kernel.
+        :param kernel: 2D array-like of the weights, applied as is (not flipped).
+        :param border: How the pixels beyond the edges are filled:
+        'valid' (none, the image shrinks by the kernel size - 1), 'edge', 'reflect' or 'constant'.
+        :param divisor: The weighted sums are divided by it. Sums of integer kernels
+        are rounded down, as averages are, and the rest are rounded to the nearest integer.
+        :param offset: Added to the weighted sums after the division.
+        :return:
+        """
+
+        result = Convolution.convolve(self.data, kernel, border)
+        if np.issubdtype(result.dtype, np.floating):
+            result = np.rint(result / divisor)
+        elif divisor != 1:
+            result //= divisor
+        if offset:
+            result += offset
+
+        # Clip only if the kernel can move the sums out of the range of pixels
+        kernel = np.asarray(kernel)
+        lowest = kernel[kernel < 0].sum() * 255 / divisor + offset
+        highest = kernel[kernel > 0].sum() * 255 / divisor + offset
+        if lowest < 0 or highest > 255:
+            np.clip(result, 0, 255, out=result)
+
+        self.data = result.astype(np.uint8)
+
     def blur(self, blur_level=16):
         """
         Blurs the image
@@ -69,76 +252,118 @@ class Img:
         :return:
         """
 
-        # pylint: disable=R0914
-        result = []
-        for i in range(len(self.data) - blur_level + 1):
-            row_result = []
-            for j in range(len(self.data[0]) - blur_level + 1):
-                sub_matrix = [row[j:j + blur_level] for row in self.data[i:i + blur_level]]
+        # The average of each (blur_level x blur_level) window. The box kernel
+        # is convolved by running sums, so the cost per pixel does not depend on blur_level
+        self.convolve(Kernels.box(blur_level), divisor=blur_level * blur_level)
 
-                # Iterate through the sub_matrix
-                sum_r, sum_g, sum_b = 0, 0, 0
-                total_pixels = 0
+    def contour(self):
+        """
+        Contour effect
+        """
 
-                # Iterate through each pixel
-                for row in sub_matrix:
-                    for pixel in row:
-                        r, g, b = pixel
-                        sum_r += r
-                        sum_g += g
-                        sum_b += b
-                        total_pixels += 1
+        # Calculating the sum of the RGB values of each pixel
+        sums = self.data.sum(axis=2, dtype=np.int16)
+        # Collecting the difference between each pixel and the previous pixel in the row,
+        # starting from index 1, and averaging it over the 3 channels
+        diff = np.abs(Convolution.convolve(sums, [[1, -1]])) // 3
 
-                # Calculate the average RGB values
-                average_r = sum_r // total_pixels
-                average_g = sum_g // total_pixels
-                average_b = sum_b // total_pixels
+        # Set the same value for each channel
+        self.data = np.repeat(diff.astype(np.uint8)[:, :, np.newaxis], 3, axis=2)
 
-                # average_b = sum(sum(sub_row[:, 2]) for sub_row in sub_matrix) // filter_sum
-                row_result.append([average_r, average_g, average_b])
-            result.append(row_result)
+    def sharpen(self, amount = 1):
+        """
+        Sharpens the image
+        :param amount: How much the differences between neighbour pixels are
+        increased: positive integer.
+        :return:
+        """
 
-        self.data = result
-        # pylint: enable=R0914
+        self.convolve(Kernels.sharpen(amount))
 
-    def contour(self):
+    def emboss(self):
         """
-        Contour effect
+        Emboss effect, as if the image is pressed into paper lit from the top left
+        """
+
+        self.convolve(Kernels.EMBOSS)
+
+    def edges(self):
+        """
+        Edge detection effect, by the Sobel gradient of the grayscale image
         """
 
-        # Iterate over the rows in the matrix
-        for i, row in enumerate(self.data):
-            result = []
-            # Iterate over the pixels in the row
-            # Start from index 1, and looking back at the previous pixel
-            for j in range(1, len(row)):
-                # Calculating the average value of the RGB values
-                # in the current and previous pixel
-                # then, Collecting the difference between the
-                # current pixel average and the previous average
-                result.append([abs(sum(row[j-1]) - sum(row[j])) // 3] * 3)
+        gray = _luminance(self.data)
+        horizontal = Convolution.convolve(gray, Kernels.SOBEL)
+        vertical = Convolution.convolve(gray, Kernels.SOBEL.T)
+        # The strongest gradient is 4 times the largest pixel value in each direction
+        magnitude = np.clip(np.hypot(horizontal, vertical) / 4, 0, 255)
+
+        # Set the same value for each channel
+        self.data = np.repeat(magnitude.astype(np.uint8)[:, :, np.newaxis], 3, axis=2)
+
+    def gaussian_blur(self, radius = 4):
+        """
+        Blurs the image smoothly, weighting the pixels by their distance
+        :param radius: The radius of the blur in pixels: positive integer.
+        :return:
+        """
 
-            self.data[i] = result
+        self.convolve(Kernels.gaussian(radius))
 
     def rotate(self, angle = 90):
         """
         Rotates the image clockwise
         """
 
-        # rotate twice for 180 degrees
+        # Number of clockwise quarter turns:
+        # 180 degrees is 2, 270/-90 degrees is 3, and 90 degrees is 1
         if angle == 180:
-            self.rotate()
-        # rotate 3 times for 270/-90  degrees
+            turns = 2
         elif angle in (-90, 270):
-            self.rotate()
-            self.rotate()
+            turns = 3
+        else:
+            turns = 1
+
+        # Rotate the placement of the pixels on a pending canvas
+        if self._canvas is not None:
+            height, width, top, left, bg_color = self._canvas
+            pixels_height, pixels_width = self._pixels.shape[:2]
+            for _ in range(turns):
+                height, width, top, left = width, height, left, height - top - pixels_height
+                pixels_height, pixels_width = pixels_width, pixels_height
+            self._canvas = (height, width, top, left, bg_color)
+
+        # A view of the pixels, rotated clockwise (negative turns of np.rot90)
+        self._pixels = np.rot90(self._pixels, -turns)
+
+    def flip(self, direction = 'horizontal'):
+        """
+        Flips the image like a mirror
+
+        :param direction: 'horizontal' to flip left and right,
+        or 'vertical' to flip top and bottom. Default is 'horizontal'.
+        """
 
-        # Transpose the Matrix
-        transposed_mat = list(zip(*self.data))
-        # Reverse each row of the transposed matrix
-        self.data = [list(reversed(row)) for row in transposed_mat]
+        pixels_height, pixels_width = self._pixels.shape[:2]
 
-    def salt_n_pepper(self, strength = 0.2, salt = (255, 255, 255), pepper = (0, 0, 0)):
+        if direction == 'horizontal':
+            # Flip the placement of the pixels on a pending canvas
+            if self._canvas is not None:
+                height, width, top, left, bg_color = self._canvas
+                self._canvas = (height, width, top, width - left - pixels_width, bg_color)
+            # A view of the pixels, with the columns in reversed order
+            self._pixels = self._pixels[:, ::-1]
+
+        elif direction == 'vertical':
+            if self._canvas is not None:
+                height, width, top, left, bg_color = self._canvas
+                self._canvas = (height, width, height - top - pixels_height, left, bg_color)
+            # A view of the pixels, with the rows in reversed order
+            self._pixels = self._pixels[::-1]
+
+    # pylint: disable=R0913
+    def salt_n_pepper(self, strength = 0.2, salt = (255, 255, 255), pepper = (0, 0, 0),
+                      seed = None):
         """
         Adds Salt and Pepper effect to the image
 
@@ -147,47 +372,43 @@ class Img:
         with the value of 0 - 255. Default is white.
         :param pepper: The color of the pepper: list or tuple of 3 integers
         with the value of 0 - 255. Default is black.
+        :param seed: The seed of the random values, for a reproducible result:
+        positive integer, or a numpy.random.Generator to draw from.
+        Default is None, for a different result each time.
         """
 
-        # Iterate over all the pixel, with y as the index of the row
-        # and x for the index of the pixel in the row
-        for y, row in enumerate(self.data):
-            for x, _ in enumerate(row):
-                # random value between 0 - 1
-                rand_val = random.random()
-                # if the random value is smaller than strength,
-                # turn the pixel to the color of 'salt'
-                if rand_val < strength:
-                    self.data[y][x] = salt
-                # if the random value is bigger than 1 - strength,
-                # turn the pixel to the color of 'pepper'
-                elif rand_val > 1 - strength:
-                    self.data[y][x] = pepper
+        # random value between 0 - 1, for each pixel
+        rng = np.random.default_rng(seed)
+        rand_val = rng.random(self.data.shape[:2], dtype=np.float32)[:, :, np.newaxis]
+
+        # if the random value is smaller than strength,
+        # turn the pixel to the color of 'salt'.
+        # if the random value is bigger than 1 - strength,
+        # turn the pixel to the color of 'pepper'
+        data = np.where(rand_val < strength, _to_pixel(salt), self.data)
+        self.data = np.where(rand_val > 1 - strength, _to_pixel(pepper), data)
+    # pylint: enable=R0913
 
-    def color_noise(self, strength = 0.2):
+    def color_noise(self, strength = 0.2, seed = None):
         """
         Adds colorful noise to the image
 
         :param strength: How strong the effect will be: float between 0 - 0.5.
+        :param seed: The seed of the random values, for a reproducible result:
+        positive integer, or a numpy.random.Generator to draw from.
+        Default is None, for a different result each time.
         """
 
-        # Iterate over each color channel, in all the pixel,
-        # with y as the index of the row,
-        for y, row in enumerate(self.data):
-            # x for the index of the pixel in the row,
-            for x, pixel in enumerate(row):
-                # and ci as the index of the channel
-                for c, _ in enumerate(pixel):
-                    # random value between 0 - 1
-                    rand_val = random.random()
-                    # if the random value is smaller than strength,
-                    # turn this channel to be fully lit
-                    if rand_val < strength:
-                        self.data[y][x][c] = 255
-                    # if the random value is bigger than 1 - strength,
-                    # turn this channel to be fully off
-                    elif rand_val > 1 - strength:
-                        self.data[y][x][c] = 0
+        # random value between 0 - 1, for each channel of each pixel
+        rng = np.random.default_rng(seed)
+        rand_val = rng.random(self.data.shape, dtype=np.float32)
+
+        # if the random value is smaller than strength,
+        # turn this channel to be fully lit.
+        # if the random value is bigger than 1 - strength,
+        # turn this channel to be fully off
+        data = np.where(rand_val < strength, np.uint8(255), self.data)
+        self.data = np.where(rand_val > 1 - strength, np.uint8(0), data)
 
     def segment(self, threshold = 100, black = (0, 0, 0), white = (255, 255, 255)):
         """
@@ -207,13 +428,14 @@ class Img:
         # instead of the sum divided by 3 each pixel
         threshold *= 3
 
-        # Iterate over all the pixel, with y as the index of the row
-        # and x for the index of the pixel in the row
-        for y, row in enumerate(self.data):
-            for x, pixel in enumerate(row):
-                # if the average of a pixel is above the threshold,
-                # it will turn white, otherwise it will turn black
-                self.data[y][x] = white if sum(pixel) > threshold else black
+        # if the average of a pixel is above the threshold,
+        # it will turn white, otherwise it will turn black
+        mask = self.data.sum(axis=2, dtype=np.uint16) > threshold
+        self.data = np.where(
+            mask[:, :, np.newaxis],
+            _to_pixel(white),
+            _to_pixel(black)
+        )
 
     def concat(self, other_img, direction='horizontal', bg_color = (255, 255, 255)):
         """
@@ -226,44 +448,132 @@ class Img:
         list or tuple of 3 integers with the value of 0 - 255. Default is white.
         """
 
-        if direction == 'horizontal':
-            # Resize the two images to match each other height
-            if len(self.data) < len(other_img.data):
-                self.canvas_resize(len(self.data[0]), len(other_img.data), bg_color)
-            elif len(other_img.data) < len(self.data):
-                # set "other_img" to a new deep copy, so the original data will not be altered
-                other_img = Img(other_img.path)
-                other_img.canvas_resize(len(other_img.data[0]), len(self.data), bg_color)
-
-            # Join the rows of both images
-            for ri, row in enumerate(self.data):
-                self.data[ri] = row + other_img.data[ri]
+        if direction in ('horizontal', 'vertical'):
+            self.collage([other_img], direction, bg_color)
 
-        elif direction == 'vertical':
-            # Resize the two images to match each other width
-            if len(self.data[0]) < len(other_img.data[0]):
-                self.canvas_resize(len(other_img.data[0]), len(self.data), bg_color)
-            elif len(other_img.data[0]) < len(self.data[0]):
-                # set "other_img" to a new deep copy, so the original data will not be altered
-                other_img = Img(other_img.path)
-                other_img.canvas_resize(len(self.data[0]), len(other_img.data), bg_color)
+    def collage(self, other_imgs, layout = 'horizontal', bg_color = (255, 255, 255)):
+        """
+        Joins the current image and any amount of other images into a single image.
+        The size of the result is calculated once, and each image is copied into it once.
+
+        :param other_imgs: The images to be added after the current image:
+        list of instances of Img class
+        :param layout: How to place the images: 'horizontal' for a single row,
+        'vertical' for a single column, or 'grid' for rows of the same amount of images
+        (the square root of the amount of images, rounded up). 'horizontal' is default.
+        :param bg_color: The color of the pixels that the images do not cover:
+        list or tuple of 3 integers with the value of 0 - 255. Default is white.
+        """
 
-            # Append the rows of the second image after the first
-            self.data = self.data + other_img.data
+        imgs = [self, *other_imgs]
+
+        # The amount of images in each row
+        if layout == 'vertical':
+            columns = 1
+        elif layout == 'grid':
+            columns = math.ceil(math.sqrt(len(imgs)))
+        else:
+            columns = len(imgs)
+
+        # Calculate the position of each image: rows of images from left to right,
+        # with the height of each row as its highest image
+        positions = []
+        top, width = 0, 0
+        for row_start in range(0, len(imgs), columns):
+            row = imgs[row_start:row_start + columns]
+            left = 0
+            for img in row:
+                positions.append((top, left))
+                left += img.width
+            width = max(width, left)
+            top += max(img.height for img in row)
+
+        # Allocate the result once, and copy each image into its position
+        canvas = PixelBuffer.empty((top, width, 3))
+        canvas[:, :] = _to_pixel(bg_color)
+        for img, (img_top, img_left) in zip(imgs, positions):
+            # pylint: disable=W0212
+            img._draw(canvas, img_top, img_left)
+            # pylint: enable=W0212
+
+        self.data = canvas
+
+    def _draw(self, canvas, top, left):
+        """
+        Copy the image into a position on a canvas,
+        including its pending canvas, without materializing it
+
+        :param canvas: numpy array of shape (height, width, 3) to copy the image into.
+        :param top: The row on the canvas of the top left corner of the image.
+        :param left: The column on the canvas of the top left corner of the image.
+        """
+
+        if self._canvas is not None:
+            height, width, pixels_top, pixels_left, bg_color = self._canvas
+            canvas[top:top + height, left:left + width] = _to_pixel(bg_color)
+            top, left = top + pixels_top, left + pixels_left
+
+        pixels_height, pixels_width = self._pixels.shape[:2]
+        canvas[top:top + pixels_height, left:left + pixels_width] = self._pixels
 
     def grayscale(self):
         """
         Turns the image to be in the shades of gray.
         """
 
-        # Iterate over all rows of the matrix
-        for ri, row in enumerate(self.data):
-            # Iterate over each pixel in the row
-            for ci, pixel in enumerate(row):
-                # Setting a value of grayscale according to the RGB values,
-                # and setting the same grayscale value for each channel
-                self.data[ri][ci] = [int(0.2989 * pixel[0] + 0.5870
-                                     * pixel[1] + 0.1140 * pixel[2])] * 3
+        # Setting a value of grayscale according to the RGB values,
+        # and setting the same grayscale value for each channel
+        gray = _luminance(self.data)
+        self.data = np.repeat(gray[:, :, np.newaxis], 3, axis=2)
+
+    def apply_lut(self, kind, table):
+        """
+        Set each pixel by a lookup table, in a single pass over the image.
+        The tables are compiled from a run of point effects by PointLutCompiler.
+
+        :param kind: The value each pixel is looked up with: one of LutKind.
+        :param table: numpy array of dtype uint8, with a row of RGB values
+        for each value that can be looked up.
+        """
+
+        if kind == LutKind.CHANNEL:
+            # Look up each channel in its own column of the table
+            self.data = np.stack(
+                [table[self.data[:, :, c], c] for c in range(3)], axis=2
+            )
+        elif kind == LutKind.SUM:
+            self.data = table[self.data.sum(axis=2, dtype=np.uint16)]
+        elif kind == LutKind.GRAY:
+            self.data = table[_luminance(self.data)]
+
+    def crop(self, width, height):
+        """
+        Crop the image to the given size, from the top left corner.
+        Dimensions that are already smaller are left as is.
+
+        :param width: The maximum width in pixels: positive integer.
+        :param height: The maximum height in pixels: positive integer.
+        """
+
+        self.canvas_resize(min(width, self.width), min(height, self.height))
+
+    def downscale(self, max_side):
+        """
+        Shrink the image, keeping its aspect ratio, so its long side is at most max_side.
+        Pixels are sampled by the nearest neighbor, which is fast and good enough for previews.
+        Images that are already small enough are left as is.
+
+        :param max_side: The maximum width and height in pixels: positive integer.
+        """
+
+        height, width = self.height, self.width
+        scale = max_side / max(width, height)
+        if scale >= 1:
+            return
+
+        rows = (np.arange(max(round(height * scale), 1)) / scale).astype(np.intp)
+        cols = (np.arange(max(round(width * scale), 1)) / scale).astype(np.intp)
+        self.data = self.data[rows[:, np.newaxis], cols]
 
     def canvas_resize(self, width, height, bg_color = (255, 255, 255)):
         """
@@ -276,25 +586,27 @@ class Img:
         :return:
         """
 
-        # if cropping the height of the image
-        if len(self.data) > height:
-            # Slicing the rows of the matrix according to the value of 'height'
-            self.data = self.data[:height]
-        # if enlarging the height of the image
-        elif len(self.data) < height:
-            # appending rows at the length of self.data[0], with the value of 'bg_color'
-            self.data = self.data + ([[bg_color] * len(self.data[0])] * (height - len(self.data)))
-
-        # If cropping the width of the image
-        if len(self.data[0]) > width:
-            # Slicing each row of the matrix to the value of 'width'
-            for ri, row in enumerate(self.data):
-                self.data[ri] = row[:width]
-        # If enlarging the width of the image
-        elif len(self.data[0]) < width:
-            # Adding the missing pixels at the end of each row to the length of 'width;
-            for ri, row in enumerate(self.data):
-                self.data[ri] = row + [bg_color] * (width - len(row))
+        if self._canvas is None:
+            top, left = 0, 0
+        else:
+            _, _, top, left, canvas_color = self._canvas
+
+            # The pending canvas can hold only a single color. If new areas with
+            # another color are uncovered, place the pixels on the pending canvas first
+            if height <= self.height and width <= self.width:
+                bg_color = canvas_color
+            elif tuple(bg_color) != tuple(canvas_color):
+                top, left = 0, 0
+                self._pixels = self.data
+
+        # Crop the pixels that are not covered by the new canvas (as a view),
+        # and leave the padding pending
+        pixels_height, pixels_width = self._pixels.shape[:2]
+        self._pixels = self._pixels[
+            :max(0, min(pixels_height, height - top)),
+            :max(0, min(pixels_width, width - left))
+        ]
+        self.__set_canvas(height, width, top, left, bg_color)
 
     def rgb_posterize(self, threshold = 100):
         """
@@ -306,16 +618,9 @@ class Img:
         integer between 0 - 255. Default is 100.
         """
 
-        # Iterate over each channel in each pixel in the matrix
-        # where y is the index of the row
-        for y, row in enumerate(self.data):
-            # x is the index of the pixel in the row
-            for x, pixel in enumerate(row):
-                # ci is the index of the channel
-                for ci, channel in enumerate(pixel):
-                    # if the value of the channel is larger than the threshold,
-                    # it will set to full (255). Otherwise, it will set to empty (0)
-                    self.data[y][x][ci] = 255 if channel > threshold else 0
+        # if the value of the channel is larger than the threshold,
+        # it will set to full (255). Otherwise, it will set to empty (0)
+        self.data = np.where(self.data > threshold, np.uint8(255), np.uint8(0))
 
     def multiply(self, other_img):
         """
@@ -325,18 +630,22 @@ class Img:
         :param other_img: The second image to be added: instance of Img class
         """
 
-        # set "other_img" to a new deep copy, so the original data will not be altered
-        other_img = Img(other_img.path)
+        # set "other_img" to a new copy, so the original data will not be altered
+        other_img = other_img.clone()
 
-        height = max(len(self.data), len(other_img.data))
-        width = max(len(self.data[0]), len(other_img.data[0]))
+        height = max(self.height, other_img.height)
+        width = max(self.width, other_img.width)
 
         self.canvas_resize(width, height)
         other_img.canvas_resize(width, height)
 
-        for y, row in enumerate(self.data):
-            # x is the index of the pixel in the row
-            for x, pixel in enumerate(row):
-                # ci is the index of the channel
-                for ci, channel in enumerate(pixel):
-                    self.data[y][x][ci] = channel * other_img.data[y][x][ci] // 255
+        # Multiply each channel of each pixel, in a wider type to avoid overflow.
+        # A band of rows at a time, so the wide products stay small on large images
+        data, other_data = self.data, other_img.data
+        result = PixelBuffer.empty(data.shape)
+        for top in range(0, height, StripConfig.HEIGHT):
+            product = data[top:top + StripConfig.HEIGHT].astype(np.uint16)
+            product *= other_data[top:top + StripConfig.HEIGHT]
+            product //= 255
+            result[top:top + StripConfig.HEIGHT] = product
+        self.data = result
@@ -0,0 +1,293 @@
+"""
+Execution of image processing jobs in a pool of worker processes,
+so the effects of different users run on different cores,
+and do not block the threads that handle the incoming messages
+"""
+
+import time
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+# pylint: disable=E0401
+from polybot.effect_pipeline import EffectPipeline
+from polybot.error import JobFailedError, JobTimeoutError
+from polybot.img_codec import EncodeOptions
+from polybot.img_proc import Img
+from polybot.metrics import Metrics
+# pylint: enable=E0401
+
+
+# pylint: disable=R0902, R0903
+class JobResult:
+    """
+    The result of an image processing job, and the time each of its stages took
+    """
+
+    def __init__(self, data: bytes, plan: str, strip_height: int = None):
+        # The encoded result image
+        self.data = data
+        # The description of the executed plan
+        self.plan = plan
+        self.strip_height = strip_height
+        self.options = None
+        self.encoded_size = 0
+        # The amount of pixels of the decoded image the result is drawn on
+        self.pixels = 0
+        # Whether this is a downscaled preview of the result
+        self.preview = False
+        # Times in seconds
+        self.decode_times = []
+        self.process_time = 0.0
+        self.encode_time = 0.0
+        # Execution time of each effect, by its name
+        self.effect_times = {}
+        # Unix times the job started and finished at, in the worker
+        self.started = 0.0
+        self.finished = 0.0
+# pylint: enable=R0902, R0903
+
+
+def run_job(pipeline: EffectPipeline, photos: list, preview_side: int = None):
+    """
+    Decode the photos, execute the pipeline on them, and encode the result, all in memory.
+    Runs in a worker process, so everything it gets and returns is pickled.
+
+    :param pipeline: Required. The EffectPipeline to execute.
+    :param photos: Required. The list of the downloaded photos, as encoded bytes.
+           The first one is the image the result is drawn on.
+    :param preview_side: Optional. Downscale the images so their long side is at most
+           this amount of pixels, for a preview. The pipeline should be scaled accordingly.
+           Default is None (full size).
+    :return: JobResult of the job
+    """
+
+    started = time.time()
+
+    # Decode all input images as Img instances.
+    # Previews let the decoder scale JPEG images down while decoding
+    if preview_side:
+        imgs = [Img(photo, (preview_side, preview_side)) for photo in photos]
+        for img in imgs:
+            img.downscale(preview_side)
+    else:
+        imgs = list(map(Img, photos))
+    pixels = imgs[0].width * imgs[0].height
+
+    # Process the images by the plan
+    strip_height = EffectPipeline.strip_height_for(imgs[0])
+    effect_times = {}
+    process_start = time.perf_counter()
+    pipeline.execute(imgs, strip_height, effect_times)
+    process_time = time.perf_counter() - process_start
+
+    # Select the format and quality by the size of the result, and encode it
+    options = EncodeOptions.for_size(imgs[0].width, imgs[0].height)
+    result = JobResult(imgs[0].encode(options), str(pipeline), strip_height)
+    result.options = options
+    result.encoded_size = imgs[0].encoded_size
+    result.pixels = pixels
+    result.preview = bool(preview_side)
+    result.decode_times = [img.decode_time for img in imgs]
+    result.process_time = process_time
+    result.effect_times = effect_times
+    result.encode_time = imgs[0].encode_time
+    result.started = started
+    result.finished = time.time()
+
+    return result
+
+
+class JobRunner:
+    """
+    Runs image processing jobs in a pool of worker processes.
+    At most 'queue_depth' jobs are submitted at a time (queued or running),
+    the callers of further jobs wait until one of them is done.
+    With 0 workers, the jobs run in the calling thread.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, timeout: float = None):
+        """
+        :param workers: Required. The amount of worker processes.
+               0 to run the jobs in the calling thread.
+        :param queue_depth: Required. The maximum amount of jobs submitted at a time.
+        :param timeout: Optional. Seconds to wait for the result of a job.
+               Default is None (no timeout).
+        """
+
+        self.workers = workers
+        self.queue_depth = max(queue_depth, 1)
+        self.timeout = timeout
+
+        self.slots = threading.BoundedSemaphore(self.queue_depth)
+        self.lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(workers) if workers > 0 else None
+
+        # Counters of the jobs
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.total_wait_time = 0.0
+        self.total_run_time = 0.0
+
+    def submit(self, pipeline: EffectPipeline, photos: list, preview_side: int = None):
+        """
+        Submit a job, and wait for a free slot if the queue is full
+
+        :param pipeline: Required. The EffectPipeline to execute.
+        :param photos: Required. The list of the downloaded photos, as encoded bytes.
+        :param preview_side: Optional. The long side of a preview, as in run_job.
+               Default is None (full size).
+        :return: A Future of the JobResult
+        :raise JobFailedError: If the job could not be submitted.
+        """
+
+        self.slots.acquire()
+        submitted = time.time()
+        with self.lock:
+            self.pending += 1
+
+        try:
+            future = self.__submit(pipeline, photos, preview_side)
+        # Nothing was submitted, so nothing else would free the slot of the job
+        # pylint: disable=W0718
+        except Exception as error:
+            self.slots.release()
+            with self.lock:
+                self.pending -= 1
+                self.failed += 1
+            logger.error(f'Failed to submit a job: {error!r}')
+            raise JobFailedError(error) from error
+        # pylint: enable=W0718
+
+        future.add_done_callback(lambda done: self.__on_done(done, submitted))
+        return future
+
+    def run(self, pipeline: EffectPipeline, photos: list):
+        """
+        Submit a job and wait for its result
+
+        :param pipeline: Required. The EffectPipeline to execute.
+        :param photos: Required. The list of the downloaded photos, as encoded bytes.
+        :return: JobResult of the job
+        :raise JobTimeoutError: If the job did not finish within the timeout.
+        :raise JobFailedError: If the job raised an error, or its worker process died.
+        """
+
+        return self.wait(self.submit(pipeline, photos))
+
+    def wait(self, future: Future):
+        """
+        Wait for the result of a submitted job
+
+        :param future: Required. The Future of the job, as returned by submit().
+        :return: JobResult of the job
+        :raise JobTimeoutError: If the job did not finish within the timeout.
+        :raise JobFailedError: If the job raised an error, or its worker process died.
+        """
+
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError as error:
+            # A running job cannot be stopped, its slot is freed once it finishes
+            with self.lock:
+                self.timed_out += 1
+            raise JobTimeoutError(self.timeout, future) from error
+        # Any error of the job, as the worker processes may raise anything (or die)
+        # pylint: disable=W0718
+        except Exception as error:
+            raise JobFailedError(error) from error
+        # pylint: enable=W0718
+
+    def stats(self):
+        """
+        :return: A dict of the counters and average times of the jobs
+        """
+
+        with self.lock:
+            done = self.completed or 1
+            return {
+                'workers': self.workers,
+                'queue_depth': self.queue_depth,
+                'pending': self.pending,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'avg_wait_time': self.total_wait_time / done,
+                'avg_run_time': self.total_run_time / done,
+            }
+
+    def shutdown(self):
+        """
+        Wait for the submitted jobs, and stop the worker processes
+        """
+
+        if self.executor:
+            self.executor.shutdown()
+
+    def __submit(self, pipeline: EffectPipeline, photos: list, preview_side: int = None):
+        """
+        Submit a job to the pool, or run it in the calling thread with no workers
+
+        :param pipeline: Required. The EffectPipeline to execute.
+        :param photos: Required. The list of the downloaded photos, as encoded bytes.
+        :param preview_side: Optional. The long side of a preview, as in run_job.
+               Default is None (full size).
+        :return: A Future of the JobResult
+        """
+
+        executor = self.executor
+        if executor is None:
+            future = Future()
+            try:
+                future.set_result(run_job(pipeline, photos, preview_side))
+            # The error is raised by future.result(), as for the workers
+            # pylint: disable=W0718
+            except Exception as error:
+                future.set_exception(error)
+            # pylint: enable=W0718
+            return future
+
+        try:
+            return executor.submit(run_job, pipeline, photos, preview_side)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory), start a new pool for the next jobs,
+            # unless another thread has already started one
+            with self.lock:
+                if self.executor is executor:
+                    logger.error('The job worker pool is broken, restarting it')
+                    self.executor = ProcessPoolExecutor(self.workers)
+                executor = self.executor
+            return executor.submit(run_job, pipeline, photos, preview_side)
+
+    def __on_done(self, future: Future, submitted: float):
+        """
+        Free the slot of a finished job, and record its times
+
+        :param future: Required. The Future of the finished job.
+        :param submitted: Required. The Unix time the job was submitted at.
+        """
+
+        self.slots.release()
+
+        error = future.exception()
+        with self.lock:
+            self.pending -= 1
+            if error:
+                self.failed += 1
+            else:
+                result = future.result()
+                self.completed += 1
+                self.total_wait_time += result.started - submitted
+                self.total_run_time += result.finished - result.started
+            pending = self.pending
+
+        if error:
+            logger.error(f'Job failed: {error!r} ({pending} pending)')
+        else:
+            Metrics.STAGE_SECONDS.observe(result.started - submitted, stage='job_wait')
+            logger.info(
+                f'Job done: waited {result.started - submitted:.3f}s, '
+                f'ran {result.finished - result.started:.3f}s ({pending} pending)'
+            )
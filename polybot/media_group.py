@@ -0,0 +1,153 @@
+"""
+Aggregation of photo messages that are sent together as a media group (album)
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+
+# pylint: disable=R0903
+class MediaGroup:
+    """
+    Holds the messages of a single media group, and the downloads of their photos
+    """
+
+    def __init__(self, group_id: str):
+        self.group_id = group_id
+        self.msgs = []
+        # Futures of the downloaded photos, by the order of self.msgs
+        self.downloads = []
+        # The amount of messages that completes the group, or None if not known yet
+        self.expected_size = None
+        # Timer to flush the group when no more messages arrive
+        self.timer = None
+# pylint: enable=R0903
+
+
+class MediaGroupAggregator:
+    """
+    Collects the photo messages that share a 'media_group_id'.
+    The photo of each message starts downloading as soon as it arrives.
+    A group is flushed once it has the expected amount of messages,
+    or when no new message arrived for 'idle_timeout' seconds.
+    """
+
+    # How long to remember flushed and discarded groups, to ignore their late messages
+    CLOSED_TIMEOUT = 60
+
+    # pylint: disable=R0913
+    def __init__(self, download_func, flush_func,
+                 idle_timeout: float = 1.0, max_size: int = 10, download_workers: int = 4):
+        """
+        :param download_func: Required. Function that downloads the photo of a message,
+               and returns it.
+        :param flush_func: Required. Function that is called with the list of messages
+               and the list of their downloaded photos, once a group is flushed.
+        :param idle_timeout: Optional. Seconds without new messages to flush a group.
+        :param max_size: Optional. The maximum amount of messages in a group.
+               Telegram allows up to 10. Default is 10.
+        :param download_workers: Optional. The amount of concurrent downloads. Default is 4.
+        """
+
+        self.download_func = download_func
+        self.flush_func = flush_func
+        self.idle_timeout = idle_timeout
+        self.max_size = max_size
+
+        self.groups = {}
+        # Unix time each group was flushed or discarded at, by the group ID
+        self.closed = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(download_workers, 'media-group-download')
+    # pylint: enable=R0913
+
+    def add(self, msg, expected_size: int = None):
+        """
+        Add a message to its media group, and start downloading its photo
+
+        :param msg: Required. A photo message with 'media_group_id'.
+        :param expected_size: Optional. The amount of messages that completes the group,
+               if this message knows it (e.g. by the effects in its caption).
+        """
+
+        group_id = msg['media_group_id']
+
+        with self.lock:
+            self.__clean_closed()
+
+            # Ignore late messages of groups that are already handled
+            if group_id in self.closed:
+                return
+
+            group = self.groups.setdefault(group_id, MediaGroup(group_id))
+            group.msgs.append(msg)
+            group.downloads.append(self.executor.submit(self.download_func, msg))
+
+            if expected_size:
+                group.expected_size = min(expected_size, self.max_size)
+
+            # Restart the idle timer
+            if group.timer:
+                group.timer.cancel()
+
+            complete = len(group.msgs) >= (group.expected_size or self.max_size)
+            if not complete:
+                group.timer = threading.Timer(self.idle_timeout, self.flush, [group_id])
+                group.timer.daemon = True
+                group.timer.start()
+
+        if complete:
+            self.flush(group_id)
+
+    def discard(self, group_id: str):
+        """
+        Drop a media group, and ignore its future messages
+
+        :param group_id: Required. The 'media_group_id' of the group.
+        """
+
+        with self.lock:
+            group = self.groups.pop(group_id, None)
+            self.closed[group_id] = time.time()
+
+        if group and group.timer:
+            group.timer.cancel()
+
+    def flush(self, group_id: str):
+        """
+        Wait for the downloads of a media group, and pass it to 'flush_func'
+
+        :param group_id: Required. The 'media_group_id' of the group.
+        """
+
+        with self.lock:
+            group = self.groups.pop(group_id, None)
+            self.closed[group_id] = time.time()
+
+        # Already flushed
+        if group is None:
+            return
+
+        if group.timer:
+            group.timer.cancel()
+
+        try:
+            photos = [download.result() for download in group.downloads]
+            self.flush_func(group.msgs, photos)
+        # Flushes may run on a timer thread, where nothing else would log the error
+        # pylint: disable=W0718
+        except Exception:
+            logger.exception(f'Failed to handle media group {group_id}')
+        # pylint: enable=W0718
+
+    def __clean_closed(self):
+        """
+        Forget groups that were closed longer than CLOSED_TIMEOUT ago
+        """
+
+        now = time.time()
+        for group_id in [group_id for group_id, closed_at in self.closed.items()
+                         if now - closed_at > MediaGroupAggregator.CLOSED_TIMEOUT]:
+            del self.closed[group_id]
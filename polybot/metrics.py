@@ -0,0 +1,268 @@
+"""
+Counters, gauges and histograms of the app,
+rendered in the Prometheus text format for the '/metrics' route
+"""
+
+import bisect
+import threading
+
+
+def _escape(value):
+    """
+    Escape a label value for the Prometheus text format
+    """
+
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels_text(names: tuple, values: tuple, extra: str = ''):
+    """
+    Render a set of labels, e.g. '{effect="blur",le="0.1"}'
+    """
+
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """
+    Base of all metrics: a named value for each combination of label values
+    """
+
+    TYPE = None
+
+    def __init__(self, name: str, description: str, label_names: tuple = ()):
+        """
+        :param name: Required. The name of the metric, e.g. 'polybot_updates_total'.
+        :param description: Required. The help text of the metric.
+        :param label_names: Optional. The names of the labels. Default is no labels.
+        """
+
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels: dict):
+        """
+        :param labels: Required. The label values by their names.
+        :return: Tuple of the label values, by the order of the label names
+        """
+
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self):
+        """
+        :return: The lines of the metric in the Prometheus text format
+        """
+
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.TYPE}']
+        with self.lock:
+            for key, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+                lines.extend(self.render_value(key, value))
+        return lines
+
+    def render_value(self, key: tuple, value):
+        """
+        :return: The lines of a single value of the metric
+        """
+
+        return [f'{self.name}{_labels_text(self.label_names, key)} {value}']
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, e.g. the amount of handled messages
+    """
+
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increase the counter
+
+        :param amount: Optional. The amount to add. Default is 1.
+        :param labels: The label values by their names.
+        """
+
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, e.g. the size of a cache
+    """
+
+    TYPE = 'gauge'
+
+    def set(self, value: float, **labels):
+        """
+        Set the gauge
+
+        :param value: Required. The new value.
+        :param labels: The label values by their names.
+        """
+
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """
+    Counts observed values by buckets of upper bounds, e.g. the durations of effects
+    """
+
+    TYPE = 'histogram'
+
+    # Upper bounds in seconds, from 1ms to 1 minute
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                       1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, name: str, description: str, label_names: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        """
+        :param buckets: Optional. The sorted upper bounds of the buckets.
+               Default is DEFAULT_BUCKETS. The other parameters are as in Metric.
+        """
+
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        """
+        Count an observed value
+
+        :param value: Required. The observed value.
+        :param labels: The label values by their names.
+        """
+
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            # Counts of each bucket (not cumulative) and of '+Inf', and the sum
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def render_value(self, key: tuple, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), counts):
+            cumulative += count
+            labels = _labels_text(self.label_names, key, f'le="{bound}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+
+        labels = _labels_text(self.label_names, key)
+        lines.append(f'{self.name}_sum{labels} {total}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds all the metrics of the app, and renders them together.
+    Collectors are functions that are called before rendering,
+    to set the gauges that are read from other objects (e.g. the sizes of caches).
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric: Metric):
+        """
+        Add a metric to the registry
+
+        :param metric: Required. The metric.
+        :return: The metric
+        """
+
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Add a function to call before rendering
+
+        :param collector: Required. Function with no arguments.
+        """
+
+        self.collectors.append(collector)
+
+    def render(self):
+        """
+        :return: All the metrics in the Prometheus text format
+        """
+
+        for collector in self.collectors:
+            collector()
+
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+# pylint: disable=R0903
+class Metrics:
+    """
+    All the metrics of the app
+    """
+
+    # Content type of the rendered metrics
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    UPDATES = REGISTRY.register(Counter(
+        'polybot_updates_total',
+        'Incoming updates, by what was done with them (accepted, rejected or ignored)',
+        ('result',)
+    ))
+    EFFECT_SECONDS = REGISTRY.register(Histogram(
+        'polybot_effect_seconds',
+        'Execution time of each effect in the plan',
+        ('effect',)
+    ))
+    STAGE_SECONDS = REGISTRY.register(Histogram(
+        'polybot_stage_seconds',
+        'Duration of each stage of handling a photo '
+        '(queue, download, job_wait, decode, process, encode, preview, upload)',
+        ('stage',)
+    ))
+    ERRORS = REGISTRY.register(Counter(
+        'polybot_errors_total',
+        'Error replies, by the error type',
+        ('error_type',)
+    ))
+    RESULT_CACHE_LOOKUPS = REGISTRY.register(Counter(
+        'polybot_result_cache_lookups_total',
+        'Lookups of the result cache, by the result (hit or miss)',
+        ('result',)
+    ))
+    CACHE_ENTRIES = REGISTRY.register(Gauge(
+        'polybot_cache_entries',
+        'The amount of entries in each cache',
+        ('cache',)
+    ))
+    CACHE_BYTES = REGISTRY.register(Gauge(
+        'polybot_cache_bytes',
+        'The size of each cache in bytes',
+        ('cache',)
+    ))
+    QUEUE_DEPTH = REGISTRY.register(Gauge(
+        'polybot_queue_depth',
+        'The amount of items waiting in each queue (updates, or jobs including running ones)',
+        ('queue',)
+    ))
+# pylint: enable=R0903
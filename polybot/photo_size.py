@@ -0,0 +1,74 @@
+"""
+Selection of the size of a photo to download.
+Telegram keeps each photo in a few sizes (e.g. up to 320, 800, 1280 and 2560 pixels),
+and the largest is rarely needed, as the results are displayed at a smaller size.
+Smaller photos are faster to download, decode and process.
+"""
+
+# pylint: disable=E0401
+from polybot.config import PhotoSizeConfig
+# pylint: enable=E0401
+
+
+class PhotoSizeSelector:
+    """
+    A static class that selects the smallest size of a photo that is adequate by a policy:
+    'max' always selects the largest size,
+    'balanced' selects the smallest size with a long side of at least BALANCED_SIDE,
+    and 'fastest' selects the smallest size with a long side of at least FASTEST_SIDE.
+    """
+
+    POLICIES = ('max', 'balanced', 'fastest')
+
+    @staticmethod
+    def min_side(policy: str):
+        """
+        :param policy: Required. One of POLICIES.
+        :return: The minimum long side in pixels of the selected size, or None for the largest
+        """
+
+        if policy == 'balanced':
+            return PhotoSizeConfig.BALANCED_SIDE
+        if policy == 'fastest':
+            return PhotoSizeConfig.FASTEST_SIDE
+        return None
+
+    @staticmethod
+    def select(sizes: list, pipeline = None, policy: str = None):
+        """
+        Select the size of a photo to download
+
+        :param sizes: Required. The sizes of the photo, as in msg['photo'],
+               from the smallest to the largest.
+        :param pipeline: Optional. The EffectPipeline to process the photo with.
+               Pipelines that need the full resolution always get the largest size.
+               Default is None (select by the policy only).
+        :param policy: Optional. One of POLICIES. Default is None, for PhotoSizeConfig.POLICY.
+        :return: The selected size, as one of the items of 'sizes'
+        """
+
+        largest = sizes[-1]
+        min_side = PhotoSizeSelector.min_side(policy or PhotoSizeConfig.POLICY)
+        if min_side is None or (pipeline is not None and pipeline.needs_full_resolution()):
+            return largest
+
+        adequate = [size for size in sizes
+                    if max(size.get('width', 0), size.get('height', 0)) >= min_side]
+        if not adequate:
+            return largest
+
+        return min(adequate, key=lambda size: size['width'] * size['height'])
+
+    @staticmethod
+    def scale(size: dict, sizes: list):
+        """
+        :param size: Required. The selected size of the photo.
+        :param sizes: Required. The sizes of the photo, as in msg['photo'].
+        :return: The size of the selected size relative to the largest size
+        """
+
+        largest = sizes[-1]
+        if not size.get('width') or not largest.get('width'):
+            return 1.0
+
+        return size['width'] / largest['width']
@@ -0,0 +1,77 @@
+"""
+Backing store of pixel matrices.
+Matrices of at least PixelBufferConfig.MIN_BYTES are kept in memory-mapped scratch files
+instead of the heap, so the kernel can write their pages back and drop them under memory
+pressure, and the memory a job keeps resident does not grow with the size of its images.
+"""
+
+import mmap
+import tempfile
+import numpy as np
+# pylint: disable=E0401
+from polybot.config import PixelBufferConfig
+# pylint: enable=E0401
+
+
+class PixelBuffer:
+    """
+    A static class that allocates pixel matrices, on the heap or in scratch files by their size
+    """
+
+    @staticmethod
+    def mapped(nbytes: int):
+        """
+        :param nbytes: Required. The size of a matrix in bytes.
+        :return: True if a matrix of this size is kept in a scratch file
+        """
+
+        return 0 < PixelBufferConfig.MIN_BYTES <= nbytes
+
+    @staticmethod
+    def in_file(pixels):
+        """
+        :param pixels: Required. numpy array.
+        :return: True if the matrix is kept in a scratch file, or is a view of one.
+                 The memmap class alone does not tell, as numpy keeps it for
+                 new matrices derived from memory-mapped ones
+        """
+
+        base = pixels
+        while isinstance(base, np.ndarray):
+            base = base.base
+        return isinstance(base, mmap.mmap)
+
+    @staticmethod
+    def empty(shape: tuple, dtype = np.uint8):
+        """
+        Allocate an uninitialized matrix
+
+        :param shape: Required. The shape of the matrix.
+        :param dtype: Optional. The dtype of the matrix. Default is uint8.
+        :return: numpy array, or numpy memmap if it is large enough to be kept in a scratch file
+        """
+
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if not PixelBuffer.mapped(nbytes):
+            return np.empty(shape, dtype=dtype)
+
+        # The scratch file is deleted as soon as it is mapped, so its space is freed
+        # when the matrix (and every view of it) is released, even if the process dies
+        with tempfile.TemporaryFile(prefix='polybot-pixels-', dir=PixelBufferConfig.DIR) as file:
+            return np.memmap(file, dtype=dtype, mode='w+', shape=shape)
+
+    @staticmethod
+    def store(pixels):
+        """
+        Move a matrix into a scratch file, if it is large enough and is not in one already
+
+        :param pixels: Required. numpy array.
+        :return: The matrix in a scratch file, or the given matrix as is
+        """
+
+        if not PixelBuffer.mapped(pixels.nbytes) or PixelBuffer.in_file(pixels):
+            return pixels
+
+        buffer = PixelBuffer.empty(pixels.shape, pixels.dtype)
+        buffer[...] = pixels
+        return buffer
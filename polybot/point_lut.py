@@ -0,0 +1,88 @@
+"""
+Compiler of point effects into lookup tables.
+A run of consecutive point effects is turned into a single
+lookup table, that Img.apply_lut applies in one pass.
+"""
+
+import numpy as np
+# pylint: disable=E0401
+from polybot.img_proc import Img, LutKind
+# pylint: enable=E0401
+
+
+class PointLutCompiler:
+    """
+    A static class that compiles runs of point effects into lookup tables
+    """
+
+    # Effects that set each channel by its own value only
+    CHANNEL_EFFECTS = ('rgb_posterize',)
+    # Effects that set the whole pixel by its grayscale value
+    GRAY_EFFECTS = ('grayscale',)
+    # Effects that set the whole pixel by the sum of its channels
+    SUM_EFFECTS = ('segment',)
+
+    # All effects that can be compiled
+    EFFECTS = CHANNEL_EFFECTS + GRAY_EFFECTS + SUM_EFFECTS
+
+    @staticmethod
+    def compile(steps: list):
+        """
+        Compile the longest run of point effects from the start of the steps
+
+        :param steps: Required. List of PlanSteps.
+        :return: Tuple of the LutKind, the table, and the amount of steps compiled,
+                 or None if the first step is not a point effect.
+        """
+
+        if not steps or steps[0].name not in PointLutCompiler.EFFECTS:
+            return None
+
+        # The first effect sets the kind of table, and its starting rows
+        first = steps[0]
+        if first.name in PointLutCompiler.GRAY_EFFECTS:
+            # The result of grayscale is the grayscale value in each channel
+            kind = LutKind.GRAY
+            table = np.repeat(np.arange(256, dtype=np.uint8)[:, np.newaxis], 3, axis=1)
+            remaining = steps[1:]
+        elif first.name in PointLutCompiler.SUM_EFFECTS:
+            # A pixel with each possible sum of channels, to apply the first effect on
+            kind = LutKind.SUM
+            sums = np.arange(766)
+            table = np.stack(
+                [np.clip(sums - 255 * c, 0, 255) for c in range(3)], axis=1
+            ).astype(np.uint8)
+            remaining = steps
+        else:
+            # Each possible value in each channel
+            kind = LutKind.CHANNEL
+            table = np.repeat(np.arange(256, dtype=np.uint8)[:, np.newaxis], 3, axis=1)
+            remaining = steps
+
+        count = len(steps) - len(remaining)
+        for step in remaining:
+            if step.name not in PointLutCompiler.EFFECTS:
+                break
+            # Channels of a channel table cannot be combined into a whole pixel
+            if kind == LutKind.CHANNEL and step.name not in PointLutCompiler.CHANNEL_EFFECTS:
+                break
+
+            # Apply the effect on the rows of the table, as if they were pixels
+            table = PointLutCompiler.__apply(step, table)
+            count += 1
+
+        return kind, table, count
+
+    @staticmethod
+    def __apply(step, table):
+        """
+        Apply a point effect on each row of the table
+
+        :param step: Required. The PlanStep of the effect.
+        :param table: Required. The table, as numpy array of shape (rows, 3).
+        :return: The new table
+        """
+
+        img = Img(None, data=table[:, np.newaxis, :])
+        getattr(img, step.name)(**step.args)
+        return img.data[:, 0, :]
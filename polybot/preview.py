@@ -0,0 +1,60 @@
+"""
+Estimation of the time of processing a photo, to decide whether
+a downscaled preview of the result is worth sending before the full result
+"""
+
+import threading
+
+
+class RunTimeEstimator:
+    """
+    Estimates the time of processing a photo by a pipeline, by the time each effect
+    took per pixel in the previous jobs. The rates are exponential moving averages,
+    so they follow the changes of the load of the workers.
+    """
+
+    # Weight of the latest job in the moving averages
+    SMOOTHING = 0.2
+
+    def __init__(self):
+        # Seconds per pixel of each effect, and of decoding and encoding, by the name
+        self.rates = {}
+        self.lock = threading.Lock()
+
+    def record(self, result):
+        """
+        Update the rates by the times of a finished job
+
+        :param result: Required. The JobResult of the job.
+        """
+
+        if not result.pixels:
+            return
+
+        times = {**result.effect_times,
+                 'decode': sum(result.decode_times),
+                 'encode': result.encode_time}
+
+        with self.lock:
+            for name, seconds in times.items():
+                rate = seconds / result.pixels
+                previous = self.rates.get(name)
+                self.rates[name] = rate if previous is None else (
+                    previous + RunTimeEstimator.SMOOTHING * (rate - previous)
+                )
+
+    def estimate(self, pipeline, pixels: int):
+        """
+        Estimate the time of processing a photo
+
+        :param pipeline: Required. The EffectPipeline to execute.
+        :param pixels: Required. The amount of pixels of the photo.
+        :return: The estimated time in seconds, or None if an effect of the plan
+                 was not timed yet
+        """
+
+        names = ['decode', *(step.name for step in pipeline.plan), 'encode']
+        with self.lock:
+            if any(name not in self.rates for name in names):
+                return None
+            return sum(self.rates[name] for name in names) * pixels
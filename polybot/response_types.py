@@ -18,6 +18,7 @@ class Photo:
 
     PROCESSING = 'processing'
     SEND = 'send'
+    PREVIEW = 'preview'
 
 class DocumentTypes:
     """
@@ -53,5 +54,8 @@ class ErrorTypes:
     ARG_NOT_IN_OPTION = 'arg-not-in-option'
     ARG_NOT_COLOR = 'arg-not-color'
     ARG_POSITIVE_INT = 'arg-not-positive-int'
+    JOB_TIMEOUT = 'job-timeout'
+    JOB_FAILED = 'job-failed'
+    BUSY = 'busy'
     ENDING = 'error-ending'
 # pylint: enable=R0903
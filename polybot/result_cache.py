@@ -0,0 +1,226 @@
+"""
+Cache of encoded results, by the identity of the photos and the effect plan.
+Results are kept in a memory tier, and in a disk tier that survives restarts.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from loguru import logger
+# pylint: disable=E0401
+from polybot.config import EncodeConfig
+# pylint: enable=E0401
+
+
+class ResultCache:
+    """
+    A two-tier LRU cache of encoded result images.
+    The memory tier holds the most recently used results, up to 'memory_bytes'.
+    The disk tier holds results as files in 'disk_dir', up to 'disk_bytes'.
+    A tier with a size of 0 is disabled.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: str = None, disk_bytes: int = 0):
+        """
+        :param memory_bytes: Required. The maximum total size of the results in memory.
+        :param disk_dir: Optional. The directory of the disk tier. Default is None (no disk tier).
+        :param disk_bytes: Optional. The maximum total size of the results on disk. Default is 0.
+        """
+
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir if disk_bytes > 0 else None
+        self.disk_bytes = disk_bytes
+        self.lock = threading.Lock()
+
+        # (data, suffix) and (file path, size) by key, from the least to the most recently used
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.disk = OrderedDict()
+        self.disk_size = 0
+
+        # Counters of the lookups
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        self.evictions = {'memory': 0, 'disk': 0}
+
+        if self.disk_dir:
+            self.__load_disk()
+
+    @staticmethod
+    def key(photo_ids: list, plan: str):
+        """
+        Create the key of a result
+
+        :param photo_ids: Required. The list of the unique IDs of the input photos, by order.
+        :param plan: Required. The description of the optimized effect plan.
+        :return: The key as a hex string
+        """
+
+        # Results depend on the encode settings as well
+        encode_settings = sorted(
+            (name, value) for name, value in vars(EncodeConfig).items() if name.isupper()
+        )
+        text = repr((list(photo_ids), plan, encode_settings))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """
+        Find a result in the cache
+
+        :param key: Required. The key of the result.
+        :return: Tuple of the encoded result as bytes, and its file suffix, or None if not found
+        """
+
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return self.memory[key]
+
+            if key not in self.disk:
+                self.misses += 1
+                return None
+            self.disk.move_to_end(key)
+            path = self.disk[key][0]
+
+        try:
+            with open(path, 'rb') as result_file:
+                data = result_file.read()
+            # Keep the recently used order on disk, for the next runs
+            os.utime(path)
+        except OSError:
+            # The file was deleted behind the cache
+            with self.lock:
+                self.__drop_disk(key)
+                self.misses += 1
+            return None
+
+        entry = (data, os.path.splitext(path)[1])
+        with self.lock:
+            self.hits['disk'] += 1
+            self.__put_memory(key, entry)
+        return entry
+
+    def put(self, key: str, data: bytes, suffix: str):
+        """
+        Add a result to the cache
+
+        :param key: Required. The key of the result.
+        :param data: Required. The encoded result.
+        :param suffix: Required. The file suffix of the result's format, e.g. '.jpg'.
+        """
+
+        with self.lock:
+            self.__put_memory(key, (data, suffix))
+
+        if not self.disk_dir or len(data) > self.disk_bytes:
+            return
+
+        # Write to a temporary file first, so a partial file is never found in the cache
+        path = os.path.join(self.disk_dir, key + suffix)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as result_file:
+                result_file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as error:
+            logger.warning(f'Failed to write the cached result {path}: {error}')
+            return
+
+        with self.lock:
+            self.__drop_disk(key, delete = False)
+            self.disk[key] = (path, len(data))
+            self.disk_size += len(data)
+            self.__evict_disk()
+
+    def stats(self):
+        """
+        :return: A dict of the counters and the sizes of the tiers
+        """
+
+        with self.lock:
+            return {
+                'memory_hits': self.hits['memory'],
+                'disk_hits': self.hits['disk'],
+                'misses': self.misses,
+                'memory_evictions': self.evictions['memory'],
+                'disk_evictions': self.evictions['disk'],
+                'memory_entries': len(self.memory),
+                'memory_size': self.memory_size,
+                'disk_entries': len(self.disk),
+                'disk_size': self.disk_size,
+            }
+
+    def __put_memory(self, key, entry):
+        """
+        Add an entry to the memory tier, and evict the least recently used entries
+        to keep it in size. Call while holding self.lock.
+        """
+
+        size = len(entry[0])
+        if size > self.memory_bytes:
+            return
+
+        if key in self.memory:
+            self.memory_size -= len(self.memory.pop(key)[0])
+        self.memory[key] = entry
+        self.memory_size += size
+
+        while self.memory_size > self.memory_bytes:
+            _, (data, _) = self.memory.popitem(last = False)
+            self.memory_size -= len(data)
+            self.evictions['memory'] += 1
+
+    def __drop_disk(self, key, delete = True):
+        """
+        Remove an entry from the disk tier. Call while holding self.lock.
+
+        :param key: Required. The key of the entry.
+        :param delete: Optional. Delete the file as well. Default is True.
+        """
+
+        if key not in self.disk:
+            return
+
+        path, size = self.disk.pop(key)
+        self.disk_size -= size
+        if delete and os.path.exists(path):
+            os.remove(path)
+
+    def __evict_disk(self):
+        """
+        Evict the least recently used entries of the disk tier to keep it in size.
+        Call while holding self.lock.
+        """
+
+        while self.disk_size > self.disk_bytes:
+            self.__drop_disk(next(iter(self.disk)))
+            self.evictions['disk'] += 1
+
+    def __load_disk(self):
+        """
+        Index the results that are left in the disk tier from previous runs,
+        from the least to the most recently modified
+        """
+
+        os.makedirs(self.disk_dir, exist_ok = True)
+
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            key, suffix = os.path.splitext(name)
+            # Remove files that were partially written when the app stopped
+            if suffix == '.tmp':
+                os.remove(path)
+            else:
+                entries.append((os.path.getmtime(path), key, path, os.path.getsize(path)))
+
+        for _, key, path, size in sorted(entries):
+            self.disk[key] = (path, size)
+            self.disk_size += size
+
+        self.__evict_disk()
+
+        logger.info(f'Loaded {len(self.disk)} cached results ({self.disk_size} bytes) '
+                    f'from {self.disk_dir}')
@@ -0,0 +1,58 @@
+"""
+Test Blur Effect
+"""
+
+import unittest
+import numpy as np
+# pylint: disable=E0401
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+class TestImgBlur(unittest.TestCase):
+    """
+    Test Blur Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup
+        """
+
+        self.img = Img(IMG_PATH)
+        self.original_data = self.img.data.copy()
+
+    def test_blur_dimension(self):
+        """
+        Test the resolution of the result
+        """
+
+        self.img.blur(16)
+        actual_dimension = (len(self.img.data), len(self.img.data[0]))
+        expected_dimension = (len(self.original_data) - 15, len(self.original_data[0]) - 15)
+        self.assertEqual(expected_dimension, actual_dimension)
+
+    def test_blur_average(self):
+        """
+        Test that each pixel is the floored average of its window
+        """
+
+        # A part of the image, so the reference calculation stays fast
+        original_data = self.original_data[100:220, 200:300]
+
+        for blur_level in (1, 2, 7, 32):
+            self.img.data = original_data
+            self.img.blur(blur_level)
+
+            windows = np.lib.stride_tricks.sliding_window_view(
+                original_data.astype(np.int64), (blur_level, blur_level), axis=(0, 1)
+            )
+            expected = windows.sum(axis=(-2, -1)) // (blur_level * blur_level)
+
+            self.assertTrue(np.array_equal(expected, self.img.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Test Image Processing Bot
+"""
+
+import importlib
+import os
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+# pylint: disable=E0401
+from polybot.config import JobConfig, MediaGroupConfig, ResultCacheConfig
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+def photo_msg(message_id: int, caption: str = None, group_id: str = None):
+    """
+    Create a photo message of the test image
+    """
+
+    msg = {
+        'message_id': message_id,
+        'from': {'id': 1},
+        'chat': {'id': 1},
+        'date': int(time.time()),
+        'photo': [{'file_id': f'photo-{message_id}', 'file_unique_id': f'photo-{message_id}',
+                   'width': 660, 'height': 660}],
+    }
+    if caption is not None:
+        msg['caption'] = caption
+    if group_id is not None:
+        msg['media_group_id'] = group_id
+    return msg
+
+
+class TestImageProcessingBot(unittest.TestCase):
+    """
+    Test Image Processing Bot Class, with a fake Telegram client
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Test Setup
+        """
+
+        # The bot reads the replies file relative to the root of the repo
+        cwd = os.getcwd()
+        os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+        try:
+            cls.bot_module = importlib.import_module('polybot.bot')
+        finally:
+            os.chdir(cwd)
+
+        with open(IMG_PATH, 'rb') as photo_file:
+            cls.photo = photo_file.read()
+
+    def setUp(self):
+        """
+        Create a bot with a fake Telegram client, that processes the images in this process
+        """
+
+        self.results_dir = tempfile.TemporaryDirectory()
+        with mock.patch.object(self.bot_module.telebot, 'TeleBot') as client_class, \
+                mock.patch.object(self.bot_module.time, 'sleep'), \
+                mock.patch.object(JobConfig, 'WORKERS', 0), \
+                mock.patch.object(MediaGroupConfig, 'IDLE_TIMEOUT', 0.1), \
+                mock.patch.object(ResultCacheConfig, 'DISK_DIR', self.results_dir.name):
+            self.bot = self.bot_module.ImageProcessingBot('token', 'https://example.com')
+
+        self.client = client_class.return_value
+        self.client.get_file.side_effect = lambda file_id: types.SimpleNamespace(
+            file_path=f'photos/{file_id}.jpg'
+        )
+        self.client.download_file.return_value = self.photo
+
+    def tearDown(self):
+        """
+        Test Cleanup
+        """
+
+        self.bot.media_groups.executor.shutdown()
+        self.results_dir.cleanup()
+
+    def replied_photos(self, amount: int):
+        """
+        Wait for the given amount of replied photos, and decode them
+        """
+
+        deadline = time.time() + 10
+        while self.client.send_photo.call_count < amount and time.time() < deadline:
+            time.sleep(0.01)
+
+        return [Img(call.args[1].file.getvalue()) for call in self.client.send_photo.call_args_list]
+
+    def test_caption_on_later_photo(self):
+        """
+        Test that the photos of a media group are processed together,
+        when the photo with the caption is handled before the photos sent before it
+        """
+
+        for msg in (photo_msg(22, 'collage', 'album'), photo_msg(20, group_id='album'),
+                    photo_msg(21, group_id='album')):
+            self.bot.handle_message(msg)
+
+        results = self.replied_photos(1)
+        self.assertEqual(1, len(results))
+        self.assertEqual((660, 3 * 660), results[0].data.shape[:2])
+
+        # Late photos of the group that is already processed are ignored
+        self.bot.handle_message(photo_msg(23, group_id='album'))
+        time.sleep(0.3)
+        self.assertEqual(1, self.client.send_photo.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Test Canvas Resize Effect
+"""
+
+import unittest
+import numpy as np
+# pylint: disable=E0401
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+class TestImgCanvasResize(unittest.TestCase):
+    """
+    Test Canvas Resize Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup
+        """
+
+        self.img = Img(IMG_PATH)
+        self.original_data = self.img.data
+
+    def test_crop_is_view(self):
+        """
+        Test that cropping does not copy the pixels
+        """
+
+        self.img.canvas_resize(300, 200)
+
+        self.assertEqual((200, 300, 3), self.img.data.shape)
+        self.assertTrue(np.shares_memory(self.original_data, self.img.data))
+
+    def test_enlarge(self):
+        """
+        Test that the padding is filled with the background color
+        """
+
+        self.img.canvas_resize(700, 680, (1, 2, 3))
+
+        self.assertEqual((680, 700), (self.img.height, self.img.width))
+        self.assertTrue(np.array_equal(self.original_data, self.img.data[:660, :660]))
+        self.assertEqual({(1, 2, 3)}, set(map(tuple, self.img.data[660:].reshape(-1, 3))))
+        self.assertEqual({(1, 2, 3)}, set(map(tuple, self.img.data[:, 660:].reshape(-1, 3))))
+
+    def test_pending_canvas(self):
+        """
+        Test that geometric effects on a pending canvas have the same result
+        as on the materialized canvas
+        """
+
+        expected = Img(IMG_PATH)
+        for img in (self.img, expected):
+            img.canvas_resize(700, 500, (10, 20, 30))
+            if img is expected:
+                # Materialize the canvas
+                _ = img.data
+            img.rotate(90)
+            img.flip('vertical')
+            img.canvas_resize(600, 720, (10, 20, 30))
+            img.crop(550, 710)
+            img.canvas_resize(560, 720)
+
+        self.assertTrue(np.array_equal(expected.data, self.img.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Test Caption Parser
+"""
+
+import importlib
+import os
+import unittest
+# pylint: disable=E0401
+from polybot.response_types import ErrorTypes
+# pylint: enable=E0401
+
+
+class TestCaptionParser(unittest.TestCase):
+    """
+    Test Caption Parser Class
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Test Setup
+        """
+
+        # The effect rules read the replies file relative to the root of the repo
+        cwd = os.getcwd()
+        os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+        try:
+            cls.parser = importlib.import_module('polybot.caption_parser').CaptionParser
+        finally:
+            os.chdir(cwd)
+
+    def test_normalize(self):
+        """
+        Test that captions that differ only by case or spaces have the same plan
+        """
+
+        self.assertEqual('rotate 90, blur', self.parser.normalize('Rotate  90 ,blur'))
+        self.assertEqual('rotate 90, blur', self.parser.normalize(' ROTATE\t90,\n  blur '))
+
+        plan = self.parser.compile('rotate 90, blur')
+        self.assertIs(plan, self.parser.compile('Rotate  90 ,blur'))
+        self.assertEqual('rotate 90, blur', plan.caption)
+        self.assertEqual(['rotate', 'blur'], [command.command_name for command in plan.commands])
+
+    def test_empty_commands(self):
+        """
+        Test that empty commands between commas are skipped
+        """
+
+        plan = self.parser.compile(', rotate 90,, ,blur,')
+        self.assertEqual(['rotate', 'blur'], [command.command_name for command in plan.commands])
+        self.assertEqual((), plan.command_errors)
+        self.assertIsNotNone(plan.pipeline)
+
+        for caption in ('', ' ', ', ,,'):
+            self.assertTrue(self.parser.compile(caption).empty)
+
+    def test_errors(self):
+        """
+        Test that the errors are collected by their kind, in the order they are replied:
+        effects that are not found, then the multi-image effects, then wrong arguments
+        """
+
+        plan = self.parser.compile('rotate 90 90, spin, concat, blur 1 2 3, collage, twirl')
+
+        self.assertEqual([ErrorTypes.EFFECT_NOT_FOUND] * 2,
+                         [error.error_type for error in plan.command_errors])
+        self.assertEqual([['spin'], ['twirl']],
+                         [list(error.error_args) for error in plan.command_errors])
+        self.assertEqual(('concat', 'collage'), plan.multies)
+        self.assertEqual(['rotate 90 90', 'blur 1 2 3'],
+                         [effect_string for effect_string, _ in plan.arg_errors])
+        self.assertIsNone(plan.pipeline)
+
+        # Without unknown effects, the other errors are still collected
+        plan = self.parser.compile('concat, blur 1 2 3')
+        self.assertEqual((), plan.command_errors)
+        self.assertEqual(('concat',), plan.multies)
+        self.assertEqual(1, len(plan.arg_errors))
+        self.assertIsNone(plan.pipeline)
+
+    def test_cache(self):
+        """
+        Test that repeated compiles return the cached plan, which is not mutated by its use
+        """
+
+        caption = 'rotate 90, gaussian-blur 8, grayscale'
+        plan = self.parser.compile(caption)
+        description = str(plan.pipeline)
+        hits = self.parser.cache_info().hits
+
+        # Scaling the plan to a smaller photo makes a copy
+        scaled = plan.pipeline.scaled(0.5)
+        self.assertIsNot(plan.pipeline, scaled)
+        self.assertNotEqual(description, str(scaled))
+
+        again = self.parser.compile(caption.upper())
+        self.assertIs(plan, again)
+        self.assertEqual(description, str(again.pipeline))
+        self.assertEqual(hits + 1, self.parser.cache_info().hits)
+
+
+if __name__ == '__main__':
+    unittest.main()
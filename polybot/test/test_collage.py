@@ -0,0 +1,67 @@
+"""
+Test Collage Effect
+"""
+
+import unittest
+import numpy as np
+# pylint: disable=E0401
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+class TestImgCollage(unittest.TestCase):
+    """
+    Test Collage Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup
+        """
+
+        self.img = Img(IMG_PATH)
+        self.original_data = self.img.data
+        # Three more images in different sizes
+        self.other_imgs = [Img(IMG_PATH) for _ in range(3)]
+        self.other_imgs[0].canvas_resize(300, 200)
+        self.other_imgs[1].rotate()
+        self.other_imgs[2].canvas_resize(100, 700, (0, 0, 0))
+
+    def test_horizontal_dimension(self):
+        """
+        Test the resolution of a single row
+        """
+
+        self.img.collage(self.other_imgs)
+        self.assertEqual((700, 660 + 300 + 660 + 100), (self.img.height, self.img.width))
+
+    def test_vertical_dimension(self):
+        """
+        Test the resolution of a single column
+        """
+
+        self.img.collage(self.other_imgs, 'vertical')
+        self.assertEqual((660 + 200 + 660 + 700, 660), (self.img.height, self.img.width))
+
+    def test_grid(self):
+        """
+        Test the resolution of a grid, and the position of each image
+        """
+
+        self.img.collage(self.other_imgs, 'grid', (1, 2, 3))
+
+        # 2 rows of 2 images
+        self.assertEqual((660 + 700, 660 + 300), (self.img.height, self.img.width))
+        self.assertTrue(np.array_equal(self.original_data, self.img.data[:660, :660]))
+        self.assertTrue(np.array_equal(self.other_imgs[0].data, self.img.data[:200, 660:960]))
+        self.assertTrue(np.array_equal(self.other_imgs[1].data, self.img.data[660:1320, :660]))
+        self.assertTrue(np.array_equal(self.other_imgs[2].data, self.img.data[660:, 660:760]))
+        # Uncovered areas are in the background color
+        self.assertEqual([1, 2, 3], self.img.data[300, 700].tolist())
+        self.assertEqual([1, 2, 3], self.img.data[1350, 100].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ Test Concat Function
 """
 
 import unittest
+import numpy as np
 # pylint: disable=E0401
 from polybot.img_proc import Img
 # pylint: enable=E0401
@@ -34,6 +35,48 @@ class TestImgConcat(unittest.TestCase):
         self.assertEqual(actual_height, expected_height)
         self.assertEqual(actual_width, expected_width)
 
+    def test_concat_keeps_other_effects(self):
+        """
+        Test that the effects applied to the second image are kept,
+        and the second image itself is not altered
+        """
+
+        img = Img(IMG_PATH)
+        other_img = Img(IMG_PATH)
+        other_img.canvas_resize(100, 50)
+        other_img.grayscale()
+        other_data = other_img.data
+
+        img.concat(other_img, 'vertical', (0, 0, 0))
+
+        self.assertEqual((660 + 50, 660), (img.height, img.width))
+        self.assertTrue(np.array_equal(other_data, img.data[660:, :100]))
+        self.assertFalse(img.data[660:, 100:].any())
+        self.assertIs(other_data, other_img.data)
+        self.assertEqual((50, 100, 3), other_img.data.shape)
+
+    def test_clone(self):
+        """
+        Test that a clone shares the pixels until it changes,
+        and only the pixels of the clone are read-only
+        """
+
+        img = Img(IMG_PATH)
+        clone = img.clone()
+        self.assertTrue(np.shares_memory(img.data, clone.data))
+        self.assertTrue(img.data.flags.writeable)
+        with self.assertRaises(ValueError):
+            clone.data[0, 0] = 0
+
+        clone.grayscale()
+        self.assertFalse(np.shares_memory(img.data, clone.data))
+        self.assertTrue(np.array_equal(self.other_img.data, img.data))
+
+        # The original is still written in place after it was cloned
+        img.multiply(clone)
+        img.data[0, 0] = 0
+        self.assertFalse(img.data[0, 0].any())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,180 @@
+"""
+Test Convolution
+"""
+
+import unittest
+import numpy as np
+# pylint: disable=E0401
+from polybot.convolution import Convolution, Kernels
+from polybot.effect_pipeline import EffectPipeline, PlanStep
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+def reference(data, kernel):
+    """
+    Convolve with 'valid' borders, one kernel weight at a time
+    """
+
+    kernel = np.asarray(kernel)
+    height = data.shape[0] - kernel.shape[0] + 1
+    width = data.shape[1] - kernel.shape[1] + 1
+
+    result = np.zeros((height, width) + data.shape[2:])
+    for (i, j), weight in np.ndenumerate(kernel):
+        result += weight * data[i:i + height, j:j + width].astype(np.float64)
+    return result
+
+
+class TestConvolution(unittest.TestCase):
+    """
+    Test Convolution Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup
+        """
+
+        # A part of the image, so the reference calculation stays fast
+        self.data = Img(IMG_PATH).data[100:180, 200:260].copy()
+
+    def test_methods(self):
+        """
+        Test that every method has the result of the reference, for any kernel
+        """
+
+        rng = np.random.default_rng(0)
+        kernels = [
+            Kernels.box(5),
+            [[1, -1]],
+            Kernels.SOBEL,
+            Kernels.EMBOSS,
+            Kernels.gaussian(3),
+            np.outer([1, 2, 3, 2, 1], [2, 0, -2]),
+            rng.integers(-3, 4, (9, 7)),
+            rng.random((4, 11)),
+        ]
+
+        for kernel in kernels:
+            expected = reference(self.data, kernel)
+            for method in ('separable', 'direct', 'fft'):
+                if method == 'separable' and Convolution.separate(np.asarray(kernel)) is None:
+                    continue
+
+                actual = Convolution.convolve(self.data, kernel, method=method)
+                self.assertEqual(expected.shape, actual.shape)
+                self.assertTrue(np.allclose(expected, actual, atol=1e-3))
+
+                # Integer kernels have exact results
+                if np.issubdtype(np.asarray(kernel).dtype, np.integer):
+                    self.assertTrue(np.array_equal(expected, actual))
+
+    def test_method_selection(self):
+        """
+        Test that the method is selected by the kernel
+        """
+
+        self.assertEqual('separable', Convolution.method(Kernels.box(32)))
+        self.assertEqual('separable', Convolution.method(Kernels.gaussian(8)))
+        self.assertEqual('direct', Convolution.method(Kernels.sharpen(2)))
+        self.assertEqual('fft', Convolution.method(np.eye(9)))
+
+    def test_borders(self):
+        """
+        Test that padded borders keep the shape, and fill the pixels beyond the edges
+        """
+
+        kernel = Kernels.box(5)
+        for border in ('edge', 'reflect', 'constant'):
+            actual = Convolution.convolve(self.data, kernel, border)
+            self.assertEqual(self.data.shape, actual.shape)
+
+        # Away from the borders, padding does not change the result
+        padded = Convolution.convolve(self.data, kernel, 'edge')
+        valid = Convolution.convolve(self.data, kernel)
+        self.assertTrue(np.array_equal(valid, padded[2:-2, 2:-2]))
+
+        # Zeros beyond the edges lower the sums of the corners
+        constant = Convolution.convolve(self.data, kernel, 'constant')
+        self.assertTrue(np.all(constant[0, 0] <= padded[0, 0]))
+
+        with self.assertRaises(ValueError):
+            Convolution.convolve(self.data, kernel, 'wrap')
+
+    def test_kernel_effects(self):
+        """
+        Test the shape of the results of the kernel effects, and that they keep their look
+        """
+
+        img = Img(IMG_PATH)
+        img.data = self.data
+
+        # A flat image stays flat when sharpened, embossed or blurred, and has no edges
+        flat = np.full((20, 20, 3), 120, dtype=np.uint8)
+        for effect, value in (('sharpen', 120), ('emboss', 120), ('gaussian_blur', 120),
+                              ('edges', 0)):
+            img.data = flat
+            getattr(img, effect)()
+            self.assertEqual(flat.shape[2], img.data.shape[2])
+            self.assertTrue(np.all(img.data == value), effect)
+
+        img.data = self.data
+        img.gaussian_blur(3)
+        self.assertEqual((self.data.shape[0] - 6, self.data.shape[1] - 6), img.data.shape[:2])
+
+        # A vertical edge is found where the pixels change
+        step = np.zeros((10, 10, 3), dtype=np.uint8)
+        step[:, 5:] = 200
+        img.data = step
+        img.edges()
+        self.assertTrue(np.all(img.data[:, 3:5] > 0))
+        self.assertTrue(np.all(img.data[:, :2] == 0))
+
+    def test_small_image(self):
+        """
+        Test that images smaller than the kernel are padded by their edges,
+        along the axes the kernel does not fit in
+        """
+
+        img = Img(IMG_PATH)
+        img.data = self.data[:20, :50]
+        img.gaussian_blur(32)
+        self.assertEqual((20, 50), img.data.shape[:2])
+
+        img.data = self.data[:20, :50]
+        img.blur(32)
+        self.assertEqual((20, 19), img.data.shape[:2])
+
+        # The plan of 'canvas-resize 20 20, gaussian-blur 32'
+        img.data = self.data
+        EffectPipeline.run(EffectPipeline.optimize([
+            PlanStep('canvas_resize', {'width': 20, 'height': 20, 'bg_color': (255, 255, 255)}),
+            PlanStep('gaussian_blur', {'radius': 32}),
+        ]), [img])
+        self.assertEqual((20, 20), img.data.shape[:2])
+
+    def test_narrow_strips(self):
+        """
+        Test that an image narrower than the kernel has the same result in strips
+        """
+
+        plan = [PlanStep('gaussian_blur', {'radius': 8}), PlanStep('sharpen', {'amount': 1})]
+        narrow = self.data[:, :10]
+
+        expected = Img(IMG_PATH)
+        expected.data = narrow
+        EffectPipeline.run(plan, [expected])
+
+        actual = Img(IMG_PATH)
+        actual.data = narrow
+        EffectPipeline.run(plan, [actual], strip_height=16)
+
+        self.assertEqual((narrow.shape[0] - 18, 8), expected.data.shape[:2])
+        self.assertTrue(np.array_equal(expected.data, actual.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
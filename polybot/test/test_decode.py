@@ -0,0 +1,97 @@
+"""
+Test Decoding Images
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import PIL.Image
+# pylint: disable=E0401
+from polybot.img_codec import EncodeOptions, ImageFormat
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+class TestImgDecode(unittest.TestCase):
+    """
+    Test Decode Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup
+        """
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """
+        Test Cleanup
+        """
+
+        self.temp_dir.cleanup()
+
+    def save_and_load(self, image):
+        """
+        Save the PIL image as PNG, and load it as Img
+        """
+
+        path = os.path.join(self.temp_dir.name, 'test.png')
+        image.save(path)
+        return Img(path)
+
+    def test_rgba_png(self):
+        """
+        Test that the alpha channel is dropped and values stay in 0 - 255
+        """
+
+        img = self.save_and_load(PIL.Image.new('RGBA', (4, 3), (200, 100, 50, 10)))
+
+        self.assertEqual((3, 4, 3), img.data.shape)
+        self.assertEqual(np.uint8, img.data.dtype)
+        self.assertEqual([200, 100, 50], img.data[0][0].tolist())
+
+    def test_grayscale_png(self):
+        """
+        Test that grayscale images are expanded to 3 channels
+        """
+
+        img = self.save_and_load(PIL.Image.new('L', (4, 3), 77))
+
+        self.assertEqual((3, 4, 3), img.data.shape)
+        self.assertEqual([77, 77, 77], img.data[2][3].tolist())
+
+    def test_jpeg_target_size(self):
+        """
+        Test that JPEG decoding is reduced, but never below the target size
+        """
+
+        original = Img(IMG_PATH)
+        img = Img(IMG_PATH, (160, 160))
+
+        self.assertLess(len(img.data), len(original.data))
+        self.assertGreaterEqual(len(img.data), 160)
+        self.assertGreaterEqual(len(img.data[0]), 160)
+
+    def test_bytes(self):
+        """
+        Test that images are decoded from bytes and encoded back into bytes,
+        with no file
+        """
+
+        with open(IMG_PATH, 'rb') as img_file:
+            img = Img(img_file.read())
+
+        self.assertIsNone(img.path)
+        self.assertTrue(np.array_equal(img.data, Img(IMG_PATH).data))
+
+        encoded = img.encode(EncodeOptions(ImageFormat.PNG))
+        self.assertEqual(img.encoded_size, len(encoded))
+        self.assertTrue(np.array_equal(Img(encoded).data, img.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
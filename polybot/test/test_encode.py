@@ -0,0 +1,128 @@
+"""
+Test Encoding Images
+"""
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import PIL.Image
+# pylint: disable=E0401
+from polybot.config import EncodeConfig
+from polybot.img_codec import EncodeOptions, ImageFormat, ImgEncoder
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+class TestImgEncode(unittest.TestCase):
+    """
+    Test Encode Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup
+        """
+
+        self.img = Img(IMG_PATH)
+
+    def encode(self, options):
+        """
+        Encode the test image, and open the result with PIL
+        """
+
+        encoded = self.img.encode(options)
+        self.assertEqual(self.img.encoded_size, len(encoded))
+        return encoded, PIL.Image.open(io.BytesIO(encoded))
+
+    def test_formats(self):
+        """
+        Test that each format is encoded and decoded back to the same image,
+        exactly for lossless formats and closely for lossy ones
+        """
+
+        for image_format in (ImageFormat.JPEG, ImageFormat.WEBP, ImageFormat.PNG):
+            encoded, image = self.encode(EncodeOptions(image_format))
+            self.assertEqual(image_format, image.format)
+
+            data = Img(encoded).data
+            self.assertEqual(self.img.data.shape, data.shape)
+            difference = np.abs(data.astype(int) - self.img.data.astype(int)).mean()
+            if image_format == ImageFormat.PNG:
+                self.assertEqual(0, difference)
+            else:
+                self.assertLess(difference, 5, image_format)
+
+    def test_quality(self):
+        """
+        Test that a lower quality gives a smaller result
+        """
+
+        for image_format in (ImageFormat.JPEG, ImageFormat.WEBP):
+            low, _ = self.encode(EncodeOptions(image_format, 30))
+            high, _ = self.encode(EncodeOptions(image_format, 90))
+            self.assertLess(len(low), len(high), image_format)
+
+    def test_jpeg_options(self):
+        """
+        Test the progressive and optimize options of JPEG
+        """
+
+        baseline, image = self.encode(EncodeOptions(optimize=False))
+        self.assertNotIn('progressive', image.info)
+
+        progressive, image = self.encode(EncodeOptions(progressive=True, optimize=False))
+        self.assertTrue(image.info.get('progressive'))
+
+        # Optimizing changes only the coding of the file, not the pixels
+        optimized, _ = self.encode(EncodeOptions(optimize=True))
+        self.assertLess(len(optimized), len(baseline))
+        self.assertTrue(np.array_equal(Img(optimized).data, Img(baseline).data))
+        self.assertTrue(np.array_equal(Img(progressive).data, Img(baseline).data))
+
+    def test_for_size(self):
+        """
+        Test that the options are selected from the config by the size of the image
+        """
+
+        with mock.patch.multiple(EncodeConfig, FORMAT=ImageFormat.JPEG, JPEG_QUALITY=85,
+                                 LARGE_JPEG_QUALITY=75, JPEG_PROGRESSIVE=False,
+                                 LARGE_PIXELS=1000):
+            small = EncodeOptions.for_size(20, 50)
+            self.assertEqual(ImageFormat.JPEG, small.image_format)
+            self.assertEqual(85, small.quality)
+            self.assertFalse(small.progressive)
+
+            # Large images have a lower quality, and are always progressive
+            large = EncodeOptions.for_size(20, 51)
+            self.assertEqual(ImageFormat.JPEG, large.image_format)
+            self.assertEqual(75, large.quality)
+            self.assertTrue(large.progressive)
+            self.assertEqual('.jpg', large.suffix)
+
+        with mock.patch.multiple(EncodeConfig, FORMAT=ImageFormat.WEBP, WEBP_QUALITY=60):
+            options = EncodeOptions.for_size(20, 50)
+            self.assertEqual(ImageFormat.WEBP, options.image_format)
+            self.assertEqual(60, options.quality)
+            self.assertEqual('.webp', options.suffix)
+
+    def test_file(self):
+        """
+        Test that without options, the format is selected by the suffix of the file
+        """
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'result.png')
+            _, size = ImgEncoder.encode(self.img.data, path)
+
+            self.assertEqual(os.path.getsize(path), size)
+            with PIL.Image.open(path) as image:
+                self.assertEqual(ImageFormat.PNG, image.format)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Test Expiring Cache
+"""
+
+import unittest
+# pylint: disable=E0401
+from polybot.expiring_cache import ExpiringCache
+# pylint: enable=E0401
+
+
+class TestExpiringCache(unittest.TestCase):
+    """
+    Test Expiring Cache Class
+    """
+
+    def test_expire(self):
+        """
+        Test that only entries older than the timeout expire,
+        by their latest time
+        """
+
+        cache = ExpiringCache(30, 10)
+        cache.set('a', 1, 100)
+        cache.set('b', 2, 110)
+        # Setting 'a' again renews its time
+        cache.set('a', 3, 120)
+
+        self.assertEqual(cache.expire(145), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 3)
+        self.assertEqual(cache.expire(150), 0)
+        self.assertEqual(cache.expire(151), 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_lazy_expire(self):
+        """
+        Test that an expired entry is not returned when the current time is given
+        """
+
+        cache = ExpiringCache(30, 10)
+        cache.set('a', 1, 100)
+
+        self.assertEqual(cache.get('a', 130), 1)
+        self.assertIsNone(cache.get('a', 131))
+        self.assertEqual(len(cache), 0)
+
+    def test_max_size(self):
+        """
+        Test that the oldest entries are evicted when there are too many
+        """
+
+        cache = ExpiringCache(30, 3)
+        for i in range(5):
+            cache.set(i, i, 100 + i)
+        # Renew 2, so 3 is now the oldest
+        cache.set(2, 2, 110)
+        cache.set(5, 5, 111)
+
+        self.assertEqual(len(cache), 3)
+        self.assertEqual([cache.get(i) for i in range(6)], [None, None, 2, None, 4, 5])
+        self.assertEqual(cache.evictions, 3)
+
+    def test_many_renewals(self):
+        """
+        Test that the heap stays small when the same keys are set over and over
+        """
+
+        cache = ExpiringCache(30, 10)
+        for i in range(1000):
+            cache.set(i % 5, i, i)
+
+        self.assertEqual(len(cache), 5)
+        self.assertLess(len(cache.heap), 100)
+        self.assertEqual(cache.get(4, 999), 999)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+Test Job Runner
+"""
+
+import threading
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+import numpy as np
+# pylint: disable=E0401
+from polybot.effect_pipeline import EffectPipeline, PlanStep
+from polybot.error import JobFailedError, JobTimeoutError
+from polybot.img_codec import EncodeOptions
+from polybot.img_proc import Img
+from polybot import job_runner
+from polybot.job_runner import JobRunner
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+def pipeline(*steps):
+    """
+    Create an EffectPipeline with the given plan of PlanSteps
+    """
+
+    effect_pipeline = EffectPipeline([])
+    effect_pipeline.plan = list(steps)
+    return effect_pipeline
+
+
+ROTATE = PlanStep('rotate', {'angle': 90})
+SEGMENT = PlanStep('segment', {'threshold': 100, 'black': (0, 0, 0), 'white': (255, 255, 255)})
+GRAYSCALE = PlanStep('grayscale', {})
+BLUR = PlanStep('blur', {'blur_level': 32})
+
+
+class TestJobRunner(unittest.TestCase):
+    """
+    Test Job Runner Class
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Test Setup
+        """
+
+        with open(IMG_PATH, 'rb') as photo_file:
+            cls.photo = photo_file.read()
+
+    def expected(self, effect_pipeline):
+        """
+        Process the test image in this process, as the worker should
+        """
+
+        img = Img(self.photo)
+        effect_pipeline.execute([img])
+        return Img(img.encode(EncodeOptions.for_size(img.width, img.height))).data
+
+    def test_result_of_workers(self):
+        """
+        Test that a job processed by a worker process returns the same result
+        as a job processed in the calling thread
+        """
+
+        expected = self.expected(pipeline(ROTATE, SEGMENT))
+        for workers in (0, 1):
+            runner = JobRunner(workers, 2)
+            result = runner.run(pipeline(ROTATE, SEGMENT), [self.photo])
+            runner.shutdown()
+
+            self.assertTrue(np.array_equal(Img(result.data).data, expected))
+            self.assertEqual(result.plan, 'rotate 90, segment 100 (0, 0, 0) (255, 255, 255)')
+            self.assertEqual(len(result.decode_times), 1)
+            self.assertGreaterEqual(result.finished, result.started)
+
+    def test_stats(self):
+        """
+        Test the counters of finished and failed jobs
+        """
+
+        runner = JobRunner(0, 2)
+        runner.run(pipeline(GRAYSCALE), [self.photo])
+        with self.assertRaises(JobFailedError):
+            runner.run(pipeline(GRAYSCALE), [b'not an image'])
+
+        stats = runner.stats()
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['pending'], 0)
+
+    def test_timeout(self):
+        """
+        Test that a job that runs longer than the timeout raises JobTimeoutError,
+        and still finishes in the background
+        """
+
+        runner = JobRunner(1, 2, 0.001)
+        with self.assertRaises(JobTimeoutError) as context:
+            runner.run(pipeline(BLUR), [self.photo])
+
+        result = context.exception.future.result()
+        runner.shutdown()
+        self.assertGreater(len(result.data), 0)
+        self.assertEqual(runner.stats()['timed_out'], 1)
+        self.assertEqual(runner.stats()['pending'], 0)
+
+    def test_failure(self):
+        """
+        Test that an error of a job, in a worker process or in the calling thread,
+        is raised as JobFailedError that holds the error
+        """
+
+        for workers in (0, 1):
+            runner = JobRunner(workers, 2)
+            with self.assertRaises(JobFailedError) as context:
+                runner.run(pipeline(GRAYSCALE), [b'not an image'])
+            runner.shutdown()
+
+            self.assertIsInstance(context.exception.error, OSError)
+            self.assertEqual(context.exception.error_type, 'job-failed')
+
+    def test_submit_failure(self):
+        """
+        Test that a job that cannot be submitted raises JobFailedError,
+        and frees its slot in the queue
+        """
+
+        runner = JobRunner(1, 2)
+        runner.shutdown()
+        for _ in range(2):
+            with self.assertRaises(JobFailedError) as context:
+                runner.submit(pipeline(GRAYSCALE), [self.photo])
+            self.assertIsInstance(context.exception.error, RuntimeError)
+
+        # Both slots are free
+        self.assertTrue(runner.slots.acquire(timeout=1))
+        self.assertTrue(runner.slots.acquire(timeout=1))
+        self.assertEqual(runner.stats()['pending'], 0)
+        self.assertEqual(runner.stats()['failed'], 2)
+
+    def test_broken_pool(self):
+        """
+        Test that a broken pool is replaced by a single new one,
+        when jobs of two threads find it broken at the same time
+        """
+
+        barrier = threading.Barrier(2)
+
+        class BrokenPool:
+            """
+            A pool whose worker died, once both threads submitted to it
+            """
+
+            @staticmethod
+            def submit(*_):
+                """
+                Wait for the other thread, and raise as a broken pool
+                """
+
+                barrier.wait(5)
+                raise BrokenProcessPool('A worker died')
+
+        runner = JobRunner(1, 2)
+        runner.executor.shutdown()
+        runner.executor = BrokenPool()
+
+        futures = []
+        with mock.patch.object(job_runner, 'ProcessPoolExecutor',
+                               wraps=job_runner.ProcessPoolExecutor) as pool_class:
+            threads = [
+                threading.Thread(
+                    target=lambda: futures.append(runner.submit(pipeline(GRAYSCALE), [self.photo]))
+                )
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(pool_class.call_count, 1)
+        for future in futures:
+            self.assertGreater(len(runner.wait(future).data), 0)
+        runner.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Test Media Group Aggregator
+"""
+
+import threading
+import time
+import unittest
+# pylint: disable=E0401
+from polybot.media_group import MediaGroupAggregator
+# pylint: enable=E0401
+
+
+def photo_msg(message_id: int, group_id: str = 'album'):
+    """
+    Create a photo message of a media group
+    """
+
+    return {'message_id': message_id, 'media_group_id': group_id}
+
+
+class TestMediaGroupAggregator(unittest.TestCase):
+    """
+    Test Media Group Aggregator Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup
+        """
+
+        self.downloaded = []
+        self.flushed = []
+        self.flush_event = threading.Event()
+        self.aggregator = MediaGroupAggregator(self.download, self.flush, idle_timeout=0.05)
+
+    def tearDown(self):
+        """
+        Stop the download threads
+        """
+
+        self.aggregator.executor.shutdown()
+
+    def download(self, msg):
+        """
+        Fake download, that returns the photo of a message by its ID.
+        The first message of a group is the slowest to download
+        """
+
+        if msg['message_id'] == 1:
+            time.sleep(0.02)
+        self.downloaded.append(msg['message_id'])
+        return f'photo {msg["message_id"]}'
+
+    def flush(self, msgs, photos):
+        """
+        Fake flush, that records the messages and photos of a flushed group
+        """
+
+        self.flushed.append(([msg['message_id'] for msg in msgs], photos))
+        self.flush_event.set()
+
+    def test_flush_by_size(self):
+        """
+        Test that a group is flushed as soon as it has the expected amount of messages
+        """
+
+        self.aggregator.idle_timeout = 10
+        self.aggregator.add(photo_msg(1), expected_size=2)
+        self.assertEqual([], self.flushed)
+
+        self.aggregator.add(photo_msg(2))
+        self.assertEqual([([1, 2], ['photo 1', 'photo 2'])], self.flushed)
+
+        # The group is never larger than the maximum size
+        self.aggregator.max_size = 2
+        self.aggregator.add(photo_msg(1, 'other'), expected_size=5)
+        self.aggregator.add(photo_msg(2, 'other'))
+        self.assertEqual(2, len(self.flushed))
+
+    def test_flush_by_timeout(self):
+        """
+        Test that a group is flushed once no message arrived for the idle timeout
+        """
+
+        self.aggregator.add(photo_msg(1))
+        self.aggregator.add(photo_msg(2))
+        self.aggregator.add(photo_msg(3))
+        self.assertEqual([], self.flushed)
+
+        self.assertTrue(self.flush_event.wait(5))
+        self.assertEqual([([1, 2, 3], ['photo 1', 'photo 2', 'photo 3'])], self.flushed)
+
+    def test_late_photo(self):
+        """
+        Test that the messages of a group that is flushed or discarded are ignored
+        """
+
+        self.aggregator.add(photo_msg(1), expected_size=1)
+        self.aggregator.add(photo_msg(2))
+        self.aggregator.discard('discarded')
+        self.aggregator.add(photo_msg(3, 'discarded'))
+
+        # Wait longer than the idle timeout, for flushes that should not happen
+        self.assertTrue(self.flush_event.wait(5))
+        time.sleep(0.2)
+        self.assertEqual([([1], ['photo 1'])], self.flushed)
+        self.assertEqual([1], self.downloaded)
+
+        # Closed groups are forgotten after a while
+        self.aggregator.closed['album'] -= MediaGroupAggregator.CLOSED_TIMEOUT + 1
+        self.aggregator.add(photo_msg(4), expected_size=1)
+        self.assertEqual(([4], ['photo 4']), self.flushed[-1])
+
+    def test_order(self):
+        """
+        Test that the messages are kept by the order of arrival, with their photos,
+        whatever order their message IDs are and their downloads finish in
+        """
+
+        for message_id in (3, 1, 2):
+            self.aggregator.add(photo_msg(message_id), expected_size=3)
+
+        self.assertEqual([([3, 1, 2], ['photo 3', 'photo 1', 'photo 2'])], self.flushed)
+        self.assertEqual(1, self.downloaded[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
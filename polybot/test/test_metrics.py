@@ -0,0 +1,63 @@
+"""
+Test Metrics
+"""
+
+import unittest
+# pylint: disable=E0401
+from polybot.metrics import Counter, Histogram, MetricsRegistry
+# pylint: enable=E0401
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test Metrics Class
+    """
+
+    def test_counter(self):
+        """
+        Test that counters are rendered by their labels
+        """
+
+        registry = MetricsRegistry()
+        counter = registry.register(Counter('test_total', 'Test counter', ('result',)))
+        counter.inc(result='hit')
+        counter.inc(2, result='hit')
+        counter.inc(result='miss')
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_total counter', lines)
+        self.assertIn('test_total{result="hit"} 3', lines)
+        self.assertIn('test_total{result="miss"} 1', lines)
+
+    def test_histogram(self):
+        """
+        Test that histogram buckets are cumulative, with the sum and count
+        """
+
+        registry = MetricsRegistry()
+        histogram = registry.register(Histogram('test_seconds', 'Test histogram',
+                                                ('effect',), (0.1, 1.0)))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value, effect='blur')
+
+        lines = registry.render().splitlines()
+        self.assertIn('test_seconds_bucket{effect="blur",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{effect="blur",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{effect="blur",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_sum{effect="blur"} 6.05', lines)
+        self.assertIn('test_seconds_count{effect="blur"} 4', lines)
+
+    def test_collector(self):
+        """
+        Test that collectors are called before rendering
+        """
+
+        registry = MetricsRegistry()
+        counter = registry.register(Counter('test_total', 'Test counter'))
+        registry.add_collector(lambda: counter.inc(5))
+
+        self.assertIn('test_total 5', registry.render().splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Test Photo Size Selection
+"""
+
+import unittest
+# pylint: disable=E0401
+from polybot.effect_pipeline import EffectPipeline, PlanStep
+from polybot.photo_size import PhotoSizeSelector
+# pylint: enable=E0401
+
+# The sizes Telegram keeps of a 2560x1920 photo
+SIZES = [
+    {'file_id': 's', 'width': 320, 'height': 240},
+    {'file_id': 'm', 'width': 800, 'height': 600},
+    {'file_id': 'y', 'width': 1280, 'height': 960},
+    {'file_id': 'w', 'width': 2560, 'height': 1920},
+]
+
+
+def pipeline(*plan):
+    """
+    Create an EffectPipeline of PlanSteps
+    """
+
+    created = EffectPipeline([])
+    created.plan = list(plan)
+    return created
+
+
+class TestPhotoSizeSelector(unittest.TestCase):
+    """
+    Test Photo Size Selector Class
+    """
+
+    def test_policies(self):
+        """
+        Test that each policy selects the smallest adequate size
+        """
+
+        self.assertEqual('w', PhotoSizeSelector.select(SIZES, policy='max')['file_id'])
+        self.assertEqual('y', PhotoSizeSelector.select(SIZES, policy='balanced')['file_id'])
+        self.assertEqual('m', PhotoSizeSelector.select(SIZES, policy='fastest')['file_id'])
+        # No size is large enough, so the largest is selected
+        self.assertEqual('m', PhotoSizeSelector.select(SIZES[:2], policy='balanced')['file_id'])
+
+    def test_full_resolution(self):
+        """
+        Test that plans that set the size of the result get the largest size
+        """
+
+        blur = pipeline(PlanStep('blur', {'blur_level': 16}))
+        canvas = pipeline(PlanStep('canvas_resize', {'width': 100, 'height': 100,
+                                                     'bg_color': (255, 255, 255)}))
+
+        self.assertEqual('m', PhotoSizeSelector.select(SIZES, blur, 'fastest')['file_id'])
+        self.assertEqual('w', PhotoSizeSelector.select(SIZES, canvas, 'fastest')['file_id'])
+
+    def test_scaled(self):
+        """
+        Test that the arguments in pixels are scaled, without changing the shared plan
+        """
+
+        blur = pipeline(PlanStep('blur', {'blur_level': 16}), PlanStep('grayscale', {}))
+        scaled = blur.scaled(PhotoSizeSelector.scale(SIZES[1], SIZES))
+
+        self.assertEqual({'blur_level': 5}, scaled.plan[0].args)
+        self.assertIs(blur.plan[1], scaled.plan[1])
+        self.assertEqual({'blur_level': 16}, blur.plan[0].args)
+        self.assertIs(blur, blur.scaled(1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""
+Test Effect Pipeline
+"""
+
+import unittest
+import numpy as np
+# pylint: disable=E0401
+from polybot.effect_pipeline import EffectPipeline, PlanStep
+from polybot.img_proc import Img
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+def step(name, **args):
+    """
+    Create a PlanStep with the default arguments of the effect
+    """
+
+    defaults = {
+        'blur': {'blur_level': 16},
+        'rotate': {'angle': 90},
+        'segment': {'threshold': 100, 'black': (0, 0, 0), 'white': (255, 255, 255)},
+        'rgb_posterize': {'threshold': 100},
+        'canvas_resize': {'bg_color': (255, 255, 255)},
+        'salt_n_pepper': {'strength': 0.2, 'salt': (255, 255, 255), 'pepper': (0, 0, 0),
+                          'seed': None},
+    }
+    return PlanStep(name, {**defaults.get(name, {}), **args})
+
+
+class TestEffectPipeline(unittest.TestCase):
+    """
+    Test Effect Pipeline Class
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Test Setup
+        """
+
+        cls.original_data = Img(IMG_PATH).data[:200, :150]
+
+    def assert_same_result(self, plan):
+        """
+        Assert that the optimized plan has the same result as the original plan
+        """
+
+        expected = Img(IMG_PATH)
+        expected.data = self.original_data
+        EffectPipeline.run(plan, [expected])
+
+        actual = Img(IMG_PATH)
+        actual.data = self.original_data
+        EffectPipeline.run(EffectPipeline.optimize(plan), [actual])
+
+        self.assertTrue(np.array_equal(expected.data, actual.data))
+
+    def test_merge_rotations(self):
+        """
+        Test that four rotations are dropped, and rotations are merged over point effects
+        """
+
+        self.assertEqual([], EffectPipeline.optimize([step('rotate')] * 4))
+
+        plan = [step('rotate'), step('grayscale'), step('rotate', angle=180), step('contour')]
+        optimized = EffectPipeline.optimize(plan)
+        self.assertEqual(['grayscale', 'rotate 270', 'contour'], list(map(str, optimized)))
+        self.assert_same_result(plan)
+
+    def test_drop_no_ops(self):
+        """
+        Test that steps that do not change the image are dropped
+        """
+
+        plan = [step('blur', blur_level=1), step('salt_n_pepper', strength=0), step('contour')]
+        self.assertEqual(['contour'], [s.name for s in EffectPipeline.optimize(plan)])
+        self.assert_same_result(plan)
+
+    def test_fuse_point_effects(self):
+        """
+        Test that consecutive segments and posterizes are fused
+        """
+
+        plan = [step('segment', threshold=80, black=(20, 20, 20), white=(200, 0, 0)),
+                step('segment', threshold=50, black=(0, 0, 255), white=(0, 255, 0))]
+        self.assertEqual(1, len(EffectPipeline.optimize(plan)))
+        self.assert_same_result(plan)
+
+        plan = [step('rgb_posterize', threshold=30), step('rgb_posterize', threshold=200)]
+        self.assertEqual(1, len(EffectPipeline.optimize(plan)))
+        self.assert_same_result(plan)
+
+    def test_compile_luts(self):
+        """
+        Test that runs of point effects are compiled into a single lookup table
+        """
+
+        plans = (
+            [step('grayscale'), step('segment', threshold=120)],
+            [step('segment', threshold=90, black=(10, 200, 30), white=(250, 40, 99)),
+             step('rgb_posterize', threshold=60), step('grayscale')],
+            [step('rgb_posterize', threshold=60), step('rgb_posterize', threshold=255)],
+            [step('grayscale'), step('grayscale'), step('rgb_posterize', threshold=70)],
+        )
+        for plan in plans:
+            optimized = EffectPipeline.optimize(plan)
+            self.assertEqual(['apply_lut'], [s.name for s in optimized])
+            self.assert_same_result(plan)
+
+        # A channel effect cannot be followed by a whole pixel effect in the same table
+        plan = [step('rgb_posterize'), step('rgb_posterize', threshold=255), step('grayscale')]
+        self.assertEqual(['apply_lut', 'grayscale'],
+                         [s.name for s in EffectPipeline.optimize(plan)])
+        self.assert_same_result(plan)
+
+    def test_strips(self):
+        """
+        Test that executing in strips has the same result as on the whole image
+        """
+
+        plan = EffectPipeline.optimize([
+            step('blur', blur_level=5), step('grayscale'), step('segment', threshold=90),
+            step('contour'), step('rotate'), step('salt_n_pepper', seed=5),
+            step('blur', blur_level=3)
+        ])
+
+        expected = Img(IMG_PATH)
+        expected.data = self.original_data
+        EffectPipeline.run(plan, [expected])
+
+        for strip_height in (1, 7, 64, 1000):
+            actual = Img(IMG_PATH)
+            actual.data = self.original_data
+            EffectPipeline.run(plan, [actual], strip_height)
+
+            self.assertTrue(np.array_equal(expected.data, actual.data))
+
+    def test_push_crops(self):
+        """
+        Test that a crop is added before the effects preceding a cropping canvas-resize
+        """
+
+        for width, height in ((60, 40), (140, 300), (400, 400)):
+            plan = [step('rotate'), step('blur', blur_level=5), step('grayscale'), step('contour'),
+                    step('canvas_resize', width=width, height=height)]
+            optimized = EffectPipeline.optimize(plan)
+            self.assertEqual('crop', optimized[1].name)
+            self.assertEqual({'width': width + 5, 'height': height + 4}, optimized[1].args)
+            self.assert_same_result(plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Test Pixel Buffers
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+# pylint: disable=E0401
+from polybot.config import PixelBufferConfig
+from polybot.effect_pipeline import EffectPipeline, PlanStep
+from polybot.img_proc import Img
+from polybot.pixel_buffer import PixelBuffer
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+class TestPixelBuffer(unittest.TestCase):
+    """
+    Test Pixel Buffer Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup
+        """
+
+        self.settings = PixelBufferConfig.MIN_BYTES, PixelBufferConfig.DIR
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        PixelBufferConfig.MIN_BYTES = 10_000
+        PixelBufferConfig.DIR = self.scratch_dir.name
+
+    def tearDown(self):
+        """
+        Restore the settings
+        """
+
+        PixelBufferConfig.MIN_BYTES, PixelBufferConfig.DIR = self.settings
+        self.scratch_dir.cleanup()
+
+    def test_threshold(self):
+        """
+        Test that only matrices above the threshold are kept in scratch files,
+        and that the files are deleted from the directory as soon as they are mapped
+        """
+
+        small = PixelBuffer.empty((10, 10, 3))
+        large = PixelBuffer.empty((100, 100, 3))
+        self.assertFalse(PixelBuffer.in_file(small))
+        self.assertTrue(PixelBuffer.in_file(large))
+        self.assertTrue(PixelBuffer.in_file(large[10:20, ::-1]))
+        self.assertEqual([], os.listdir(self.scratch_dir.name))
+
+        # Derived matrices are not in the file, though numpy keeps their class
+        self.assertFalse(PixelBuffer.in_file(np.repeat(large, 2, axis=0)))
+
+        PixelBufferConfig.MIN_BYTES = 0
+        self.assertFalse(PixelBuffer.in_file(PixelBuffer.empty((100, 100, 3))))
+
+    def test_store(self):
+        """
+        Test that large matrices are moved into scratch files with the same values
+        """
+
+        pixels = np.arange(100 * 100 * 3, dtype=np.uint32).reshape((100, 100, 3))
+        stored = PixelBuffer.store(pixels)
+
+        self.assertTrue(PixelBuffer.in_file(stored))
+        self.assertEqual(pixels.dtype, stored.dtype)
+        self.assertTrue(np.array_equal(pixels, stored))
+        self.assertIs(stored, PixelBuffer.store(stored))
+
+    def test_effects(self):
+        """
+        Test that images and the results of effects are kept in scratch files,
+        with the same results as in memory
+        """
+
+        plan = [PlanStep('blur', {'blur_level': 4}), PlanStep('rotate', {'angle': 90}),
+                PlanStep('multiply', {}, True), PlanStep('grayscale', {})]
+
+        mapped = [Img(IMG_PATH), Img(IMG_PATH)]
+        self.assertTrue(PixelBuffer.in_file(mapped[0].data))
+        self.assertIsNotNone(EffectPipeline.strip_height_for(mapped[0]))
+        EffectPipeline.run(plan, mapped, EffectPipeline.strip_height_for(mapped[0]))
+        self.assertTrue(PixelBuffer.in_file(mapped[0].data))
+
+        PixelBufferConfig.MIN_BYTES = 0
+        expected = [Img(IMG_PATH), Img(IMG_PATH)]
+        self.assertFalse(PixelBuffer.in_file(expected[0].data))
+        EffectPipeline.run(plan, expected)
+
+        self.assertTrue(np.array_equal(expected[0].data, mapped[0].data))
+
+
+if __name__ == '__main__':
+    unittest.main()
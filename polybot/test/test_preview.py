@@ -0,0 +1,63 @@
+"""
+Test Previews
+"""
+
+import unittest
+# pylint: disable=E0401
+from polybot.effect_pipeline import EffectPipeline, PlanStep
+from polybot.img_proc import Img
+from polybot.job_runner import JobResult
+from polybot.preview import RunTimeEstimator
+# pylint: enable=E0401
+
+IMG_PATH = '../../.img/beatles.jpeg'
+
+
+class TestPreview(unittest.TestCase):
+    """
+    Test Preview Class
+    """
+
+    def test_downscale(self):
+        """
+        Test that the long side is shrunk to the maximum, keeping the aspect ratio
+        """
+
+        img = Img(IMG_PATH)
+        height, width = img.height, img.width
+        img.downscale(max(width, height) // 4)
+
+        self.assertEqual(max(img.width, img.height), max(width, height) // 4)
+        self.assertAlmostEqual(img.width / img.height, width / height, delta=0.05)
+
+        # Images that are already small enough are left as is
+        data = img.data
+        img.downscale(10000)
+        self.assertIs(data, img.data)
+
+    def test_estimate(self):
+        """
+        Test that the time is estimated by the rates of the effects per pixel
+        """
+
+        pipeline = EffectPipeline([])
+        pipeline.plan = [PlanStep('blur', {'blur_level': 8}), PlanStep('rotate', {'angle': 90})]
+
+        result = JobResult(b'', 'blur 8')
+        result.pixels = 1000
+        result.effect_times = {'blur': 1.0}
+        result.decode_times = [0.5]
+        result.encode_time = 0.5
+
+        estimator = RunTimeEstimator()
+        estimator.record(result)
+        # 'rotate' was not timed yet
+        self.assertIsNone(estimator.estimate(pipeline, 2000))
+
+        result.effect_times = {'blur': 1.0, 'rotate': 0.0}
+        estimator.record(result)
+        self.assertAlmostEqual(estimator.estimate(pipeline, 2000), 4.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
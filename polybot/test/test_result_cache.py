@@ -0,0 +1,94 @@
+"""
+Test Result Cache
+"""
+
+import shutil
+import tempfile
+import unittest
+# pylint: disable=E0401
+from polybot.effect_pipeline import EffectPipeline, PlanStep
+from polybot.result_cache import ResultCache
+# pylint: enable=E0401
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    Test Result Cache Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup. Create a temporary directory for the disk tier
+        """
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_memory_lru(self):
+        """
+        Test that the least recently used results are evicted from memory
+        """
+
+        cache = ResultCache(10)
+        cache.put('a', b'aaaa', '.jpg')
+        cache.put('b', b'bbbb', '.jpg')
+        # Use 'a', so 'b' is the least recently used
+        self.assertEqual(cache.get('a'), (b'aaaa', '.jpg'))
+        cache.put('c', b'cccc', '.jpg')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), (b'cccc', '.jpg'))
+        stats = cache.stats()
+        self.assertEqual(stats['memory_hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['memory_evictions'], 1)
+        self.assertEqual(stats['memory_size'], 8)
+
+    def test_disk_tier(self):
+        """
+        Test that results on disk are kept in size, and are found after a restart
+        """
+
+        cache = ResultCache(0, self.tmp_dir, 10)
+        cache.put('a', b'aaaa', '.jpg')
+        cache.put('b', b'bbbb', '.webp')
+        cache.put('c', b'cccc', '.jpg')
+        self.assertEqual(cache.stats()['disk_evictions'], 1)
+
+        restarted = ResultCache(100, self.tmp_dir, 10)
+        self.assertIsNone(restarted.get('a'))
+        self.assertEqual(restarted.get('b'), (b'bbbb', '.webp'))
+        # Found in memory after the first disk hit
+        self.assertEqual(restarted.get('b'), (b'bbbb', '.webp'))
+        stats = restarted.stats()
+        self.assertEqual(stats['disk_hits'], 1)
+        self.assertEqual(stats['memory_hits'], 1)
+        self.assertEqual(stats['disk_entries'], 2)
+
+    def test_key(self):
+        """
+        Test that keys depend on the photos, their order and the plan
+        """
+
+        key = ResultCache.key(['a', 'b'], 'rotate 90')
+        self.assertEqual(key, ResultCache.key(['a', 'b'], 'rotate 90'))
+        self.assertNotEqual(key, ResultCache.key(['b', 'a'], 'rotate 90'))
+        self.assertNotEqual(key, ResultCache.key(['a', 'b'], 'rotate 180'))
+
+    def test_random_plan(self):
+        """
+        Test that plans with noise effects are cached only with a seed
+        """
+
+        pipeline = EffectPipeline([])
+        pipeline.plan = [PlanStep('color_noise', {'strength': 0.2, 'seed': None})]
+        self.assertIsNone(pipeline.cache_key())
+
+        pipeline.plan[0].args['seed'] = 7
+        self.assertEqual(pipeline.cache_key(), 'color-noise 0.2 7')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ Test Rotate Function
 """
 
 import unittest
+import numpy as np
 # pylint: disable=E0401
 from polybot.img_proc import Img
 # pylint: enable=E0401
@@ -44,10 +45,21 @@ class TestImgRotate(unittest.TestCase):
         self.img.rotate()
         self.img.rotate()
 
-        rotated_image = [row[::-1] for row in self.img.data]
+        rotated_image = [row[::-1] for row in self.img.data.tolist()]
         expected_img = [row[::-1] for row in rotated_image]
 
-        self.assertEqual(expected_img, self.img.data)
+        self.assertEqual(expected_img, self.img.data.tolist())
+
+    def test_rotation_is_view(self):
+        """
+        Test that rotation does not copy the pixels
+        """
+
+        original_data = self.img.data
+        self.img.rotate(270)
+
+        self.assertTrue(np.shares_memory(original_data, self.img.data))
+        self.assertEqual(original_data[0].tolist(), self.img.data[::-1, 0].tolist())
 
 
 if __name__ == '__main__':
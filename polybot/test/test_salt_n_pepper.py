@@ -3,6 +3,7 @@ Test Salt n Pepper
 """
 
 import unittest
+import numpy as np
 # pylint: disable=E0401
 from polybot.img_proc import Img
 # pylint: enable=E0401
@@ -35,6 +36,46 @@ class TestImgSaltNPepper(unittest.TestCase):
         expected_dimension = (len(self.original_img.data), len(self.original_img.data[0]))
         self.assertEqual(expected_dimension, actual_dimension)
 
+    def test_seeded_result(self):
+        """
+        Test the exact result with a given seed
+        """
+
+        img = Img(IMG_PATH)
+        img.salt_n_pepper(0.3, (255, 0, 0), (0, 0, 255), seed=42)
+
+        # The same random values, drawn from a generator with the same seed
+        rand_val = np.random.default_rng(42).random(
+            self.original_img.data.shape[:2], dtype=np.float32
+        )
+        expected = self.original_img.data.copy()
+        expected[rand_val < 0.3] = (255, 0, 0)
+        expected[rand_val > 0.7] = (0, 0, 255)
+
+        self.assertTrue(np.array_equal(expected, img.data))
+
+        # The same seed gives the same result
+        other_img = Img(IMG_PATH)
+        other_img.salt_n_pepper(0.3, (255, 0, 0), (0, 0, 255), seed=42)
+        self.assertTrue(np.array_equal(img.data, other_img.data))
+
+    def test_color_noise_seeded_result(self):
+        """
+        Test the exact result of color noise with a given seed
+        """
+
+        img = Img(IMG_PATH)
+        img.color_noise(0.1, seed=7)
+
+        rand_val = np.random.default_rng(7).random(
+            self.original_img.data.shape, dtype=np.float32
+        )
+        expected = self.original_img.data.copy()
+        expected[rand_val < 0.1] = 255
+        expected[rand_val > 0.9] = 0
+
+        self.assertTrue(np.array_equal(expected, img.data))
+
 
 if __name__ == '__main__':
     unittest.main()
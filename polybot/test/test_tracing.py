@@ -0,0 +1,95 @@
+"""
+Test Tracing
+"""
+
+import json
+import unittest
+from unittest import mock
+from loguru import logger
+# pylint: disable=E0401
+from polybot import tracing
+from polybot.config import TracingConfig
+# pylint: enable=E0401
+
+
+class TestTracing(unittest.TestCase):
+    """
+    Test Tracing Class
+    """
+
+    def setUp(self):
+        """
+        Test Setup: collect the logged traces
+        """
+
+        self.lines = []
+        self.sink = logger.add(self.lines.append, format='{message}',
+                               filter=lambda record: 'trace' in record['extra'])
+
+    def tearDown(self):
+        """
+        Test Cleanup
+        """
+
+        logger.remove(self.sink)
+
+    def test_sampled(self):
+        """
+        Test that a sampled request is logged as a single JSON line with its spans
+        """
+
+        with mock.patch.object(TracingConfig, 'SAMPLE_RATE', 1.0):
+            with tracing.trace(chat_id=1) as current:
+                with tracing.span('download') as timed:
+                    pass
+                tracing.add_span('effect:blur', 0.25)
+                tracing.annotate(cache='miss')
+
+        self.assertIsNone(tracing.current_trace())
+        self.assertEqual(len(self.lines), 1)
+
+        record = json.loads(self.lines[0])
+        self.assertEqual(record['request_id'], current.request_id)
+        self.assertEqual(record['status'], 'ok')
+        self.assertEqual(record['chat_id'], 1)
+        self.assertEqual(record['cache'], 'miss')
+        self.assertEqual([span['name'] for span in record['spans']], ['download', 'effect:blur'])
+        self.assertIn('start_ms', record['spans'][0])
+        self.assertEqual(record['spans'][1], {'name': 'effect:blur', 'ms': 250.0})
+        self.assertGreaterEqual(timed.duration, 0)
+
+    def test_not_sampled(self):
+        """
+        Test that only slow or failed requests are logged when not sampled
+        """
+
+        with mock.patch.object(TracingConfig, 'SAMPLE_RATE', 0.0):
+            with tracing.trace():
+                pass
+
+            with mock.patch.object(TracingConfig, 'SLOW_SECONDS', 0.0):
+                with tracing.trace():
+                    pass
+
+            with self.assertRaises(ValueError):
+                with tracing.trace():
+                    raise ValueError()
+
+        self.assertEqual(len(self.lines), 2)
+        self.assertEqual(json.loads(self.lines[1])['status'], 'error')
+
+    def test_no_trace(self):
+        """
+        Test that spans are timed with no traced request
+        """
+
+        with tracing.span('upload') as timed:
+            tracing.add_span('decode', 1.0)
+
+        self.assertEqual(timed.name, 'upload')
+        self.assertGreaterEqual(timed.duration, 0)
+        self.assertEqual(self.lines, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
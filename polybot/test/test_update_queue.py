@@ -0,0 +1,100 @@
+"""
+Test Update Queue
+"""
+
+import threading
+import unittest
+# pylint: disable=E0401
+from polybot.update_queue import UpdateQueue
+# pylint: enable=E0401
+
+
+class TestUpdateQueue(unittest.TestCase):
+    """
+    Test Update Queue Class
+    """
+
+    def test_handle_messages(self):
+        """
+        Test that all queued messages are handled by the workers
+        """
+
+        handled = []
+        updates = UpdateQueue(lambda msg: handled.append(msg['message_id']), max_size=10, workers=3)
+        for message_id in range(10):
+            self.assertTrue(updates.put({'message_id': message_id}))
+        updates.join()
+
+        self.assertEqual(sorted(handled), list(range(10)))
+        stats = updates.stats()
+        self.assertEqual(stats['accepted'], 10)
+        self.assertEqual(stats['handled'], 10)
+        self.assertEqual(stats['depth'], 0)
+
+    def test_reject_when_full(self):
+        """
+        Test that messages are rejected when the queue is full,
+        and the workers keep running after an error in a message
+        """
+
+        started = threading.Event()
+        release = threading.Event()
+        rejected = []
+
+        def handle(msg):
+            started.set()
+            release.wait()
+            if msg['message_id'] == 1:
+                raise RuntimeError('Failed message')
+
+        updates = UpdateQueue(handle, lambda msg: rejected.append(msg['message_id']),
+                              max_size=2, workers=1)
+        # The first message is taken by the worker, the next two fill the queue
+        updates.put({'message_id': 0})
+        started.wait()
+        self.assertTrue(updates.put({'message_id': 1}))
+        self.assertTrue(updates.put({'message_id': 2}))
+        self.assertFalse(updates.put({'message_id': 3}))
+        self.assertEqual(updates.stats()['depth'], 2)
+
+        release.set()
+        updates.join()
+
+        self.assertEqual(rejected, [3])
+        stats = updates.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['handled'], 3)
+        self.assertGreater(stats['max_wait_time'], 0)
+
+    def test_reject_error(self):
+        """
+        Test that putting a message does not wait for the rejection of another,
+        and an error in the rejection does not reach the caller
+        """
+
+        release = threading.Event()
+        rejected = []
+
+        def reject(msg):
+            release.wait()
+            rejected.append(msg['message_id'])
+            raise RuntimeError('Too Many Requests')
+
+        updates = UpdateQueue(lambda msg: release.wait(), reject, max_size=1, workers=1)
+        # The first message is taken by the worker, the second fills the queue
+        updates.put({'message_id': 0})
+        while updates.stats()['depth']:
+            release.wait(0.01)
+        self.assertTrue(updates.put({'message_id': 1}))
+        self.assertFalse(updates.put({'message_id': 2}))
+        self.assertEqual(rejected, [])
+
+        release.set()
+        updates.join()
+
+        self.assertEqual(rejected, [2])
+        self.assertEqual(updates.stats()['rejected'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+"""
+Tracing of the stages of handling each request.
+The spans of a request are recorded under one request ID,
+and are logged together as a single JSON line when the request is done.
+Only a sample of the requests is logged, and slow or failed requests are always logged,
+so the tail latency can be investigated without logging every request.
+"""
+
+import sys
+import json
+import time
+import uuid
+import random
+import contextvars
+from contextlib import contextmanager
+from loguru import logger
+# pylint: disable=E0401
+from polybot.config import LogConfig, TracingConfig
+# pylint: enable=E0401
+
+
+# The trace of the request that is handled in the current thread
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+# pylint: disable=R0903
+class Span:
+    """
+    A timed stage of a request
+    """
+
+    def __init__(self, name: str, start: float = None, duration: float = 0.0):
+        """
+        :param name: Required. The name of the stage, e.g. 'download'.
+        :param start: Optional. Seconds from the start of the request to the start of the stage.
+               Default is None, for stages that were timed elsewhere (e.g. in a worker process).
+        :param duration: Optional. The duration of the stage in seconds. Default is 0.
+        """
+
+        self.name = name
+        self.start = start
+        self.duration = duration
+
+    def to_dict(self):
+        """
+        :return: The span as a dict, with the times in milliseconds
+        """
+
+        span = {'name': self.name, 'ms': round(self.duration * 1000, 3)}
+        if self.start is not None:
+            span['start_ms'] = round(self.start * 1000, 3)
+        return span
+# pylint: enable=R0903
+
+
+class Trace:
+    """
+    The spans of a single request, and attributes that describe it (e.g. the chat ID).
+    Spans are always recorded, as it only costs a timer and an append.
+    Rendering and logging happen once, when the trace is finished.
+    """
+
+    def __init__(self, sampled: bool, **attributes):
+        """
+        :param sampled: Required. Whether to log the trace even if it is fast and successful.
+        :param attributes: Attributes of the request.
+        """
+
+        self.request_id = uuid.uuid4().hex[:16]
+        self.sampled = sampled
+        self.attributes = attributes
+        self.spans = []
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = 'ok'
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Time a stage of the request
+
+        :param name: Required. The name of the stage.
+        :return: Context manager of the Span, whose duration is set when the stage is done
+        """
+
+        start = time.perf_counter()
+        timed = Span(name, start - self.started)
+        try:
+            yield timed
+        finally:
+            timed.duration = time.perf_counter() - start
+            self.spans.append(timed)
+
+    def add(self, name: str, duration: float):
+        """
+        Add a stage that was timed elsewhere, e.g. an effect that ran in a worker process
+
+        :param name: Required. The name of the stage.
+        :param duration: Required. The duration of the stage in seconds.
+        """
+
+        self.spans.append(Span(name, duration=duration))
+
+    def annotate(self, **attributes):
+        """
+        Add attributes to the request
+        """
+
+        self.attributes.update(attributes)
+
+    def finish(self, status: str = 'ok'):
+        """
+        Stop the trace, and log it if it is sampled, slow or failed
+
+        :param status: Optional. 'ok', or 'error' if handling the request failed. Default is 'ok'.
+        :return: True if the trace was logged, or False if not
+        """
+
+        self.duration = time.perf_counter() - self.started
+        self.status = status
+
+        if not (self.sampled or status != 'ok' or self.duration >= TracingConfig.SLOW_SECONDS):
+            return False
+
+        logger.bind(trace=True).info(json.dumps(self.to_dict(), default=str))
+        return True
+
+    def to_dict(self):
+        """
+        :return: The trace as a dict, with the times in milliseconds
+        """
+
+        return {
+            'request_id': self.request_id,
+            'status': self.status,
+            'ms': round((self.duration or 0.0) * 1000, 3),
+            **self.attributes,
+            'spans': [span.to_dict() for span in self.spans],
+        }
+
+
+@contextmanager
+def trace(**attributes):
+    """
+    Trace a request that is handled in the current thread.
+    Whether it is sampled is decided by TracingConfig.SAMPLE_RATE.
+
+    :param attributes: Attributes of the request, e.g. the chat ID.
+    :return: Context manager of the Trace
+    """
+
+    current = Trace(random.random() < TracingConfig.SAMPLE_RATE, **attributes)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    except BaseException:
+        current.finish('error')
+        raise
+    else:
+        current.finish()
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    """
+    :return: The Trace of the request that is handled in the current thread, or None
+    """
+
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time a stage of the request that is handled in the current thread.
+    The stage is timed even with no traced request, so the duration can be used elsewhere.
+
+    :param name: Required. The name of the stage.
+    :return: Context manager of the Span, whose duration is set when the stage is done
+    """
+
+    current = _current_trace.get()
+    if current is not None:
+        with current.span(name) as timed:
+            yield timed
+        return
+
+    start = time.perf_counter()
+    timed = Span(name)
+    try:
+        yield timed
+    finally:
+        timed.duration = time.perf_counter() - start
+
+
+def add_span(name: str, duration: float):
+    """
+    Add a stage that was timed elsewhere to the request that is handled in the current thread
+
+    :param name: Required. The name of the stage.
+    :param duration: Required. The duration of the stage in seconds.
+    """
+
+    current = _current_trace.get()
+    if current is not None:
+        current.add(name, duration)
+
+
+def annotate(**attributes):
+    """
+    Add attributes to the request that is handled in the current thread
+    """
+
+    current = _current_trace.get()
+    if current is not None:
+        current.annotate(**attributes)
+
+
+def configure_logging():
+    """
+    Replace the default log sink with queued sinks, so logging never blocks
+    the threads that handle the requests. The messages are written by a background thread.
+    The traces are written with the rest of the log, or into TracingConfig.FILE if set.
+    """
+
+    logger.remove()
+
+    if TracingConfig.FILE:
+        logger.add(sys.stderr, level=LogConfig.LEVEL, enqueue=True,
+                   filter=lambda record: 'trace' not in record['extra'])
+        logger.add(TracingConfig.FILE, format='{message}', enqueue=True,
+                   filter=lambda record: 'trace' in record['extra'])
+    else:
+        logger.add(sys.stderr, level=LogConfig.LEVEL, enqueue=True)
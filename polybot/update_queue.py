@@ -0,0 +1,151 @@
+"""
+Bounded queue of incoming updates, drained by worker threads,
+so the webhook can acknowledge each update as soon as it arrives
+"""
+
+import time
+import queue
+import threading
+from loguru import logger
+# pylint: disable=E0401
+from polybot.metrics import Metrics
+# pylint: enable=E0401
+
+
+class UpdateQueue:
+    """
+    Queues the incoming messages, and handles them in worker threads.
+    When the queue is full, new messages are rejected instead of queued.
+    The rejected messages are passed to 'reject_func' in a thread of their own,
+    so putting a message never waits for the reply to it.
+    """
+
+    def __init__(self, handle_func, reject_func = None, max_size: int = 100, workers: int = 8):
+        """
+        :param handle_func: Required. Function that handles a message.
+        :param reject_func: Optional. Function that is called with a message
+               that was rejected because the queue is full. Default is None (drop it).
+               Rejected messages that arrive while 'max_size' others wait for it are dropped.
+        :param max_size: Optional. The maximum amount of queued messages. Default is 100.
+        :param workers: Optional. The amount of worker threads. Default is 8.
+        """
+
+        self.handle_func = handle_func
+        self.reject_func = reject_func
+        self.max_size = max(max_size, 1)
+        self.queue = queue.Queue(self.max_size)
+        self.lock = threading.Lock()
+
+        # Counters of the messages
+        self.accepted = 0
+        self.rejected = 0
+        self.handled = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+        self.workers = [
+            threading.Thread(target=self.__work, name=f'update-worker-{i}', daemon=True)
+            for i in range(max(workers, 1))
+        ]
+        for worker in self.workers:
+            worker.start()
+
+        # The rejected messages that wait for 'reject_func'
+        self.rejects = queue.Queue(self.max_size)
+        if self.reject_func:
+            threading.Thread(target=self.__reject, name='update-rejecter', daemon=True).start()
+
+    def put(self, msg):
+        """
+        Queue a message to be handled, or reject it if the queue is full
+
+        :param msg: Required. The incoming message.
+        :return: True if the message was queued, or False if it was rejected
+        """
+
+        try:
+            self.queue.put_nowait((time.time(), msg))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            Metrics.UPDATES.inc(result='rejected')
+            logger.warning(f'Update queue is full ({self.max_size}), '
+                           f'rejecting message {msg.get("message_id")}')
+            if self.reject_func:
+                try:
+                    self.rejects.put_nowait(msg)
+                except queue.Full:
+                    logger.warning(f'Reject queue is full, '
+                                   f'dropping message {msg.get("message_id")}')
+            return False
+
+        with self.lock:
+            self.accepted += 1
+        Metrics.UPDATES.inc(result='accepted')
+        return True
+
+    def stats(self):
+        """
+        :return: A dict of the queue depth, the counters and the wait times of the messages
+        """
+
+        with self.lock:
+            return {
+                'depth': self.queue.qsize(),
+                'max_size': self.max_size,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'handled': self.handled,
+                'avg_wait_time': self.total_wait_time / (self.handled or 1),
+                'max_wait_time': self.max_wait_time,
+            }
+
+    def join(self):
+        """
+        Wait until all queued messages are handled, and all rejected messages are passed on
+        """
+
+        self.queue.join()
+        self.rejects.join()
+
+    def __work(self):
+        """
+        Worker thread loop: handle the queued messages one by one
+        """
+
+        while True:
+            queued_at, msg = self.queue.get()
+            wait_time = time.time() - queued_at
+            with self.lock:
+                self.handled += 1
+                self.total_wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+            Metrics.STAGE_SECONDS.observe(wait_time, stage='queue')
+
+            try:
+                self.handle_func(msg)
+            # An error in one message should not stop the worker
+            # pylint: disable=W0718
+            except Exception:
+                logger.exception(f'Failed to handle message {msg.get("message_id")} '
+                                 f'(waited {wait_time:.3f}s in the queue)')
+            # pylint: enable=W0718
+            finally:
+                self.queue.task_done()
+
+    def __reject(self):
+        """
+        Rejecter thread loop: pass the rejected messages to 'reject_func' one by one
+        """
+
+        while True:
+            msg = self.rejects.get()
+            try:
+                self.reject_func(msg)
+            # The reply may fail under the same load that filled the queue (e.g. rate limits)
+            # pylint: disable=W0718
+            except Exception:
+                logger.exception(f'Failed to reject message {msg.get("message_id")}')
+            # pylint: enable=W0718
+            finally:
+                self.rejects.task_done()